@@ -0,0 +1,295 @@
+import os
+import math
+import heapq
+import itertools
+import threading
+import time
+import contextvars
+from collections import OrderedDict
+from typing import Dict, Optional
+from metrics import log_event, ADMISSIONS, ADMISSION_WAIT_SECONDS
+
+# --- Admission control ---
+# Every request that may reach an LLM (a chat turn, a case start, an analyze miss) is
+# admitted here first. Token buckets stop one script from draining the shared Groq
+# quota: turns and analyze calls are metered per doctor and per session, case starts
+# per doctor in a bucket of their own. They are sized well above what a person typing
+# can reach, so they only bite on scripted traffic. A concurrency cap with a bounded priority queue
+# in front of it lets chat turns overtake the sidebar's /api/analyze when a whole
+# class hits the API at once. Requests that cannot be served before their deadline are
+# refused up front with a Retry-After instead of timing out into a 500 later.
+# The admitted request's deadline is published in request_deadline_var; ainvoke_tiered
+# never runs a model call past it.
+
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "0"))  # 0 = 4 per Groq key
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "32"))
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "9"))  # seconds, queueing included
+ANALYZE_DEADLINE = float(os.getenv("ANALYZE_DEADLINE", "4"))  # a late differential is no use to the sidebar
+DOCTOR_RATE_PER_MIN = float(os.getenv("DOCTOR_RATE_PER_MIN", "60"))
+DOCTOR_BURST = float(os.getenv("DOCTOR_BURST", "20"))
+SESSION_RATE_PER_MIN = float(os.getenv("SESSION_RATE_PER_MIN", "40"))
+SESSION_BURST = float(os.getenv("SESSION_BURST", "12"))
+START_RATE_PER_MIN = float(os.getenv("START_RATE_PER_MIN", "10"))
+START_BURST = float(os.getenv("START_BURST", "5"))
+
+# Lower runs first
+PRIORITIES = {"chat": 0, "start": 1, "analyze": 2}
+DEADLINES = {"chat": REQUEST_DEADLINE, "start": REQUEST_DEADLINE, "analyze": ANALYZE_DEADLINE}
+MIN_BUDGET = 0.5  # a queued request with less time left than this is refused, not admitted
+
+request_deadline_var = contextvars.ContextVar("request_deadline", default=None)
+
+
+class Overloaded(Exception):
+    """Request refused before any work was done; retry after `retry_after` seconds.
+
+    reason is "doctor_rate", "session_rate" or "start_rate" (HTTP 429) or "queue_full",
+    "deadline" or "shed" (HTTP 503).
+    """
+
+    RATE_LIMITED = ("doctor_rate", "session_rate", "start_rate")
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"request refused ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status(self) -> int:
+        return 429 if self.reason in self.RATE_LIMITED else 503
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; take() returns 0 or the seconds until one is free."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class _Waiter:
+    __slots__ = ("kind", "deadline", "taken", "state", "event")
+
+    def __init__(self, kind: str, deadline: float, taken: list):
+        self.kind = kind
+        self.deadline = deadline
+        self.taken = taken  # buckets it drew from; refunded unless it is admitted
+        self.state = "waiting"  # -> admitted | shed | expired | cancelled, always under the lock
+        self.event = threading.Event()
+
+    def drop(self, state: str):
+        """Leave the queue without a slot: the request did no work, so its bucket tokens go back."""
+        self.state = state
+        for bucket in self.taken:
+            bucket.refund()
+        self.event.set()
+
+
+class Ticket:
+    """An admitted request. Use as a context manager (or call release()) to free the slot.
+
+    Inside the block request_deadline_var holds the deadline, so LLM calls made on
+    this thread (and coroutines run through run_async) stop at it.
+    """
+
+    def __init__(self, controller: "AdmissionController", kind: str, deadline: float, admitted_at: float):
+        self.controller = controller
+        self.kind = kind
+        self.deadline = deadline
+        self.admitted_at = admitted_at
+        self._token = None
+        self._released = False
+
+    def __enter__(self):
+        self._token = request_deadline_var.set(self.deadline)
+        return self
+
+    def __exit__(self, *exc):
+        request_deadline_var.reset(self._token)
+        self.release()
+        return False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Token buckets per doctor, per session and for starts in front of a prioritized concurrency cap.
+
+    A rate of 0 disables that bucket.
+    """
+
+    MAX_BUCKETS = 10000
+    SERVICE_ALPHA = 0.2  # EWMA weight of the latest service time
+
+    def __init__(self, max_in_flight: int, max_queue: int = ADMISSION_QUEUE,
+                 doctor_rate: float = DOCTOR_RATE_PER_MIN / 60, doctor_burst: float = DOCTOR_BURST,
+                 session_rate: float = SESSION_RATE_PER_MIN / 60, session_burst: float = SESSION_BURST,
+                 start_rate: float = START_RATE_PER_MIN / 60, start_burst: float = START_BURST,
+                 deadlines: Optional[Dict[str, float]] = None, clock=time.monotonic):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.doctor_rate, self.doctor_burst = doctor_rate, doctor_burst
+        self.session_rate, self.session_burst = session_rate, session_burst
+        self.start_rate, self.start_burst = start_rate, start_burst
+        self.deadlines = dict(DEADLINES, **(deadlines or {}))
+        self.clock = clock
+        self._buckets = OrderedDict()  # ("doctor" | "session" | "start", id) -> TokenBucket, LRU
+        self._queue = []  # (priority, seq, waiter); cancelled waiters are skipped lazily
+        self._queued = 0
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._service_s = 1.0
+        self._lock = threading.Lock()
+
+    def _bucket_locked(self, scope: str, ident: str, rate: float, burst: float, now: float) -> TokenBucket:
+        bucket = self._buckets.get((scope, ident))
+        if bucket is None:
+            bucket = self._buckets[(scope, ident)] = TokenBucket(rate, burst, now)
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end((scope, ident))
+        return bucket
+
+    def _projected_wait_locked(self, ahead: int) -> float:
+        """Seconds until a request with `ahead` queued requests in front of it gets a slot."""
+        return (ahead + 1) * self._service_s / self.max_in_flight
+
+    def _limits(self, kind: str, doctor: str, session_id: str) -> tuple:
+        """(scope, id, rate, burst) of the buckets a request of `kind` draws from."""
+        if kind == "start":
+            return (("start", doctor, self.start_rate, self.start_burst),)
+        return (("session", session_id, self.session_rate, self.session_burst),
+                ("doctor", doctor, self.doctor_rate, self.doctor_burst))
+
+    def _refuse(self, kind: str, reason: str, retry_after: float):
+        ADMISSIONS.inc(kind=kind, outcome=reason)
+        log_event("admission_refused", kind=kind, reason=reason, retry_after=round(retry_after, 2))
+        raise Overloaded(reason, retry_after)
+
+    def admit(self, kind: str, doctor: str = "", session_id: str = "", deadline: Optional[float] = None) -> Ticket:
+        """Block until a slot is free and return its Ticket, or raise Overloaded.
+
+        deadline is a clock() instant (default: now + the kind's entry in DEADLINES).
+        """
+        priority = PRIORITIES[kind]
+        now = self.clock()
+        deadline = deadline if deadline is not None else now + self.deadlines[kind]
+        with self._lock:
+            taken = []
+            for scope, ident, rate, burst in self._limits(kind, doctor, session_id):
+                if not ident or not rate:
+                    continue
+                bucket = self._bucket_locked(scope, ident, rate, burst, now)
+                wait = bucket.take(now)
+                if wait > 0:
+                    for b in taken:
+                        b.refund()
+                    self._refuse(kind, f"{scope}_rate", wait)
+                taken.append(bucket)
+
+            ahead = sum(1 for p, _, w in self._queue if p <= priority and w.state == "waiting")
+            if self._in_flight < self.max_in_flight and not ahead:
+                self._in_flight += 1
+                ADMISSIONS.inc(kind=kind, outcome="admitted")
+                ADMISSION_WAIT_SECONDS.observe(0.0, kind=kind)
+                return Ticket(self, kind, deadline, now)
+
+            projected = self._projected_wait_locked(ahead)
+            if now + projected + MIN_BUDGET > deadline:
+                for b in taken:
+                    b.refund()
+                self._refuse(kind, "deadline", projected)
+            if self._queued >= self.max_queue and not self._shed_worst_locked(priority):
+                for b in taken:
+                    b.refund()
+                self._refuse(kind, "queue_full", self._projected_wait_locked(self._queued))
+            waiter = _Waiter(kind, deadline, taken)
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._queued += 1
+
+        waiter.event.wait(max(0.0, deadline - MIN_BUDGET - self.clock()))
+        with self._lock:
+            if waiter.state == "waiting":
+                waiter.drop("cancelled")
+                self._queued -= 1
+        if waiter.state == "admitted":
+            waited = self.clock() - now
+            ADMISSIONS.inc(kind=kind, outcome="queued")
+            ADMISSION_WAIT_SECONDS.observe(waited, kind=kind)
+            return Ticket(self, kind, deadline, self.clock())
+        if waiter.state == "shed":
+            self._refuse(kind, "shed", self._service_s)
+        self._refuse(kind, "deadline", self._service_s)
+
+    def _shed_worst_locked(self, priority: int) -> bool:
+        """Drop the lowest-priority, most recent waiter if it ranks below `priority`."""
+        live = [(p, seq, w) for p, seq, w in self._queue if w.state == "waiting"]
+        if not live:
+            return False
+        worst = max(live, key=lambda item: (item[0], item[1]))
+        if worst[0] <= priority:
+            return False
+        worst[2].drop("shed")
+        self._queued -= 1
+        self._queue = live
+        self._queue.remove(worst)
+        heapq.heapify(self._queue)
+        return True
+
+    def _release(self, ticket: Ticket):
+        with self._lock:
+            served = self.clock() - ticket.admitted_at
+            self._service_s += self.SERVICE_ALPHA * (served - self._service_s)
+            now = self.clock()
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.state == "waiting" and waiter.deadline - now < MIN_BUDGET:
+                    # Too late to be useful; refuse it now rather than time out later
+                    waiter.drop("expired")
+                    self._queued -= 1
+                elif waiter.state == "waiting":
+                    # Hand the slot over; in_flight is unchanged
+                    waiter.state = "admitted"
+                    self._queued -= 1
+                    waiter.event.set()
+                    return
+            self._in_flight -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queued": self._queued,
+                "max_queue": self.max_queue,
+                "avg_service_s": round(self._service_s, 3),
+                "buckets": len(self._buckets),
+                "outcomes": {kind: {outcome: int(ADMISSIONS.total(kind=kind, outcome=outcome))
+                                    for outcome in ("admitted", "queued", "doctor_rate", "session_rate",
+                                                    "start_rate", "queue_full", "deadline", "shed")}
+                             for kind in PRIORITIES},
+            }
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After takes whole seconds."""
+    return str(max(1, math.ceil(seconds)))
@@ -1,14 +1,38 @@
 import os
 import json
-from typing import TypedDict, List, Dict, Any, Optional
-from langgraph.graph import StateGraph, END
-from langchain_groq import ChatGroq
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+import re
+import asyncio
+import copy
+import random
+import time
+import logging
+import threading
+import contextvars
+import itertools
+import zlib
+import queue
+from collections import Counter, OrderedDict, deque
+from typing import TypedDict, List, Dict, Any, Callable, Optional
 from dotenv import load_dotenv
 
-# Load environment variables (ensure this is called in app.py or here)
+# Load environment variables (the only load_dotenv call; app.py imports this module first)
 load_dotenv()
 
+# langgraph, langchain_core and langchain_groq take about a second to import, which a
+# serverless cold start would pay before /api/health could answer. They are imported
+# inside the functions that build prompts, call a model or compile the turn graph.
+
+from context_window import default_window, estimate_tokens
+from symptom_index import get_symptom_index
+from response_cache import ResponseCache
+from envelope import parse_envelope, is_turn_envelope, is_analysis
+from metrics import log_event, stage, LLM_SECONDS, LLM_TOKENS, FALLBACKS, PARSE_REPAIRS, MODEL_TIER_CALLS, TURN_PATHS, HEDGES
+from circuit_breaker import CircuitBreaker
+from case_library import CaseLibrary, RecentCases
+from admission import request_deadline_var
+from scoring import diagnosis_key
+import local_patient
+
 # --- Types ---
 class PatientCase(TypedDict):
     name: str
@@ -23,6 +47,7 @@ class PatientCase(TypedDict):
     correct_treatments: List[str]
     incorrect_treatments: List[str]
 
+# The fields a turn reads; live sessions are session_model.Session, which serves them by key
 class PatientState(TypedDict):
     session_id: str
     patient_case: PatientCase
@@ -56,10 +81,11 @@ Example output:
 { "name": "John Doe", "disease":"Pneumonia", ... }
 """
 
-def get_master_system_prompt(patient_case: PatientCase) -> str:
-    return f"""
-SYSTEM: You are a single virtual patient agent named "{patient_case.get('name', 'Unknown')}".
-Your hidden patient_case (JSON) contains: {json.dumps(patient_case)}.
+# The system prompt is split so every session shares a byte-identical prefix (the rules)
+# and only the trailing case block differs. Providers that cache prompt prefixes can then
+# reuse the rules across all sessions, and the whole system prompt across a session's turns.
+PATIENT_RULES_PROMPT = """
+SYSTEM: You are a single virtual patient agent. Your hidden patient_case (JSON) is given in the PATIENT CASE block at the end of these instructions.
 
 Your goals (in order):
 1) Behave consistently with the patient_case. Never invent a different disease.
@@ -80,10 +106,10 @@ Your goals (in order):
 
 Operational rules:
 - **CRITICAL**: If asked "tell me everything" or "what are your symptoms", provide only 1 or 2 details. Make the doctor work to uncover the full history.
-- **IDENTITY**: If asked for your name, age, or background, provide the info from your patient_case (Name: {patient_case.get('name')}, Age: {patient_case.get('age_range')}, Sex: {patient_case.get('sex')}). Be consistent.
+- **IDENTITY**: If asked for your name, age, or background, provide the info from your patient_case (name, age_range, sex). Be consistent.
 - If doctor asks for vitals or numeric measurements you cannot provide, say "I haven't measured that" unless the patient_case specifies it.
 - Use empathy: "I'm worried" or "It hurts sometimes" where appropriate.
-- On each reply, provide a machine readable metadata object (do not show this to front-end users) with keys: {{ "revealed": [...], "needs_escalation": boolean, "status": "active/resolved" }}.
+- On each reply, provide a machine readable metadata object (do not show this to front-end users) with keys: { "revealed": [...], "treatment_given": [...], "needs_escalation": boolean, "status": "active/resolved" }.
 - Never provide prescriptions as “do this” — only accept/reject the doctor's proposed treatment.
 - Maintain memory across the session (until /end).
 - Respect user privacy and safety; do not store or expose any personal identifying information (PII) of real users, but YOU are a simulated persona so you can share your simulated name.
@@ -92,18 +118,29 @@ Operational rules:
 **OUTPUT FORMAT - STRICT JSON ONLY**:
 You represent a backend system. You MUST return your response as a valid JSON object.
 Example:
-{{
+{
   "reply_text": "Doctor, my stomach really hurts.",
-  "metadata": {{ "revealed": ["stomach pain"], "needs_escalation": false, "status": "active" }}
-}}
+  "metadata": { "revealed": ["stomach pain"], "treatment_given": [], "needs_escalation": false, "status": "active" }
+}
 
 Rules:
 1. "reply_text" contains your spoken response to the doctor.
-2. "metadata" tracks the game state. "revealed" is a list of NEWLY revealed symptoms in this turn.
+2. "metadata" tracks the game state. "revealed" is a list of NEWLY revealed symptoms in this turn. "treatment_given" lists treatments the doctor proposed in this turn (empty if none).
 3. Do NOT output any markdown, backticks, or text outside this JSON.
 4. If you fail to output JSON, the system will crash.
 """
 
+def render_case_block(patient_case: PatientCase) -> str:
+    """Per-session part of the system prompt; keys are sorted so the bytes never drift."""
+    return (
+        "PATIENT CASE (hidden from the doctor):\n"
+        f"You are \"{patient_case.get('name', 'Unknown')}\" (Age: {patient_case.get('age_range')}, Sex: {patient_case.get('sex')}).\n"
+        f"patient_case: {json.dumps(patient_case, sort_keys=True, separators=(',', ':'))}\n"
+    )
+
+def get_master_system_prompt(patient_case: PatientCase) -> str:
+    return PATIENT_RULES_PROMPT + "\n" + render_case_block(patient_case)
+
 # --- Logic ---
 
 # API Key Fallback System
@@ -114,242 +151,1672 @@ for key_name in ["GROQ_API_KEY", "GROQ_API_KEY_2", "GROQ_API_KEY_3"]:
     if key:
         API_KEYS.append(key)
 
-current_key_index = 0
+# --- API Key Scheduler ---
+# Picks the least-loaded healthy key for every call. Budgets are tracked locally over a
+# sliding minute and corrected from Groq's x-ratelimit-* / retry-after headers when a
+# response or 429 error carries them.
+
+KEY_RPM_LIMIT = int(os.getenv("GROQ_KEY_RPM", "30"))
+KEY_TPM_LIMIT = int(os.getenv("GROQ_KEY_TPM", "12000"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_MAX_WAIT = float(os.getenv("LLM_MAX_WAIT", "5"))  # longest we sleep for a key to cool down
+# Ask Groq for response_format=json_object on calls that expect a JSON envelope
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "1") != "0"
+KEY_FAILURE_COOLDOWN = 30.0  # seconds a key sits out after repeated non-429 errors
+KEY_MAX_FAILURES = 3
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_TRY_AGAIN = re.compile(r"try again in ((?:\d+(?:\.\d+)?(?:ms|h|m|s))+)", re.IGNORECASE)
+
+def parse_duration(value: Any) -> Optional[float]:
+    """Parse Groq durations ("7.66s", "2m59.56s", "450ms") or plain seconds into seconds."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(text)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(n) * scale[unit] for n, unit in parts)
+
+def _error_headers(e: Exception) -> Dict:
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    return dict(headers) if headers else {}
+
+def retry_after_hint(e: Exception) -> Optional[float]:
+    """Seconds until a rate-limited key is usable again, from headers or the error text."""
+    headers = {k.lower(): v for k, v in _error_headers(e).items()}
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        seconds = parse_duration(headers.get(name))
+        if seconds is not None:
+            return seconds
+    match = _TRY_AGAIN.search(str(e))
+    return parse_duration(match.group(1)) if match else None
+
+def backoff_delay(attempt: int, base: float = 0.25, cap: float = 4.0) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class KeyState:
+    """Live budget and health of one API key."""
+
+    def __init__(self, index: int, api_key: str):
+        self.index = index
+        self.api_key = api_key
+        self.in_flight = 0
+        self.window = deque()  # Reservations made in the last 60s, in order
+        self.window_tokens = 0
+        self.remaining_requests = None  # last values reported by Groq headers
+        self.remaining_tokens = None
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.tokens = 0
+
+    @property
+    def label(self) -> str:
+        return f"key_{self.index}"
+
+class Reservation:
+    """One call's entry in a key's minute window, as handed out by KeyScheduler.acquire.
+
+    Settle it exactly once: release(), report_rate_limit(), report_error() or cancel().
+    """
+
+    __slots__ = ("key", "ts", "tokens", "in_window")
+
+    def __init__(self, key: KeyState, ts: float, tokens: int):
+        self.key = key
+        self.ts = ts
+        self.tokens = tokens
+        self.in_window = True  # False once trimmed or cancelled
+
+    @property
+    def label(self) -> str:
+        return self.key.label
+
+    @property
+    def api_key(self) -> str:
+        return self.key.api_key
+
+class KeyScheduler:
+    """Thread-safe least-loaded selection over API_KEYS, within each key's minute budget."""
+
+    def __init__(self, keys: List[str], rpm: int = KEY_RPM_LIMIT, tpm: int = KEY_TPM_LIMIT, clock=time.monotonic):
+        self.keys = [KeyState(i, k) for i, k in enumerate(keys)]
+        self.rpm = rpm
+        self.tpm = tpm
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def _trim(self, key: KeyState, now: float):
+        # Entries reserved for a later start sit behind earlier ones; they are trimmed late, never early
+        while key.window and key.window[0].ts <= now - 60:
+            entry = key.window.popleft()
+            entry.in_window = False
+            key.window_tokens -= entry.tokens
+
+    def _load(self, key: KeyState) -> float:
+        """0 = idle, 1 = minute budget used up (whichever of requests/tokens is tighter)."""
+        used_requests = len(key.window) / self.rpm  # in-flight calls are in the window already
+        used_tokens = key.window_tokens / self.tpm
+        if key.remaining_requests is not None:
+            used_requests = max(used_requests, 1 - key.remaining_requests / self.rpm)
+        if key.remaining_tokens is not None:
+            used_tokens = max(used_tokens, 1 - key.remaining_tokens / self.tpm)
+        return max(used_requests, used_tokens)
+
+    def _budget_wait(self, key: KeyState, tokens: int, now: float) -> float:
+        """Seconds until the window has room for one more call of `tokens`; 0 = room now."""
+        wait = 0.0
+        over_requests = len(key.window) + 1 - self.rpm
+        if over_requests > 0:
+            wait = key.window[over_requests - 1].ts + 60 - now
+        over_tokens = key.window_tokens + tokens - self.tpm
+        if over_tokens > 0 and key.window:
+            # A single call larger than the whole budget still runs, once the window is empty
+            freed = 0
+            for entry in key.window:
+                freed += entry.tokens
+                if freed >= over_tokens:
+                    break
+            wait = max(wait, entry.ts + 60 - now)
+        return max(0.0, wait)
 
-def get_groq_llm(temperature=0.4, model_name="llama-3.3-70b-versatile"):
-    global current_key_index
+    def acquire(self, tokens: int = 0, exclude=()) -> tuple:
+        """Reserve the best key. Returns (Reservation, wait_seconds).
+
+        Keys cooling down or with no room left in their minute budget are skipped;
+        wait > 0 means none had room and the call must not start for `wait` seconds.
+        Keys in `exclude` (e.g. the one a hedged sibling call is using) are only picked
+        when no other key is available.
+        """
+        if not self.keys:
+            raise ValueError("No GROQ_API_KEY set. Please set at least GROQ_API_KEY in environment.")
+        with self._lock:
+            now = self.clock()
+            for key in self.keys:
+                self._trim(key, now)
+            waits = {k: max(k.cooldown_until - now, self._budget_wait(k, tokens, now)) for k in self.keys}
+            available = [k for k in self.keys if waits[k] <= 0]
+            available = [k for k in available if k not in exclude] or available
+            if available:
+                key = min(available, key=lambda k: (self._load(k), k.in_flight, random.random()))
+                wait = 0.0
+            else:
+                key = min(self.keys, key=lambda k: waits[k])
+                wait = waits[key]
+            key.in_flight += 1
+            key.requests += 1
+            reservation = Reservation(key, now + wait, tokens)
+            key.window.append(reservation)
+            key.window_tokens += tokens
+            return reservation, wait
+
+    def spare_key(self, exclude=()) -> bool:
+        """Whether a healthy key outside `exclude` is available."""
+        with self._lock:
+            now = self.clock()
+            return any(k.cooldown_until <= now and k not in exclude for k in self.keys)
+
+    def best_key(self) -> KeyState:
+        """Least-loaded key without reserving it."""
+        with self._lock:
+            return min(self.keys, key=lambda k: (k.cooldown_until > self.clock(), self._load(k)))
+
+    def _settle(self, reservation: Reservation, tokens: int):
+        """Replace the reservation's token estimate with `tokens` in its key's window."""
+        if reservation.in_window:
+            reservation.key.window_tokens += tokens - reservation.tokens
+        reservation.tokens = tokens
+
+    def cancel(self, reservation: Reservation):
+        """Give back a reservation that was never used: its request and tokens leave the window."""
+        with self._lock:
+            key = reservation.key
+            key.in_flight -= 1
+            key.requests -= 1
+            if reservation.in_window:
+                for i, entry in enumerate(key.window):
+                    if entry is reservation:
+                        del key.window[i]
+                        break
+                key.window_tokens -= reservation.tokens
+                reservation.in_window = False
+
+    def release(self, reservation: Reservation, tokens: int = 0, headers: Optional[Dict] = None):
+        """Successful call: settle the token estimate and absorb any rate-limit headers."""
+        with self._lock:
+            key = reservation.key
+            key.in_flight -= 1
+            key.successes += 1
+            key.consecutive_failures = 0
+            key.tokens += tokens
+            if tokens:
+                self._settle(reservation, tokens)
+            self._absorb_headers(key, headers or {})
+
+    def report_rate_limit(self, reservation: Reservation, retry_after: Optional[float] = None,
+                          headers: Optional[Dict] = None):
+        with self._lock:
+            key = reservation.key
+            key.in_flight -= 1
+            key.rate_limited += 1
+            self._absorb_headers(key, headers or {})
+            # No hint: sit the key out for a few seconds, growing with repeated 429s
+            cooldown = retry_after if retry_after is not None else min(60.0, 2.0 * (key.rate_limited or 1))
+            key.cooldown_until = max(key.cooldown_until, self.clock() + cooldown)
+
+    def report_error(self, reservation: Reservation):
+        with self._lock:
+            key = reservation.key
+            key.in_flight -= 1
+            key.errors += 1
+            key.consecutive_failures += 1
+            if key.consecutive_failures >= KEY_MAX_FAILURES:
+                key.cooldown_until = self.clock() + KEY_FAILURE_COOLDOWN
+                key.consecutive_failures = 0
+
+    def _absorb_headers(self, key: KeyState, headers: Dict):
+        headers = {k.lower(): v for k, v in headers.items()}
+        try:
+            if "x-ratelimit-remaining-requests" in headers:
+                key.remaining_requests = int(headers["x-ratelimit-remaining-requests"])
+            if "x-ratelimit-remaining-tokens" in headers:
+                key.remaining_tokens = int(headers["x-ratelimit-remaining-tokens"])
+        except (TypeError, ValueError):
+            pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = self.clock()
+            return {
+                key.label: {
+                    "healthy": key.cooldown_until <= now,
+                    "cooldown_s": round(max(0.0, key.cooldown_until - now), 2),
+                    "in_flight": key.in_flight,
+                    "load": round(self._load(key), 3),
+                    "requests": key.requests,
+                    "successes": key.successes,
+                    "rate_limited": key.rate_limited,
+                    "errors": key.errors,
+                    "tokens": key.tokens,
+                }
+                for key in self.keys
+            }
+
+key_scheduler = KeyScheduler(API_KEYS)
+
+# One ChatGroq per (key, model, temperature). Each instance owns pooled sync/async HTTP
+# clients, so reusing it keeps connections warm instead of re-handshaking on every call.
+_llm_clients = {}
+_llm_clients_lock = threading.Lock()
+
+def _get_llm_client(api_key: str, temperature: float, model_name: str, json_mode: bool = False):
+    client_key = (api_key, model_name, temperature, json_mode)
+    llm = _llm_clients.get(client_key)
+    if llm is None:
+        if json_mode:
+            # The bound runnable shares the plain client's connection pool
+            base = _get_llm_client(api_key, temperature, model_name)
+            llm = base.bind(response_format={"type": "json_object"})
+        else:
+            from langchain_groq import ChatGroq
+            llm = ChatGroq(temperature=temperature, model_name=model_name, groq_api_key=api_key)
+        with _llm_clients_lock:
+            llm = _llm_clients.setdefault(client_key, llm)
+    return llm
+
+def get_groq_llm(temperature=0.4, model_name="llama-3.3-70b-versatile", api_key=None, json_mode=False):
     if not API_KEYS:
         raise ValueError("No GROQ_API_KEY set. Please set at least GROQ_API_KEY in environment.")
-    
-    api_key = API_KEYS[current_key_index % len(API_KEYS)]
-    return ChatGroq(temperature=temperature, model_name=model_name, groq_api_key=api_key)
-
-def rotate_api_key():
-    """Rotate to the next available API key after a rate limit error."""
-    global current_key_index
-    if len(API_KEYS) > 1:
-        current_key_index = (current_key_index + 1) % len(API_KEYS)
-        print(f"Rotated to API key index: {current_key_index}")
+    if api_key is None:
+        # Callers outside the scheduler get the currently least-loaded key
+        api_key = key_scheduler.best_key().api_key
+    return _get_llm_client(api_key, temperature, model_name, json_mode and LLM_JSON_MODE)
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    if getattr(e, "status_code", None) == 429:
         return True
-    return False
-
-def generate_patient_case() -> PatientCase:
-    # High temperature for maximum variety
-    # Use 8b model for speed to avoid Vercel timeouts (10s limit)
-    llm = get_groq_llm(temperature=0.9, model_name="llama-3.1-8b-instant")
-    import random
-    import time
-    # Seed with current time to ensure true randomization on each call
-    random.seed(time.time() * 1000000)
-    entropy = random.randint(0, 999999)
+    error_str = str(e).lower()
+    return "rate limit" in error_str or "429" in error_str or "rate_limit_exceeded" in error_str
+
+def _estimate_prompt_tokens(messages: List[Any]) -> int:
+    return sum(estimate_tokens(m.content) for m in messages)
+
+def _response_tokens(response: Any, fallback: int) -> int:
+    usage = getattr(response, "usage_metadata", None) or {}
+    return usage.get("total_tokens") or fallback
+
+def _record_llm_tokens(response: Any, model_name: str, key_label: str, prompt_estimate: int):
+    usage = getattr(response, "usage_metadata", None) or {}
+    LLM_TOKENS.inc(usage.get("input_tokens") or prompt_estimate, model=model_name, key=key_label, kind="prompt")
+    LLM_TOKENS.inc(cached_prompt_tokens(response), model=model_name, key=key_label, kind="cached_prompt")
+    LLM_TOKENS.inc(usage.get("output_tokens") or estimate_tokens(response.content or ""), model=model_name, key=key_label, kind="completion")
+
+async def ainvoke_llm(messages: List[Any], temperature: float, model_name: str, max_attempts: Optional[int] = None, json_mode: bool = False,
+                      tried: Optional[List[KeyState]] = None):
+    """Invoke the model on the best available key, retrying 429s on other keys with jittered backoff.
+
+    json_mode asks the provider for a syntactically valid JSON object (response_format).
+    tried is shared between hedged calls: keys in it are avoided, and each key used is added.
+    """
+    tried = tried if tried is not None else []
+    attempts = max_attempts or max(LLM_MAX_ATTEMPTS, len(API_KEYS))
+    estimate = _estimate_prompt_tokens(messages)
+    last_error = None
+    for attempt in range(attempts):
+        reservation, wait = key_scheduler.acquire(estimate, exclude=tried)
+        tried.append(reservation.key)
+        if wait > 0:
+            if wait > LLM_MAX_WAIT:
+                key_scheduler.cancel(reservation)
+                break
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                key_scheduler.cancel(reservation)
+                raise
+        started = time.perf_counter()
+        try:
+            llm = get_groq_llm(temperature=temperature, model_name=model_name, api_key=reservation.api_key, json_mode=json_mode)
+            response = await llm.ainvoke(messages)
+        except asyncio.CancelledError:
+            # Cut off by a tier budget or deadline: hand the reservation back
+            key_scheduler.cancel(reservation)
+            raise
+        except Exception as e:
+            last_error = e
+            if not _is_rate_limit_error(e):
+                LLM_SECONDS.observe(time.perf_counter() - started, model=model_name, key=reservation.label, outcome="error")
+                key_scheduler.report_error(reservation)
+                raise
+            LLM_SECONDS.observe(time.perf_counter() - started, model=model_name, key=reservation.label, outcome="rate_limited")
+            key_scheduler.report_rate_limit(reservation, retry_after_hint(e), _error_headers(e))
+            log_event("llm_rate_limited", logging.WARNING, key=reservation.label, model=model_name, attempt=attempt + 1, attempts=attempts)
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        LLM_SECONDS.observe(time.perf_counter() - started, model=model_name, key=reservation.label, outcome="ok")
+        hedge_policy.observe(model_name, time.perf_counter() - started)
+        _record_llm_tokens(response, model_name, reservation.label, estimate)
+        headers = (getattr(response, "response_metadata", None) or {}).get("headers")
+        key_scheduler.release(reservation, _response_tokens(response, estimate), headers)
+        return response
+    raise last_error or RuntimeError("All API keys are rate limited")
+
+async def astream_llm(messages: List[Any], temperature: float, model_name: str, deadline: Optional[float] = None):
+    """Stream the completion text on the best available key: ainvoke_llm's key handling for a stream.
+
+    A 429 is retried on another key only while nothing has been yielded. The key's
+    reservation is settled however the stream ends, including when the consumer
+    cancels it part way. Raises TimeoutError when deadline (default: llm_deadline())
+    passes mid-stream or leaves too little time for another attempt.
+    """
+    deadline = deadline if deadline is not None else llm_deadline()
+    attempts = max(LLM_MAX_ATTEMPTS, len(API_KEYS))
+    estimate = _estimate_prompt_tokens(messages)
+    last_error = None
+    for attempt in range(attempts):
+        if deadline - time.monotonic() < MIN_TIER_BUDGET:
+            raise TimeoutError(f"{model_name} stream ran out of its deadline")
+        reservation, wait = key_scheduler.acquire(estimate)
+        if wait > LLM_MAX_WAIT or time.monotonic() + wait + MIN_TIER_BUDGET > deadline:
+            # No key has room in its minute budget soon enough; don't call anyway
+            key_scheduler.cancel(reservation)
+            break
+        received = []
+        called = settled = False
+        started = time.perf_counter()
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+            llm = get_groq_llm(temperature=temperature, model_name=model_name, api_key=reservation.api_key)
+            called = True
+            stream = llm.astream(messages)
+            while True:
+                # The deadline bounds every chunk, not just the start of the call
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"{model_name} stream ran past its deadline") from None
+                text = chunk.content or ""
+                received.append(text)
+                yield text
+        except TimeoutError:
+            LLM_SECONDS.observe(time.perf_counter() - started, model=model_name, key=reservation.label, outcome="timeout")
+            raise
+        except Exception as e:
+            settled = True
+            last_error = e
+            if not _is_rate_limit_error(e) or received:
+                LLM_SECONDS.observe(time.perf_counter() - started, model=model_name, key=reservation.label, outcome="error")
+                key_scheduler.report_error(reservation)
+                raise
+            LLM_SECONDS.observe(time.perf_counter() - started, model=model_name, key=reservation.label, outcome="rate_limited")
+            key_scheduler.report_rate_limit(reservation, retry_after_hint(e), _error_headers(e))
+            log_event("llm_rate_limited", logging.WARNING, key=reservation.label, model=model_name, stream=True, attempt=attempt + 1)
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        finally:
+            if not settled:
+                # Finished, or cut off by the consumer (client gone) or a cancel. A call that
+                # was sent spent its request and the tokens received so far; one that wasn't is handed back.
+                if called:
+                    key_scheduler.release(reservation, estimate + estimate_tokens("".join(received)))
+                else:
+                    key_scheduler.cancel(reservation)
+        LLM_SECONDS.observe(time.perf_counter() - started, model=model_name, key=reservation.label, outcome="ok")
+        return
+    raise last_error or RuntimeError("All API keys are rate limited")
+
+# --- Model tiers ---
+# Calls walk down MODEL_TIERS (70b, then 8b) and end at a local answer when the caller
+# has one. Each hosted tier gets its own latency budget, capped by what is left of the
+# request deadline, and a circuit breaker so a degraded model is skipped outright
+# instead of eating the budget of every request while it recovers.
+
+def _parse_tiers(spec: str) -> List[tuple]:
+    tiers = []
+    for part in spec.split(","):
+        name, _, budget = part.strip().rpartition(":")
+        if name:
+            tiers.append((name, float(budget)))
+    return tiers
+
+# "model:budget_seconds,..." from most to least capable
+MODEL_TIERS = _parse_tiers(os.getenv("MODEL_TIERS", "llama-3.3-70b-versatile:6,llama-3.1-8b-instant:3"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "9"))  # whole-request budget across tiers
+TIER_FAILURE_THRESHOLD = int(os.getenv("TIER_FAILURE_THRESHOLD", "3"))
+TIER_RESET_SECONDS = float(os.getenv("TIER_RESET_SECONDS", "20"))
+MIN_TIER_BUDGET = 0.5  # not worth starting a hosted call with less time than this
+
+tier_breakers = {name: CircuitBreaker(name, TIER_FAILURE_THRESHOLD, TIER_RESET_SECONDS) for name, _ in MODEL_TIERS}
+
+def llm_deadline() -> float:
+    """now + LLM_DEADLINE, or the admitted request's deadline when that comes first."""
+    deadline = time.monotonic() + LLM_DEADLINE
+    request_deadline = request_deadline_var.get()
+    return min(deadline, request_deadline) if request_deadline is not None else deadline
+
+def _tiers_from(model_name: str) -> List[tuple]:
+    names = [name for name, _ in MODEL_TIERS]
+    if model_name not in names:
+        return [(model_name, LLM_DEADLINE)]
+    return MODEL_TIERS[names.index(model_name):]
+
+# --- Hedged requests ---
+# Provider latency has a long tail. When a call has not answered by its model's recent
+# p90, a duplicate goes to another key (or, with a single key, to the next tier) and
+# the first acceptable response wins; the other call is cancelled. Hedges are paid for
+# from a budget that grows by HEDGE_MAX_RATE per primary call and are capped in prompt
+# tokens per minute, so a slow provider cannot double our quota spend.
+
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") != "0"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.9"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.3"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "2.0"))  # until a model has latency samples
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.15"))  # hedges per primary call
+HEDGE_MAX_TOKENS_PER_MIN = int(os.getenv("HEDGE_MAX_TOKENS_PER_MIN", "6000"))  # 0 = no token cap
+
+class HedgePolicy:
+    """Per-model hedge delay from recent latencies, and the budget hedges draw from."""
+
+    SAMPLES = 200
+    MIN_SAMPLES = 20
+    BURST = 5.0  # hedges the budget can bank during quiet periods
+
+    def __init__(self, quantile: float = HEDGE_QUANTILE, min_delay: float = HEDGE_MIN_DELAY,
+                 default_delay: float = HEDGE_DEFAULT_DELAY, max_rate: float = HEDGE_MAX_RATE,
+                 max_tokens_per_min: int = HEDGE_MAX_TOKENS_PER_MIN, clock=time.monotonic):
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.max_rate = max_rate
+        self.max_tokens_per_min = max_tokens_per_min
+        self.clock = clock
+        self._latency = {}  # model -> deque of recent successful call seconds
+        self._delay = {}  # model -> cached delay, refreshed every MIN_SAMPLES observations
+        self._credit = 1.0
+        self._spent = deque()  # (timestamp, tokens) of hedges in the last minute
+        self._spent_tokens = 0
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, seconds: float):
+        with self._lock:
+            samples = self._latency.setdefault(model, deque(maxlen=self.SAMPLES))
+            samples.append(seconds)
+            if len(samples) >= self.MIN_SAMPLES and (model not in self._delay or len(samples) % self.MIN_SAMPLES == 0):
+                ordered = sorted(samples)
+                self._delay[model] = ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+
+    def delay(self, model: str) -> float:
+        with self._lock:
+            return max(self.min_delay, self._delay.get(model, self.default_delay))
+
+    def record_primary(self):
+        with self._lock:
+            self._credit = min(self.BURST, self._credit + self.max_rate)
+
+    def allow(self, model: str, tokens: int) -> bool:
+        """Spend budget on one hedge, or count why it was denied."""
+        with self._lock:
+            now = self.clock()
+            while self._spent and self._spent[0][0] <= now - 60:
+                self._spent_tokens -= self._spent.popleft()[1]
+            if self._credit < 1:
+                outcome = "denied_rate"
+            elif self.max_tokens_per_min and self._spent_tokens + tokens > self.max_tokens_per_min:
+                outcome = "denied_cost"
+            else:
+                self._credit -= 1
+                self._spent.append((now, tokens))
+                self._spent_tokens += tokens
+                outcome = "sent"
+        HEDGES.inc(model=model, outcome=outcome)
+        return outcome == "sent"
+
+    def stats(self) -> Dict:
+        with self._lock:
+            delays = {m: round(max(self.min_delay, self._delay.get(m, self.default_delay)), 3) for m in self._latency}
+            credit, spent = self._credit, self._spent_tokens
+        outcomes = ("sent", "won", "lost", "denied_rate", "denied_cost")
+        return {
+            "enabled": LLM_HEDGE,
+            "delay_s": delays,
+            "credit": round(credit, 2),
+            "tokens_last_min": spent,
+            "max_tokens_per_min": self.max_tokens_per_min,
+            "max_rate": self.max_rate,
+            **{outcome: int(HEDGES.total(outcome=outcome)) for outcome in outcomes},
+        }
+
+hedge_policy = HedgePolicy()
+
+def has_envelope(validate: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    """accept= for ainvoke_hedged: the response carries a JSON object `validate` passes."""
+    return lambda response: parse_envelope(response.content, validate).value is not None
+
+async def ainvoke_hedged(messages: List[Any], temperature: float, model_name: str, json_mode: bool = False,
+                         accept: Optional[Callable[[Any], bool]] = None) -> tuple:
+    """ainvoke_llm, hedged once after the model's p90. Returns (response, model that answered).
+
+    accept rejects responses that cannot be used (e.g. no valid envelope), so a hedge
+    still in flight gets the chance to answer; when neither is accepted the first
+    response is returned anyway and the caller's repair path handles it.
+    """
+    tried = []
+    def call(model):
+        return ainvoke_llm(messages, temperature=temperature, model_name=model, json_mode=json_mode, tried=tried)
+
+    if not LLM_HEDGE:
+        return await call(model_name), model_name
+    hedge_policy.record_primary()
+    primary = asyncio.ensure_future(call(model_name))
+    tasks = {primary: model_name}
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=hedge_policy.delay(model_name))
+        if not done:
+            hedge_model = model_name if key_scheduler.spare_key(tried) else _next_tier(model_name)
+            breaker = tier_breakers.get(hedge_model)
+            if (hedge_model is not None and (breaker is None or breaker.state == "closed")
+                    and hedge_policy.allow(model_name, _estimate_prompt_tokens(messages))):
+                tasks[asyncio.ensure_future(call(hedge_model))] = hedge_model
+        pending, first, error = set(tasks), None, None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in sorted(done, key=lambda t: t is not primary):
+                if task.exception() is not None:
+                    error = error or task.exception()
+                    continue
+                response = task.result()
+                if accept is None or accept(response):
+                    if len(tasks) > 1:
+                        HEDGES.inc(model=model_name, outcome="lost" if task is primary else "won")
+                    return response, tasks[task]
+                first = first or (response, tasks[task])
+        if first is not None:
+            return first
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+async def ainvoke_tiered(messages: List[Any], temperature: float, model_name: str, json_mode: bool = False,
+                         local: Optional[Callable[[], str]] = None, deadline: Optional[float] = None,
+                         accept: Optional[Callable[[Any], bool]] = None) -> tuple:
+    """Invoke model_name, then each cheaper tier, then local(). Returns (response, model that answered).
+
+    Each hosted call is hedged (see ainvoke_hedged); accept tells it which responses are usable.
+
+    deadline is a time.monotonic() instant (default: llm_deadline()); a call still running
+    at the deadline is cancelled. Raises the last error when no hosted tier answers and
+    there is no local fallback.
+    """
+    deadline = deadline if deadline is not None else llm_deadline()
+    last_error = None
+    for tier, budget in _tiers_from(model_name):
+        breaker = tier_breakers.get(tier)
+        remaining = deadline - time.monotonic()
+        if remaining < MIN_TIER_BUDGET:
+            break
+        if breaker is not None and not breaker.allow():
+            MODEL_TIER_CALLS.inc(tier=tier, outcome="skipped")
+            continue
+        try:
+            response, answered = await asyncio.wait_for(
+                ainvoke_hedged(messages, temperature=temperature, model_name=tier, json_mode=json_mode, accept=accept),
+                timeout=min(budget, remaining),
+            )
+        except Exception as e:
+            outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            last_error = e if outcome == "error" else TimeoutError(f"{tier} exceeded its {min(budget, remaining):.1f}s budget")
+            if breaker is not None:
+                breaker.record_failure()
+            MODEL_TIER_CALLS.inc(tier=tier, outcome=outcome)
+            log_event("model_tier_failed", logging.WARNING, tier=tier, outcome=outcome, error=str(last_error))
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        MODEL_TIER_CALLS.inc(tier=tier, outcome="ok")
+        return response, answered
+    if local is not None:
+        MODEL_TIER_CALLS.inc(tier="local", outcome="ok")
+        from langchain_core.messages import AIMessage
+        return AIMessage(content=local()), "local"
+    raise last_error or TimeoutError("LLM deadline exhausted")
+
+def tier_stats() -> Dict:
+    return {name: dict(breaker.stats(), budget_s=budget) for (name, budget), breaker in zip(MODEL_TIERS, tier_breakers.values())}
+
+# --- Async Execution ---
+# Every LLM call is awaited on one process-wide event loop. The pooled async HTTP clients
+# are bound to the loop that opened their connections, so they must never hop loops.
+# Sync callers (Flask views, the case pool thread) block on run_async() while the loop
+# multiplexes all in-flight requests.
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Shared LLM event loop, started on first use in a daemon thread."""
+    global _loop, _loop_thread
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                _loop_thread = threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True)
+                _loop_thread.start()
+                _loop = loop
+    return _loop
+
+def run_async(coro, timeout: Optional[float] = None):
+    """Run a coroutine on the shared LLM loop and wait for its result."""
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_async() called from the LLM loop; await the coroutine instead")
+    # Carry the caller's context (e.g. the request's session_id for logs) onto the loop
+    ctx = contextvars.copy_context()
+
+    async def _in_caller_context():
+        for var, value in ctx.items():
+            var.set(value)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(_in_caller_context(), loop).result(timeout)
+
+def stream_async(agen, deadline: Optional[float] = None):
+    """Iterate an async generator on the shared LLM loop from a sync caller.
+
+    Items are handed over through a queue as the loop produces them. Closing this
+    generator (e.g. a Flask response whose client went away) cancels the async side.
+    deadline is a time.monotonic() instant; waiting for an item past it raises
+    TimeoutError, so a stalled loop cannot hold the calling thread.
+    """
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError("stream_async() called from the LLM loop; iterate the generator instead")
+    ctx = contextvars.copy_context()
+    items = queue.Queue()
+
+    async def _pump():
+        for var, value in ctx.items():
+            var.set(value)
+        try:
+            async for item in agen:
+                items.put((True, item))
+        except Exception as e:
+            items.put((False, e))
+        else:
+            items.put((False, None))
+        finally:
+            await agen.aclose()
+
+    future = asyncio.run_coroutine_threadsafe(_pump(), loop)
+    try:
+        while True:
+            try:
+                ok, value = items.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TimeoutError("stream stalled past its deadline")
+            if ok:
+                yield value
+            elif value is None:
+                return
+            else:
+                raise value
+    finally:
+        future.cancel()
+
+# --- Case Generation ---
+
+CASE_DOMAINS = ["General Practice", "Urgent Care", "Internal Medicine", "Sports Medicine", "Cardiology", "Gastroenterology", "Dermatology", "Orthopedics"]
+CASE_SEXES = ["male", "female"]
+
+# Case sampling draws from its own generator (seeded from os.urandom) so it never
+# reseeds or shares the global RNG used for key tie-breaks and backoff jitter
+case_rng = random.Random()
+
+# Force diverse names to avoid repetition
+MALE_FIRST_NAMES = ["James", "John", "Robert", "Michael", "William", "David", "Richard", "Joseph", "Thomas", "Charles", "Daniel", "Matthew", "Anthony", "Donald", "Mark", "Paul", "Steven", "Andrew", "Kenneth", "Joshua", "Kevin", "Brian", "George", "Edward", "Ronald", "Timothy", "Jason", "Jeffrey", "Ryan", "Jacob", "Gary", "Nicholas", "Eric", "Jonathan", "Stephen", "Larry", "Justin", "Scott", "Brandon", "Benjamin"]
+FEMALE_FIRST_NAMES = ["Mary", "Patricia", "Jennifer", "Linda", "Elizabeth", "Barbara", "Susan", "Jessica", "Sarah", "Karen", "Nancy", "Lisa", "Betty", "Margaret", "Sandra", "Ashley", "Kimberly", "Emily", "Donna", "Michelle", "Dorothy", "Carol", "Amanda", "Melissa", "Deborah", "Stephanie", "Rebecca", "Sharon", "Laura", "Cynthia", "Kathleen", "Amy", "Shirley", "Angela", "Helen", "Anna", "Brenda", "Pamela", "Nicole"]
+LAST_NAMES = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker", "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green", "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell", "Carter", "Roberts"]
+
+# Field name -> accepted type(s) for a generated case
+CASE_SCHEMA = {
+    "name": str,
+    "disease": str,
+    "presenting_summary": str,
+    "age_range": str,
+    "sex": str,
+    "onset_days": int,
+    "severity": str,
+    "symptoms": list,
+    "red_flags": list,
+    "correct_treatments": list,
+    "incorrect_treatments": list,
+}
+
+def validate_patient_case(case: Any) -> bool:
+    """Check that an LLM-generated case has every PatientCase field with a sane type."""
+    if not isinstance(case, dict):
+        return False
+    for field, field_type in CASE_SCHEMA.items():
+        value = case.get(field)
+        if field_type is int:
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return False
+        elif not isinstance(value, field_type):
+            return False
+    if not case["name"].strip() or not case["disease"].strip() or not case["symptoms"]:
+        return False
+    return all(isinstance(s, str) for s in case["symptoms"])
+
+def case_key(case: PatientCase) -> tuple:
+    """Dedup key for a case: normalized name + disease."""
+    return (case.get("name", "").strip().lower(), case.get("disease", "").strip().lower())
+
+def random_patient_name(sex: str) -> str:
+    first_names = MALE_FIRST_NAMES if sex == "male" else FEMALE_FIRST_NAMES
+    return f"{case_rng.choice(first_names)} {case_rng.choice(LAST_NAMES)}"
+
+async def _agenerate_case_from_llm(domain: Optional[str] = None, sex: Optional[str] = None,
+                                   avoid: Optional[Dict[str, str]] = None) -> Optional[PatientCase]:
+    """Ask the 8b model for one case. Returns None when every key fails or the output is invalid."""
+    entropy = case_rng.randint(0, 999999)
     # Pick a random domain to force the LLM out of its local minima
-    domains = ["General Practice", "Urgent Care", "Internal Medicine", "Sports Medicine", "Cardiology", "Gastroenterology", "Dermatology", "Orthopedics"]
-    selected_domain = random.choice(domains)
+    selected_domain = domain or case_rng.choice(CASE_DOMAINS)
     
     # Programmatically force 50/50 gender split to ensure diversity
-    forced_sex = random.choice(["male", "female"])
-    
-    # Force diverse names to avoid repetition
-    male_first_names = ["James", "John", "Robert", "Michael", "William", "David", "Richard", "Joseph", "Thomas", "Charles", "Daniel", "Matthew", "Anthony", "Donald", "Mark", "Paul", "Steven", "Andrew", "Kenneth", "Joshua", "Kevin", "Brian", "George", "Edward", "Ronald", "Timothy", "Jason", "Jeffrey", "Ryan", "Jacob", "Gary", "Nicholas", "Eric", "Jonathan", "Stephen", "Larry", "Justin", "Scott", "Brandon", "Benjamin"]
-    female_first_names = ["Mary", "Patricia", "Jennifer", "Linda", "Elizabeth", "Barbara", "Susan", "Jessica", "Sarah", "Karen", "Nancy", "Lisa", "Betty", "Margaret", "Sandra", "Ashley", "Kimberly", "Emily", "Donna", "Michelle", "Dorothy", "Carol", "Amanda", "Melissa", "Deborah", "Stephanie", "Rebecca", "Sharon", "Laura", "Cynthia", "Kathleen", "Amy", "Shirley", "Angela", "Helen", "Anna", "Brenda", "Pamela", "Nicole"]
-    last_names = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker", "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores", "Green", "Adams", "Nelson", "Baker", "Hall", "Rivera", "Campbell", "Mitchell", "Carter", "Roberts"]
-
-    if forced_sex == "male":
-        forced_name = f"{random.choice(male_first_names)} {random.choice(last_names)}"
-    else:
-        forced_name = f"{random.choice(female_first_names)} {random.choice(last_names)}"
+    forced_sex = sex or case_rng.choice(CASE_SEXES)
+    forced_name = random_patient_name(forced_sex)
+    # Diseases this doctor saw recently (disease key -> label)
+    avoid_line = f" Do NOT use any of these diseases: {', '.join(avoid.values())}." if avoid else ""
     
+    from langchain_core.messages import SystemMessage, HumanMessage
     messages = [
         SystemMessage(content=PATIENT_GENERATOR_PROMPT),
-        HumanMessage(content=f"Generate a NEW unique patient case now. Variance Seed: {entropy}. Focus Domain: {selected_domain}. Sex: {forced_sex}. Name: {forced_name}. Ensure distinct age from previous. Prioritize COMMON everyday conditions (e.g., fractures, flu, wounds, migraines) over rare diseases.")
+        HumanMessage(content=f"Generate a NEW unique patient case now. Variance Seed: {entropy}. Focus Domain: {selected_domain}. Sex: {forced_sex}. Name: {forced_name}. Ensure distinct age from previous. Prioritize COMMON everyday conditions (e.g., fractures, flu, wounds, migraines) over rare diseases.{avoid_line}")
     ]
     
-    # Try each available API key until one works
-    max_attempts = len(API_KEYS) if API_KEYS else 1
-    
-    for attempt in range(max_attempts):
-        try:
-            llm = get_groq_llm(temperature=0.9, model_name="llama-3.1-8b-instant")
-            response = llm.invoke(messages)
-            content = response.content.strip()
-            # Clean up if wrapped in backticks
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            return json.loads(content)
-        except Exception as e:
-            error_str = str(e).lower()
-            print(f"Generation attempt {attempt + 1} failed: {e}")
-            
-            # If rate limit or API error, try next key
-            if "rate" in error_str or "429" in error_str or "limit" in error_str:
-                if rotate_api_key():
-                    print(f"Rotating to next API key for attempt {attempt + 2}...")
-                    continue
-            
-            # If not a rate limit or no more keys, break to fallback
-            break
-    
-    print(f"All API keys exhausted or non-rate-limit error. Using fallback case.")
-    # Fallback cases (Offline/Error mode)
-    fallbacks = [
-        {
-            "name": "Alex Smith",
-            "disease": "Common Cold",
-            "presenting_summary": "Runny nose and mild sore throat.",
-            "age_range": "18-24",
-            "sex": "male",
-            "onset_days": 2,
-            "severity": "mild",
-            "symptoms": ["runny nose", "sore throat", "sneezing", "mild fatigue"],
-            "red_flags": [],
-            "correct_treatments": ["Rest", "Hydration", "Paracetamol"],
-            "incorrect_treatments": ["Antibiotics"]
-        },
-        {
-            "name": "Maria Garcia",
-            "disease": "Tension Headache",
-            "presenting_summary": "Constant dull pain around my forehead for two days.",
-            "age_range": "35-44",
-            "sex": "female",
-            "onset_days": 2,
-            "severity": "moderate",
-            "symptoms": ["dull headache", "neck tightness", "sensitivity to noise"],
-            "red_flags": [],
-            "correct_treatments": ["Ibuprofen", "Rest", "Stress management"],
-            "incorrect_treatments": ["Opioids", "Surgery"]
-        },
-        {
-            "name": "Sam Chen",
-            "disease": "Acute Gastroenteritis",
-            "presenting_summary": "I've been vomiting since last night and feel terrible.",
-            "age_range": "25-34",
-            "sex": "male",
-            "onset_days": 1,
-            "severity": "moderate",
-            "symptoms": ["vomiting", "nausea", "watery diarrhea", "stomach cramps"],
-            "red_flags": ["Signs of dehydration"],
-            "correct_treatments": ["Oral Rehydration Solution", "Rest"],
-            "incorrect_treatments": ["Antibiotics", "Solid food immediately"]
-        }
+    try:
+        # High temperature for maximum variety
+        # Use 8b model for speed to avoid Vercel timeouts (10s limit)
+        response, _ = await ainvoke_tiered(messages, temperature=0.9, model_name="llama-3.1-8b-instant", json_mode=True)
+    except Exception as e:
+        log_event("case_generation_failed", logging.WARNING, error=str(e))
+        return None
+    envelope = parse_envelope(response.content, validate_patient_case)
+    _count_repair("case", envelope.repair)
+    if envelope.value is None:
+        log_event("case_generation_invalid", logging.WARNING)
+        return None
+    return envelope.value
+
+def _generate_case_from_llm(domain: Optional[str] = None, sex: Optional[str] = None,
+                            avoid: Optional[Dict[str, str]] = None) -> Optional[PatientCase]:
+    return run_async(_agenerate_case_from_llm(domain, sex, avoid))
+
+# Fallback cases (Offline/Error mode)
+FALLBACK_CASES = [
+    {
+        "name": "Alex Smith",
+        "disease": "Common Cold",
+        "presenting_summary": "Runny nose and mild sore throat.",
+        "age_range": "18-24",
+        "sex": "male",
+        "onset_days": 2,
+        "severity": "mild",
+        "symptoms": ["runny nose", "sore throat", "sneezing", "mild fatigue"],
+        "red_flags": [],
+        "correct_treatments": ["Rest", "Hydration", "Paracetamol"],
+        "incorrect_treatments": ["Antibiotics"]
+    },
+    {
+        "name": "Maria Garcia",
+        "disease": "Tension Headache",
+        "presenting_summary": "Constant dull pain around my forehead for two days.",
+        "age_range": "35-44",
+        "sex": "female",
+        "onset_days": 2,
+        "severity": "moderate",
+        "symptoms": ["dull headache", "neck tightness", "sensitivity to noise"],
+        "red_flags": [],
+        "correct_treatments": ["Ibuprofen", "Rest", "Stress management"],
+        "incorrect_treatments": ["Opioids", "Surgery"]
+    },
+    {
+        "name": "Sam Chen",
+        "disease": "Acute Gastroenteritis",
+        "presenting_summary": "I've been vomiting since last night and feel terrible.",
+        "age_range": "25-34",
+        "sex": "male",
+        "onset_days": 1,
+        "severity": "moderate",
+        "symptoms": ["vomiting", "nausea", "watery diarrhea", "stomach cramps"],
+        "red_flags": ["Signs of dehydration"],
+        "correct_treatments": ["Oral Rehydration Solution", "Rest"],
+        "incorrect_treatments": ["Antibiotics", "Solid food immediately"]
+    }
+]
+
+# Offline variety: a library of pre-generated cases (see case_library.py), memory-mapped on first use
+case_library = CaseLibrary()
+recent_cases = RecentCases()
+
+def offline_case(domain: Optional[str] = None, sex: Optional[str] = None,
+                 avoid: Optional[Dict[str, str]] = None) -> PatientCase:
+    """A case without the LLM: sampled from the case library, else one of FALLBACK_CASES."""
+    case = case_library.sample(domain=domain, sex=sex, exclude=avoid or (), rng=case_rng)
+    if case is None:
+        case = copy.deepcopy(case_rng.choice(FALLBACK_CASES))
+        case["name"] = random_patient_name(case["sex"])
+    return case
+
+async def agenerate_patient_case(domain: Optional[str] = None, sex: Optional[str] = None,
+                                 avoid: Optional[Dict[str, str]] = None) -> PatientCase:
+    # Without keys there is nothing to call (and no reason to load the LLM stack)
+    case = await _agenerate_case_from_llm(domain, sex, avoid) if API_KEYS else None
+    if case is not None:
+        return case
+    FALLBACKS.inc(kind="case")
+    log_event("case_fallback", logging.WARNING, reason="all API keys exhausted or non-rate-limit error",
+              source="library" if case_library.available else "hard-coded")
+    return offline_case(domain, sex, avoid)
+
+def generate_patient_case(domain: Optional[str] = None, sex: Optional[str] = None,
+                          avoid: Optional[Dict[str, str]] = None) -> PatientCase:
+    return run_async(agenerate_patient_case(domain, sex, avoid))
+
+# --- Case Pool ---
+# Pre-generated cases so /api/start never waits on the LLM.
+# A daemon thread tops the pool up to CASE_POOL_HIGH whenever it drops below CASE_POOL_LOW.
+
+class CasePool:
+    """Background-refilled pool of validated, deduplicated patient cases."""
+
+    POOL_SCAN = 8  # pooled cases looked at when skipping a doctor's recent diseases
+
+    def __init__(self, low: Optional[int] = None, high: Optional[int] = None, seen_limit: int = 500):
+        self.low = low if low is not None else int(os.getenv("CASE_POOL_LOW", "3"))
+        self.high = max(self.low, high if high is not None else int(os.getenv("CASE_POOL_HIGH", "8")))
+        self.seen_limit = seen_limit
+        self._cases = deque()  # (domain, sex, disease key, case)
+        self._seen = OrderedDict()  # case_key -> None, bounded; covers pooled + recently served cases
+        self._domain_counts = Counter()
+        self._sex_counts = Counter()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.misses = 0
+        self.batch_served = 0  # cases taken by take() for a batch start
+        self.batch_shortfall = 0  # cases a batch start asked for that the pool did not have
+        self.generated = 0
+        self.duplicates = 0
+        self.failures = 0
+
+    def __len__(self):
+        return len(self._cases)
+
+    @property
+    def enabled(self) -> bool:
+        return self.high > 0 and bool(API_KEYS)
+
+    def ensure_started(self):
+        """Start the refill thread on first use (no-op without API keys)."""
+        if not self.enabled or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._refill_loop, name="case-pool", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def next_profile(self) -> tuple:
+        """Pick the (domain, sex) least represented in the pool, breaking ties randomly."""
+        with self._lock:
+            domain = min(CASE_DOMAINS, key=lambda d: (self._domain_counts[d], case_rng.random()))
+            sex = min(CASE_SEXES, key=lambda s: (self._sex_counts[s], case_rng.random()))
+        return domain, sex
+
+    def mark_seen(self, case: PatientCase) -> bool:
+        """Record a case key. Returns False if it was already seen (duplicate)."""
+        key = case_key(case)
+        with self._lock:
+            return self._mark_seen_locked(key)
+
+    def _mark_seen_locked(self, key: tuple) -> bool:
+        if key in self._seen:
+            self._seen.move_to_end(key)
+            return False
+        self._seen[key] = None
+        if len(self._seen) > self.seen_limit:
+            self._seen.popitem(last=False)
+        return True
+
+    def add(self, case: PatientCase, domain: str, sex: Optional[str] = None) -> bool:
+        if not validate_patient_case(case):
+            return False
+        sex = sex or case.get("sex")
+        with self._lock:
+            if not self._mark_seen_locked(case_key(case)):
+                self.duplicates += 1
+                return False
+            self._cases.append((domain, sex, diagnosis_key(case["disease"]), case))
+            self._domain_counts[domain] += 1
+            self._sex_counts[sex] += 1
+        return True
+
+    def pop(self, avoid: Optional[Dict[str, str]] = None) -> Optional[PatientCase]:
+        """Take from the front of the pool, skipping up to POOL_SCAN cases whose disease key is in
+        `avoid`; None on a miss. Wakes the refill thread below the low watermark."""
+        with self._lock:
+            position = next((i for i, entry in enumerate(itertools.islice(self._cases, self.POOL_SCAN))
+                             if not avoid or entry[2] not in avoid), None)
+            if position is not None:
+                domain, sex, _, case = self._cases[position]
+                del self._cases[position]
+                self._domain_counts[domain] -= 1
+                self._sex_counts[sex] -= 1
+                self.hits += 1
+            else:
+                case = None
+                self.misses += 1
+            below_low = len(self._cases) < self.low
+        if below_low:
+            self._wakeup.set()
+        return case
+
+    def take(self, n: int) -> List[PatientCase]:
+        """Up to n cases from the front of the pool for a batch start. What it cannot
+        supply is counted as batch_shortfall, apart from the single-lookup misses."""
+        with self._lock:
+            taken = []
+            while self._cases and len(taken) < n:
+                domain, sex, _, case = self._cases.popleft()
+                self._domain_counts[domain] -= 1
+                self._sex_counts[sex] -= 1
+                taken.append(case)
+            self.batch_served += len(taken)
+            self.batch_shortfall += n - len(taken)
+            below_low = len(self._cases) < self.low
+        if below_low:
+            self._wakeup.set()
+        return taken
+
+    def _refill_loop(self):
+        backoff = 1.0
+        while True:
+            self._wakeup.wait(timeout=30)
+            self._wakeup.clear()
+            while len(self._cases) < self.high:
+                domain, sex = self.next_profile()
+                case = _generate_case_from_llm(domain, sex)
+                if case is None:
+                    self.failures += 1
+                    # Keys are likely rate limited; back off instead of hammering them
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 60.0)
+                    break
+                backoff = 1.0
+                if self.add(case, domain, sex):
+                    self.generated += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cases),
+                "low_watermark": self.low,
+                "high_watermark": self.high,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "batch_served": self.batch_served,
+                "batch_shortfall": self.batch_shortfall,
+                "generated": self.generated,
+                "duplicates": self.duplicates,
+                "failures": self.failures,
+                "domains": {d: c for d, c in self._domain_counts.items() if c},
+                "sexes": {s: c for s, c in self._sex_counts.items() if c},
+            }
+
+case_pool = CasePool()
+
+def get_patient_case(doctor_username: str = "") -> PatientCase:
+    """Case for a new session: pool first, then live generation, then the case library / fallbacks.
+
+    Diseases the doctor saw recently are skipped in the pool, excluded from library samples
+    and named in the generation prompt.
+    """
+    avoid = recent_cases.get(doctor_username)
+    case_pool.ensure_started()
+    case = case_pool.pop(avoid)
+    if case is not None:
+        return case
+    domain, sex = case_pool.next_profile()
+    case = generate_patient_case(domain, sex, avoid)
+    case_pool.mark_seen(case)
+    return case
+
+# --- Batch Generation ---
+# A class starting 30-100 sessions at once asks for several cases per LLM request and
+# runs a bounded number of those requests concurrently across the keys.
+
+CASE_BATCH_SIZE = int(os.getenv("CASE_BATCH_SIZE", "5"))  # cases requested per LLM call
+CASE_BATCH_CONCURRENCY = int(os.getenv("CASE_BATCH_CONCURRENCY", "0"))  # 0 = two per API key
+CASE_BATCH_ROUNDS = 2  # extra requests for cases lost to invalid output or duplicates
+
+def _batch_profiles(n: int) -> List[Dict]:
+    """n (domain, sex, name) profiles spread evenly over domains and sexes, names unique."""
+    domains = case_rng.sample(CASE_DOMAINS, len(CASE_DOMAINS))
+    names = set()
+    profiles = []
+    for i in range(n):
+        sex = CASE_SEXES[i % len(CASE_SEXES)]
+        name = random_patient_name(sex)
+        for _ in range(5):
+            if name not in names:
+                break
+            name = random_patient_name(sex)
+        names.add(name)
+        profiles.append({"domain": domains[i % len(domains)], "sex": sex, "name": name})
+    return profiles
+
+def _is_case_batch(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("cases"), list)
+
+async def _agenerate_case_batch(profiles: List[Dict]) -> List[PatientCase]:
+    """One LLM request for len(profiles) cases. Returns the valid ones (possibly none)."""
+    lines = "\n".join(f"{i + 1}. Focus Domain: {p['domain']}. Sex: {p['sex']}. Name: {p['name']}." for i, p in enumerate(profiles))
+    from langchain_core.messages import SystemMessage, HumanMessage
+    messages = [
+        SystemMessage(content=PATIENT_GENERATOR_PROMPT),
+        HumanMessage(content=f"Generate {len(profiles)} NEW distinct patient cases now, one per profile below, each with a different disease. Variance Seed: {case_rng.randint(0, 999999)}. Prioritize COMMON everyday conditions (e.g., fractures, flu, wounds, migraines) over rare diseases.\n{lines}\nReturn one JSON object: {{\"cases\": [case, ...]}} with exactly {len(profiles)} cases in this order.")
     ]
-    import random
-    return random.choice(fallbacks)
+    try:
+        response = await ainvoke_llm(messages, temperature=0.9, model_name="llama-3.1-8b-instant", json_mode=True)
+    except Exception as e:
+        log_event("case_batch_failed", logging.WARNING, size=len(profiles), error=str(e))
+        return []
+    envelope = parse_envelope(response.content, _is_case_batch)
+    _count_repair("case_batch", envelope.repair)
+    if envelope.value is None:
+        return []
+    return [case for case in envelope.value["cases"] if validate_patient_case(case)]
+
+async def agenerate_patient_cases(n: int) -> List[PatientCase]:
+    """n distinct validated cases: pooled ones first, then batched LLM requests, then fallbacks."""
+    started = time.perf_counter()
+    cases = case_pool.take(n)
+    pooled = len(cases)
+
+    concurrency = CASE_BATCH_CONCURRENCY or max(2, 2 * len(API_KEYS))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(profiles):
+        async with semaphore:
+            return await _agenerate_case_batch(profiles)
+
+    for _ in range(CASE_BATCH_ROUNDS):
+        missing = n - len(cases)
+        if missing <= 0 or not API_KEYS:
+            break
+        profiles = _batch_profiles(missing)
+        chunks = [profiles[i:i + CASE_BATCH_SIZE] for i in range(0, missing, CASE_BATCH_SIZE)]
+        for batch in await asyncio.gather(*(bounded(chunk) for chunk in chunks)):
+            for case in batch:
+                if len(cases) < n and case_pool.mark_seen(case):
+                    cases.append(case)
+    generated = len(cases) - pooled
+
+    fallbacks = n - len(cases)
+    if fallbacks:
+        FALLBACKS.inc(fallbacks, kind="case")
+        in_batch = {diagnosis_key(case["disease"]) for case in cases}
+        for i in range(fallbacks):
+            case = (case_library.sample(domain=CASE_DOMAINS[i % len(CASE_DOMAINS)], exclude=in_batch, rng=case_rng)
+                    or copy.deepcopy(FALLBACK_CASES[i % len(FALLBACK_CASES)]))
+            in_batch.add(diagnosis_key(case["disease"]))
+            cases.append(case)
+    log_event("case_batch", requested=n, pooled=pooled, generated=generated, fallbacks=fallbacks,
+              duration_ms=round((time.perf_counter() - started) * 1000, 1))
+    return cases
+
+def generate_patient_cases(n: int) -> List[PatientCase]:
+    return run_async(agenerate_patient_cases(n))
 
 # --- EXTRACTION AGENT ---
 
 
 
+# Rendered system prompt per session: built once at /api/start, reused on every turn
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "10000"))
+session_prompts = ResponseCache(ttl=float(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600))), max_entries=PROMPT_CACHE_SIZE)
+
+def get_session_prompt(state: PatientState) -> str:
+    """System prompt for a session, memoized by session_id."""
+    session_id = state.get("session_id")
+    if not session_id:
+        return get_master_system_prompt(state["patient_case"])
+    return session_prompts.get_or_compute(session_id, lambda: (get_master_system_prompt(state["patient_case"]), True))
+
+def forget_session_prompt(session_id: str):
+    session_prompts.discard(session_id)
+
+def _build_turn_messages(state: PatientState, user_input: str) -> tuple:
+    """Prompt for the next turn, bounded by the context window's token budget. Returns (messages, usage)."""
+    return default_window.build(get_session_prompt(state), state, user_input)
+
+def cached_prompt_tokens(response: Any) -> int:
+    """Prompt tokens the provider served from its prefix cache (0 when not reported)."""
+    details = (getattr(response, "usage_metadata", None) or {}).get("input_token_details") or {}
+    if details.get("cache_read"):
+        return details["cache_read"]
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+def _record_provider_usage(usage: Dict, response: Any):
+    # Groq reports real token counts; keep our estimate alongside for comparison
+    provider = getattr(response, "usage_metadata", None) or {}
+    if provider.get("input_tokens"):
+        usage["provider_prompt_tokens"] = provider["input_tokens"]
+    if provider.get("output_tokens"):
+        usage["completion_tokens"] = provider["output_tokens"]
+    cached = cached_prompt_tokens(response)
+    if cached:
+        usage["cached_prompt_tokens"] = cached
+    return usage
+
+def _count_repair(source: str, repair: Optional[str]):
+    if repair:
+        PARSE_REPAIRS.inc(source=source, kind=repair)
+
+def split_turn_envelope(raw_content: str) -> tuple:
+    """Split a raw 70b completion into (reply_text, metadata) as the model wrote them."""
+    envelope = parse_envelope(raw_content, is_turn_envelope)
+    _count_repair("turn", envelope.repair)
+    parsed = envelope.value
+    start, end = envelope.span
+    if parsed is None:
+        # No envelope at all: the whole completion is what the patient said
+        return envelope.text, {}
+    if "reply_text" in parsed or "metadata" in parsed:
+        return parsed.get("reply_text") or "", dict(parsed.get("metadata") or {})
+    # Bare metadata object after the spoken reply
+    return (envelope.text[:start] + envelope.text[end:]).strip(), dict(parsed)
+
+def detect_reveals(reply_text: str, metadata: Dict, patient_case: PatientCase) -> List[str]:
+    """Case symptoms revealed by a reply.
+
+    One pass of the case's precompiled symptom index over the reply catches paraphrases
+    ("my throat is sore" -> "sore throat") whether or not the LLM filled in metadata.
+    LLM-tagged symptoms are mapped onto the case's own symptom names where possible.
+    """
+    index = get_symptom_index(patient_case.get("symptoms", []))
+    tagged = metadata.get("revealed") or []
+    revealed = index.canonicalize(tagged if isinstance(tagged, list) else [tagged])
+    for s in index.scan(reply_text):
+        if s not in revealed:
+            revealed.append(s)
+    return revealed
+
+def parse_turn_content(raw_content: str, state: PatientState) -> tuple:
+    """Split a raw 70b completion into (reply_text, metadata) with reveals resolved."""
+    reply_text, metadata = split_turn_envelope(raw_content)
+    metadata["revealed"] = detect_reveals(reply_text, metadata, state["patient_case"])
+    return reply_text, metadata
+
+def _error_turn_result(user_input: str, e: Exception) -> Dict:
+    FALLBACKS.inc(kind="turn")
+    log_event("turn_failed", logging.ERROR, error=str(e))
+    # Fallback to keep the app alive
+    return {
+        "reply": "I'm not feeling well... (System Error: Rate limit or API issue)", 
+        "metadata": {"status": "active", "revealed": [], "needs_escalation": False},
+        # The error text stays in the logs; the turn is never replayed to the model
+        "failed": True
+    }
+
+async def aprocess_turn(state: PatientState, user_input: str) -> Dict:
+    """Run one patient turn and fold it into `state` (a Session).
+
+    The turn's steps are called directly unless TURN_CHECKPOINTER is set; only then is
+    the compiled turn graph worth its per-node overhead.
+    """
+    if TURN_CHECKPOINTER == "none":
+        return await _arun_turn_steps(state, user_input)
+    graph = get_turn_graph()
+    config = {"configurable": {"thread_id": state["session_id"], "session": state}}
+    turn_input = {"user_input": user_input, "raw": "", "failed": False, "reply": "", "metadata": {}}
+    if turn_checkpointer is not None:
+        # A retry of a turn that stopped part-way (e.g. its worker died after the LLM
+        # answered) resumes from the last checkpoint instead of calling the LLM again
+        snapshot = await graph.aget_state(config)
+        if snapshot.next and snapshot.values.get("user_input") == user_input:
+            log_event("turn_resumed", next=list(snapshot.next))
+            turn_input = None
+    final = await graph.ainvoke(turn_input, config)
+    return final["result"]
+
 def process_turn(state: PatientState, user_input: str) -> Dict:
-    # Use 70b-versatile for high quality roleplay + JSON adherence
-    llm = get_groq_llm(temperature=0.5, model_name="llama-3.3-70b-versatile")
+    return run_async(aprocess_turn(state, user_input))
 
-    system_prompt = get_master_system_prompt(state["patient_case"])
-    
-    messages = [SystemMessage(content=system_prompt)]
-    
-    if "messages" in state and state["messages"]:
-        messages.extend(state["messages"])
-        
-    messages.append(HumanMessage(content=user_input))
-    
-    # Simple single-shot invocation
+# --- Fast path ---
+# Name / age / sex / onset questions are answered from the case by local_patient without
+# an LLM call when its classifier is at least FAST_PATH_THRESHOLD sure. The turn is
+# recorded like any other, so the model sees the exchange in later turns' history.
+
+LOCAL_FAST_PATH = os.getenv("LOCAL_FAST_PATH", "1") != "0"
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", "0.8"))
+
+def _fast_path(state: PatientState, user_input: str) -> Optional[tuple]:
+    """(raw envelope, usage) when the turn can be answered locally, else None. Counts the turn either way."""
+    intent, confidence = local_patient.classify(user_input) if LOCAL_FAST_PATH else (None, 0.0)
+    if intent is None or confidence < FAST_PATH_THRESHOLD:
+        TURN_PATHS.inc(path="llm")
+        return None
+    TURN_PATHS.inc(path="fast_path", intent=intent)
+    # One phrasing per session, so the patient does not change how they talk mid-chat
+    variant = zlib.crc32(state["session_id"].encode())
+    raw = json.dumps(local_patient.fast_answer(state["patient_case"], intent, variant))
+    return raw, {"model": "fast_path", "intent": intent, "confidence": round(confidence, 2)}
+
+def fast_path_stats() -> Dict:
+    local, total = TURN_PATHS.total(path="fast_path"), TURN_PATHS.total()
+    return {
+        "enabled": LOCAL_FAST_PATH,
+        "threshold": FAST_PATH_THRESHOLD,
+        "turns": int(total),
+        "local": int(local),
+        "local_fraction": round(local / total, 4) if total else 0.0,
+    }
+
+# --- Streaming ---
+
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class ReplyTextStreamer:
+    """Incrementally extracts the "reply_text" string value from a streamed JSON envelope.
+
+    feed() takes raw completion chunks and returns whatever reply_text characters
+    became decodable, so tokens can be forwarded before the envelope is complete.
+    """
+
+    _KEY = '"reply_text"'
+
+    def __init__(self):
+        self.raw = ""
+        self._pos = 0
+        self._state = "key"  # key -> colon -> open -> string -> done
+        self.reply_text = ""
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, chunk: str) -> str:
+        self.raw += chunk
+        out = []
+        raw = self.raw
+        while self._pos < len(raw) and self._state != "done":
+            if self._state == "key":
+                idx = raw.find(self._KEY, self._pos)
+                if idx < 0:
+                    # Keep a tail in case the key is split across chunks
+                    self._pos = max(self._pos, len(raw) - len(self._KEY) + 1)
+                    break
+                self._pos = idx + len(self._KEY)
+                self._state = "colon"
+            elif self._state in ("colon", "open"):
+                ch = raw[self._pos]
+                if ch.isspace():
+                    self._pos += 1
+                elif self._state == "colon" and ch == ":":
+                    self._pos += 1
+                    self._state = "open"
+                elif self._state == "open" and ch == '"':
+                    self._pos += 1
+                    self._state = "string"
+                else:
+                    # Not the envelope key (e.g. the word inside another string); keep looking
+                    self._state = "key"
+            else:
+                ch = raw[self._pos]
+                if ch == '"':
+                    self._pos += 1
+                    self._state = "done"
+                elif ch == "\\":
+                    if self._pos + 1 >= len(raw):
+                        break
+                    esc = raw[self._pos + 1]
+                    if esc == "u":
+                        if self._pos + 6 > len(raw):
+                            break
+                        try:
+                            out.append(chr(int(raw[self._pos + 2:self._pos + 6], 16)))
+                        except ValueError:
+                            pass
+                        self._pos += 6
+                    else:
+                        out.append(_JSON_ESCAPES.get(esc, esc))
+                        self._pos += 2
+                else:
+                    out.append(ch)
+                    self._pos += 1
+        text = "".join(out)
+        self.reply_text += text
+        return text
+
+def _next_tier(model_name: str) -> Optional[str]:
+    names = [name for name, _ in MODEL_TIERS]
+    index = names.index(model_name) + 1 if model_name in names else len(names)
+    return names[index] if index < len(names) else None
+
+def _stream_fallback(state: PatientState, user_input: str, messages: List[Any], usage: Dict, model_name: str,
+                     deadline: Optional[float] = None):
+    """The rest of the tier chain after the streaming model, delivered as one token."""
+    local = _local_turn(state, user_input)
     try:
-        response = llm.invoke(messages)
-        content = response.content.strip()
-        
-        # Basic cleanup
-        if content.startswith("```json"): content = content[7:]
-        if content.endswith("```"): content = content[:-3]
-        content = content.strip()
-        
-        import re
-        reply_text = ""
-        metadata = {}
-        
-        try:
-             parsed = json.loads(content)
-             reply_text = parsed.get("reply_text", "")
-             metadata = parsed.get("metadata", {})
-        except:
-             # Fallback regex
-             candidates = re.findall(r'(\{.*\})', content, re.DOTALL)
-             if candidates:
-                 try:
-                     parsed = json.loads(candidates[-1])
-                     if "metadata" in parsed:
-                         metadata = parsed["metadata"]
-                         reply_text = parsed.get("reply_text", "")
-                     elif "revealed" in parsed:
-                         metadata = parsed
-                         reply_text = content.replace(candidates[-1], "").strip()
-                 except:
-                     reply_text = content
-             else:
-                 reply_text = content
-
-        # --- SIMPLE FALLBACK SCANNER ---
-        # If the LLM mentions a symptom in text but forgets metadata, we catch it.
-        # This is the "safe" version used locally.
-        known = state["patient_case"].get("symptoms", [])
-        revealed = set(metadata.get("revealed", []))
-        
-        if not revealed:
-             # Only scan if LLM failed to tag explicit symptoms
-             for s in known:
-                 if s.lower() in reply_text.lower():
-                     revealed.add(s)
-        
-        metadata["revealed"] = list(revealed)
-        # -------------------------------
+        lower = _next_tier(model_name)
+        if lower is None:
+            MODEL_TIER_CALLS.inc(tier="local", outcome="ok")
+            raw, tier = local(), "local"
+        else:
+            response, tier = run_async(ainvoke_tiered(messages, temperature=0.5, model_name=lower, json_mode=True, local=local,
+                                                      deadline=deadline, accept=has_envelope(is_turn_envelope)))
+            raw = response.content
+            _record_provider_usage(usage, response)
+    except Exception as e:
+        result = _error_turn_result(user_input, e)
+        result["usage"] = usage
+        yield "done", result
+        return
+    usage["model"] = tier
+    reply_text, metadata = parse_turn_content(raw, state)
+    if reply_text:
+        yield "token", reply_text
+    yield "done", {"reply": reply_text, "metadata": metadata, "usage": usage}
 
-        return {
-            "reply": reply_text,
-            "metadata": metadata,
-            "history_update": [HumanMessage(content=user_input), AIMessage(content=response.content)]
-        }
+def stream_turn(state: PatientState, user_input: str, deadline: Optional[float] = None):
+    """Streaming variant of process_turn.
+
+    Yields ("token", text) events while reply_text is being generated, then a single
+    ("done", result) event where result has the same shape as process_turn's return value.
+    Only the 70b tier streams; when it is down the lower tiers answer in one piece.
+    deadline is a time.monotonic() instant (default: llm_deadline()). A stream it cuts
+    off part way ends with a done event whose reply replaces the tokens already sent.
+    """
+    fast = _fast_path(state, user_input)
+    if fast is not None:
+        reply_text, metadata = parse_turn_content(fast[0], state)
+        yield "token", reply_text
+        yield "done", {"reply": reply_text, "metadata": metadata, "usage": fast[1]}
+        return
+
+    model_name = "llama-3.3-70b-versatile"
+    messages, usage = _build_turn_messages(state, user_input)
+    deadline = deadline if deadline is not None else llm_deadline()
+    breaker = tier_breakers.get(model_name)
+    if breaker is not None and not breaker.allow():
+        MODEL_TIER_CALLS.inc(tier=model_name, outcome="skipped")
+        yield from _stream_fallback(state, user_input, messages, usage, model_name, deadline)
+        return
+
+    streamer = ReplyTextStreamer()
+    # The stream runs on the shared loop like every other call (pooled clients, key
+    # budgets, cancellation); this thread only forwards what arrives
+    tier_deadline = min(deadline, time.monotonic() + dict(MODEL_TIERS).get(model_name, LLM_DEADLINE))
+    chunks = stream_async(astream_llm(messages, temperature=0.5, model_name=model_name, deadline=tier_deadline),
+                          deadline=tier_deadline)
+    try:
+        for chunk in chunks:
+            text = streamer.feed(chunk)
+            if text:
+                yield "token", text
     except Exception as e:
-        error_str = str(e).lower()
-        # Check for rate limit error (429)
-        if "rate limit" in error_str or "429" in error_str or "rate_limit_exceeded" in error_str:
-            print(f"Rate limit hit. Attempting to rotate API key...")
-            if rotate_api_key():
-                # Retry with new key
-                print("Retrying with new API key...")
-                try:
-                    llm = get_groq_llm(temperature=0.5, model_name="llama-3.3-70b-versatile")
-                    response = llm.invoke(messages)
-                    content = response.content.strip()
-                    if content.startswith("```json"): content = content[7:]
-                    if content.endswith("```"): content = content[:-3]
-                    content = content.strip()
-                    
-                    parsed = json.loads(content)
-                    reply_text = parsed.get("reply_text", "")
-                    metadata = parsed.get("metadata", {})
-                    
-                    return {
-                        "reply": reply_text,
-                        "metadata": metadata,
-                        "history_update": [HumanMessage(content=user_input), AIMessage(content=response.content)]
-                    }
-                except Exception as retry_error:
-                    print(f"Retry also failed: {retry_error}")
-        
-        print(f"Agent Error: {e}")
-        # Fallback to keep the app alive
-        return {
-            "reply": "I'm not feeling well... (System Error: Rate limit or API issue)", 
-            "metadata": {"status": "active", "revealed": [], "needs_escalation": False},
-            "history_update": [HumanMessage(content=user_input), AIMessage(content=str(e))]
-        }
+        outcome = "timeout" if isinstance(e, TimeoutError) else "error"
+        if breaker is not None:
+            breaker.record_failure()
+        MODEL_TIER_CALLS.inc(tier=model_name, outcome=outcome)
+        if streamer.raw and outcome == "error":
+            # Part of the reply already reached the client; a different answer can't follow it
+            result = _error_turn_result(user_input, e)
+            result["usage"] = usage
+            yield "done", result
+            return
+        log_event("model_tier_failed", logging.WARNING, tier=model_name, outcome=outcome, error=str(e), stream=True)
+        fallback = _stream_fallback(state, user_input, messages, usage, model_name, deadline)
+        if streamer.raw:
+            # The deadline cut the reply off part way: the done event carries its replacement
+            fallback = (item for item in fallback if item[0] == "done")
+        yield from fallback
+        return
+    finally:
+        chunks.close()
+    if breaker is not None:
+        breaker.record_success()
+    MODEL_TIER_CALLS.inc(tier=model_name, outcome="ok")
+    usage["model"] = model_name
+    reply_text, metadata = parse_turn_content(streamer.raw, state)
+    if not streamer.reply_text and reply_text:
+        # Model ignored the envelope; send what we parsed in one piece
+        yield "token", reply_text
+    yield "done", {
+        "reply": reply_text,
+        "metadata": metadata,
+        "usage": usage
+    }
+
+# --- Symptom Analysis ---
+
+ANALYSIS_PROMPT_TEMPLATE = """You are a medical diagnostic assistant (for educational simulation only).
+Given the following symptoms, suggest the top 3 most likely medical conditions.
+
+Symptoms: {symptoms}
+
+Return ONLY a JSON object in this exact format:
+{{
+    "conditions": [
+        {{"name": "Condition Name", "confidence": "High/Medium/Low", "reasoning": "brief explanation"}},
+        {{"name": "Condition Name", "confidence": "High/Medium/Low", "reasoning": "brief explanation"}},
+        {{"name": "Condition Name", "confidence": "High/Medium/Low", "reasoning": "brief explanation"}}
+    ]
+}}
+
+IMPORTANT: Return ONLY the JSON, no markdown, no extra text."""
+
+ANALYSIS_UNAVAILABLE = {
+    "conditions": [
+        {"name": "Analysis unavailable", "confidence": "N/A", "reasoning": "API rate limit reached. Try again later."}
+    ]
+}
+
+# Differentials are cached per normalized symptom set: trainees on the same case send
+# the same revealed_symptoms over and over.
+ANALYSIS_CACHE_TTL = float(os.getenv("ANALYSIS_CACHE_TTL", "3600"))
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "2048"))
+analysis_cache = ResponseCache(ttl=ANALYSIS_CACHE_TTL, max_entries=ANALYSIS_CACHE_SIZE)
+
+def symptom_set_key(symptoms: List[str]) -> tuple:
+    """Order- and case-insensitive key for a symptom list."""
+    return tuple(sorted({" ".join(s.lower().split()) for s in symptoms if isinstance(s, str) and s.strip()}))
+
+async def _arun_analysis(symptoms: List[str]) -> tuple:
+    """Returns (result, ok); ok is False when the fallback response was used."""
+    prompt = ANALYSIS_PROMPT_TEMPLATE.format(symptoms=', '.join(symptoms))
+    try:
+        from langchain_core.messages import HumanMessage
+        response, _ = await ainvoke_tiered([HumanMessage(content=prompt)], temperature=0.3, model_name="llama-3.1-8b-instant", json_mode=True,
+                                           accept=has_envelope(is_analysis))
+        envelope = parse_envelope(response.content, is_analysis)
+        _count_repair("analysis", envelope.repair)
+        if envelope.value is not None:
+            return envelope.value, True
+        log_event("analysis_invalid", logging.WARNING)
+    except Exception as e:
+        log_event("analysis_failed", logging.WARNING, error=str(e))
+    
+    # Fallback response
+    FALLBACKS.inc(kind="analysis")
+    return copy.deepcopy(ANALYSIS_UNAVAILABLE), False
+
+async def aanalyze_symptoms(symptoms: List[str]) -> Dict:
+    """Differential for the sidebar: top 3 likely conditions for the revealed symptoms (uncached)."""
+    result, _ = await _arun_analysis(list(symptom_set_key(symptoms)))
+    return result
+
+def analyze_symptoms(symptoms: List[str]) -> Dict:
+    """Cached differential; identical concurrent requests share one LLM call."""
+    key = symptom_set_key(symptoms)
+    return analysis_cache.get_or_compute(key, lambda: run_async(_arun_analysis(list(key))))
+
+# --- Turn graph ---
+# A patient turn as a sequence of steps:
+#   classify -> prompt -> llm -> parse -> reveal -> state_update
+#      |                    \--------------------------/   (LLM failed)
+#      \------- fast path ------> parse                    (answered from the case)
+# Every step depends on the one before it, so nothing runs in parallel. By default
+# _arun_turn_steps calls them in order. With TURN_CHECKPOINTER set they run as a
+# compiled LangGraph, which checkpoints after each node so a retried turn resumes
+# where it stopped. The session itself stays in the session store and rides in
+# config["configurable"]["session"]; checkpoints only carry the per-turn channels
+# below, keyed by thread_id = session_id.
+# Either way each step runs under stage(), which feeds the icapp_turn_stage_seconds histogram.
+
+class TurnState(TypedDict, total=False):
+    user_input: str
+    prompt: List[Any]
+    usage: Dict
+    raw: str
+    failed: bool
+    reply: str
+    metadata: Dict
+    result: Dict
+
+def _timed(name: str, fn):
+    # String annotation: langgraph only needs the name to pass the config in
+    async def node(state: TurnState, config: "RunnableConfig") -> Dict:
+        with stage(name):
+            return await fn(state, config["configurable"]["session"])
+    return node
+
+async def _classify_node(turn: TurnState, session: PatientState) -> Dict:
+    fast = _fast_path(session, turn["user_input"])
+    return {"raw": fast[0], "usage": fast[1]} if fast is not None else {}
+
+async def _prompt_node(turn: TurnState, session: PatientState) -> Dict:
+    prompt, usage = _build_turn_messages(session, turn["user_input"])
+    return {"prompt": prompt, "usage": usage}
+
+def _local_turn(session: PatientState, user_input: str) -> Callable[[], str]:
+    return lambda: local_patient.answer_json(session["patient_case"], user_input, session["revealed_symptoms"])
+
+async def _llm_node(turn: TurnState, session: PatientState) -> Dict:
+    usage = dict(turn["usage"])
+    try:
+        # 70b-versatile for roleplay + JSON adherence; 8b, then the rule-based patient, when it is down
+        response, tier = await ainvoke_tiered(turn["prompt"], temperature=0.5, model_name="llama-3.3-70b-versatile",
+                                              json_mode=True, local=_local_turn(session, turn["user_input"]),
+                                              accept=has_envelope(is_turn_envelope))
+    except Exception as e:
+        fallback = _error_turn_result(turn["user_input"], e)
+        return {"failed": True, "reply": fallback["reply"], "metadata": fallback["metadata"], "usage": usage}
+    usage["model"] = tier
+    return {"raw": response.content, "usage": _record_provider_usage(usage, response)}
+
+async def _parse_node(turn: TurnState, session: PatientState) -> Dict:
+    reply, metadata = split_turn_envelope(turn["raw"])
+    return {"reply": reply, "metadata": metadata}
+
+async def _reveal_node(turn: TurnState, session: PatientState) -> Dict:
+    metadata = dict(turn["metadata"], revealed=detect_reveals(turn["reply"], turn["metadata"], session["patient_case"]))
+    return {"metadata": metadata}
+
+async def _state_update_node(turn: TurnState, session: PatientState) -> Dict:
+    result = {"reply": turn["reply"], "metadata": turn["metadata"], "usage": turn["usage"]}
+    if turn.get("failed"):
+        result["failed"] = True
+    session.record_turn(turn["user_input"], result)
+    return {"result": result}
+
+async def _arun_turn_steps(session: PatientState, user_input: str) -> Dict:
+    """The turn graph's nodes called in order, without langgraph or checkpoints."""
+    turn = {"user_input": user_input, "raw": "", "failed": False, "reply": "", "metadata": {}}
+
+    async def step(name, fn):
+        with stage(name):
+            turn.update(await fn(turn, session))
+
+    await step("classify", _classify_node)
+    if not turn["raw"]:
+        await step("prompt", _prompt_node)
+        await step("llm", _llm_node)
+    if not turn["failed"]:
+        await step("parse", _parse_node)
+        await step("reveal", _reveal_node)
+    await step("state_update", _state_update_node)
+    return turn["result"]
+
+def build_turn_graph(checkpointer=None):
+    from langgraph.graph import StateGraph, START, END
+    graph = StateGraph(TurnState)
+    graph.add_node("classify", _timed("classify", _classify_node))
+    graph.add_node("prompt", _timed("prompt", _prompt_node))
+    graph.add_node("llm", _timed("llm", _llm_node))
+    graph.add_node("parse", _timed("parse", _parse_node))
+    graph.add_node("reveal", _timed("reveal", _reveal_node))
+    graph.add_node("state_update", _timed("state_update", _state_update_node))
+    graph.add_edge(START, "classify")
+    graph.add_conditional_edges("classify", lambda turn: "parse" if turn.get("raw") else "prompt")
+    graph.add_edge("prompt", "llm")
+    graph.add_conditional_edges("llm", lambda turn: "state_update" if turn.get("failed") else "parse")
+    graph.add_edge("parse", "reveal")
+    graph.add_edge("reveal", "state_update")
+    graph.add_edge("state_update", END)
+    return graph.compile(checkpointer=checkpointer)
+
+# TURN_CHECKPOINTER: none (default) | memory. Checkpoints live in the worker's memory, so
+# a turn resumes when it is retried on the same worker; they are not shared between workers.
+TURN_CHECKPOINTER = os.getenv("TURN_CHECKPOINTER", "none").lower()
+
+def create_turn_checkpointer():
+    if TURN_CHECKPOINTER == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        return InMemorySaver()
+    if TURN_CHECKPOINTER != "none":
+        raise ValueError(f"Unknown TURN_CHECKPOINTER {TURN_CHECKPOINTER!r} (none | memory)")
+    return None
+
+# Compiled on the first turn, not at import (see the note on lazy imports at the top)
+turn_checkpointer = None
+turn_graph = None
+_turn_graph_lock = threading.Lock()
 
-# --- LangGraph Setup (Optional Wrapper) ---
-# Since "master prompt" does heavy lifting, we can keep it simple.
-# The graph structure: Start -> Agent -> End
-# We will use this in the flask app directly or wrapping it here.
+def get_turn_graph():
+    global turn_checkpointer, turn_graph
+    if turn_graph is None:
+        with _turn_graph_lock:
+            if turn_graph is None:
+                turn_checkpointer = create_turn_checkpointer()
+                turn_graph = build_turn_graph(turn_checkpointer)
+    return turn_graph
 
-workflow = StateGraph(PatientState)
-# valid transitions, etc. 
-# For now, the 'process_turn' function encapsulates the node logic needed for the Flask API.
+def forget_session(session_id: str):
+    """Drop everything cached for a finished session (rendered prompt, turn checkpoints)."""
+    forget_session_prompt(session_id)
+    if turn_checkpointer is not None:
+        run_async(turn_checkpointer.adelete_thread(session_id))
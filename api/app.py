@@ -1,28 +1,131 @@
 import os
 import uuid
 import json
-from flask import Flask, request, jsonify
+import time
+import logging
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from dotenv import load_dotenv
-from agent import generate_patient_case, process_turn
-
-# Load environment variables
-load_dotenv()
+import agent
+from agent import get_patient_case, generate_patient_cases, process_turn, stream_turn, analyze_symptoms, case_pool, symptom_set_key
+from symptom_index import get_symptom_index
+from session_store import create_store, SESSION_TTL_SECONDS, SESSION_MAX_ENTRIES
+from session_model import Session
+from session_reaper import SessionReaper
+from history_store import create_history_store, HISTORY_PAGE_SIZE
+from history_export import export_stream
+from scoring import score_session
+from admission import AdmissionController, Overloaded, ADMISSION_MAX_IN_FLIGHT, retry_after_header
+from metrics import log_event, stage, render_prometheus, session_id_var, REQUEST_SECONDS
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'default-secret-key')
 
-# Simple in-memory session storage for demo (Move to Redis for production)
-sessions = {}
+# Session state storage (SESSION_BACKEND=memory | sqlite | redis)
+# Handlers load state with get(), mutate it, and save it back with set() on every turn
+sessions = create_store("session", ttl=SESSION_TTL_SECONDS, max_entries=SESSION_MAX_ENTRIES)
+
+# Doctor accounts storage: {username: {name, password}}
+doctors = create_store("doctor")
+
+# Finished sessions per doctor, indexed by (username, timestamp) and session_id
+history = create_history_store()
+
+# Admission in front of everything that may call an LLM (chat turns outrank starts and /api/analyze)
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT or max(4, 4 * len(agent.API_KEYS)))
+
+def _migrate_history(username, doctor):
+    """Move a legacy in-record history list into the history store (once)."""
+    legacy = doctor.pop("history", None)
+    if legacy is None:
+        return doctor
+    for entry in legacy:
+        if entry.get("session_id") and entry.get("timestamp"):
+            history.add(username, entry)
+    doctors.set(username, doctor)
+    return doctor
+
+# --- Request instrumentation ---
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # Correlate every log line of this request with its session
+    body = request.get_json(silent=True) if request.is_json else None
+    session_id = (body or {}).get('session_id') if isinstance(body, dict) else None
+    g.session_token = session_id_var.set(session_id or request.args.get('session_id'))
 
-# Doctor accounts storage: {username: {name, password, history: []}}
-doctors = {}
+@app.after_request
+def record_request(response):
+    duration = time.perf_counter() - g.get('request_start', time.perf_counter())
+    endpoint = request.endpoint or "unknown"
+    REQUEST_SECONDS.observe(duration, endpoint=endpoint, status=response.status_code)
+    log_event("request", method=request.method, path=request.path, status=response.status_code,
+              duration_ms=round(duration * 1000, 2))
+    return response
+
+@app.teardown_request
+def clear_request_context(exc):
+    token = g.pop('session_token', None)
+    if token is not None:
+        session_id_var.reset(token)
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    """Shed before doing any work: 429 for a doctor/session over its rate, 503 when the server is full."""
+    response = jsonify({"error": str(e), "reason": e.reason, "retry_after": round(e.retry_after, 1)})
+    response.status_code = e.status
+    response.headers["Retry-After"] = retry_after_header(e.retry_after)
+    return response
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text-format metrics."""
+    pool = case_pool.stats()
+    cache = agent.analysis_cache.stats()
+    reaper = session_reaper.stats()
+    admitted = admission.stats()
+    gauges = {
+        "icapp_case_pool_size": pool["size"],
+        "icapp_case_pool_hits": pool["hits"],
+        "icapp_case_pool_misses": pool["misses"],
+        "icapp_case_pool_batch_served": pool["batch_served"],
+        "icapp_case_pool_batch_shortfall": pool["batch_shortfall"],
+        "icapp_analyze_cache_size": cache["size"],
+        "icapp_analyze_cache_hits": cache["hits"],
+        "icapp_analyze_cache_misses": cache["misses"],
+        "icapp_sessions_active": reaper["tracked"],
+        'icapp_sessions_expired{reason="idle"}': reaper["expired_idle"],
+        'icapp_sessions_expired{reason="capacity"}': reaper["expired_capacity"],
+        "icapp_admission_in_flight": admitted["in_flight"],
+        "icapp_admission_queued": admitted["queued"],
+    }
+    for label, key in agent.key_scheduler.stats().items():
+        gauges[f'icapp_api_key_healthy{{key="{label}"}}'] = int(key["healthy"])
+        gauges[f'icapp_api_key_in_flight{{key="{label}"}}'] = key["in_flight"]
+    for tier, breaker in agent.tier_stats().items():
+        gauges[f'icapp_model_tier_open{{tier="{tier}"}}'] = int(breaker["state"] != "closed")
+    return Response(render_prometheus(gauges), mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "message": "Backend is running"})
 
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Internal counters (case pool hit/miss, case library, per-key scheduler metrics, analyze cache, session expiry, model tiers, fast path, admission, hedging)."""
+    return jsonify({
+        "case_pool": case_pool.stats(),
+        "case_library": agent.case_library.stats(),
+        "api_keys": agent.key_scheduler.stats(),
+        "analyze_cache": agent.analysis_cache.stats(),
+        "sessions": session_reaper.stats(),
+        "model_tiers": agent.tier_stats(),
+        "fast_path": agent.fast_path_stats(),
+        "admission": admission.stats(),
+        "hedging": agent.hedge_policy.stats()
+    })
+
 @app.route('/api/signup', methods=['POST'])
 def signup():
     """Register a new doctor account."""
@@ -44,11 +147,10 @@ def signup():
         return jsonify({"error": "Username already exists"}), 409
     
     # Create doctor account
-    doctors[username] = {
+    doctors.set(username, {
         "name": name,
-        "password": password,  # In production, hash this!
-        "history": []
-    }
+        "password": password  # In production, hash this!
+    })
     
     return jsonify({"message": "Account created successfully", "username": username, "name": name})
 
@@ -62,27 +164,87 @@ def login():
     if not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
     
-    if username not in doctors:
+    doctor = doctors.get(username)
+    if doctor is None:
         return jsonify({"error": "Username not found"}), 404
     
-    if doctors[username]["password"] != password:
+    if doctor["password"] != password:
         return jsonify({"error": "Incorrect password"}), 401
     
     return jsonify({
         "message": "Login successful",
         "username": username,
-        "name": doctors[username]["name"]
+        "name": doctor["name"]
     })
 
 @app.route('/api/history', methods=['GET'])
 def get_history():
-    """Get session history for a doctor."""
+    """Get one page of session history for a doctor, newest first.
+    
+    Query params: limit, cursor (next_cursor from the previous page), status,
+    diagnosis (substring), since / until (ISO date or timestamp).
+    """
     username = request.args.get('username', '').strip().lower()
     
-    if not username or username not in doctors:
+    doctor = doctors.get(username) if username else None
+    if doctor is None:
         return jsonify({"error": "Doctor not found"}), 404
+    _migrate_history(username, doctor)
+    
+    args = request.args
+    try:
+        entries, next_cursor = history.page(
+            username,
+            limit=int(args.get('limit', HISTORY_PAGE_SIZE)),
+            cursor=args.get('cursor') or None,
+            status=args.get('status') or None,
+            diagnosis=args.get('diagnosis') or None,
+            since=args.get('since') or None,
+            until=args.get('until') or None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"history": entries, "next_cursor": next_cursor})
+
+# Bearer token required by /api/history/export; the export is disabled while unset
+HISTORY_EXPORT_TOKEN = os.getenv("HISTORY_EXPORT_TOKEN", "")
+
+@app.route('/api/history/export', methods=['GET'])
+def export_history():
+    """Stream every doctor's finished sessions, with transcripts, for grading.
+    
+    Query params: format (ndjson | columns), gzip (1/0; default on for columns),
+    username (repeatable), status, since / until (ISO date or timestamp) and cursor
+    (from the last record received, to resume an interrupted export).
+    """
+    if not HISTORY_EXPORT_TOKEN:
+        return jsonify({"error": "History export is disabled"}), 404
+    if request.headers.get('Authorization') != f"Bearer {HISTORY_EXPORT_TOKEN}":
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    args = request.args
+    fmt = args.get('format', 'ndjson')
+    compress = args.get('gzip') not in ('0', 'false') if args.get('gzip') else None
+    try:
+        chunks = export_stream(
+            history, fmt, compress,
+            cursor=args.get('cursor') or None,
+            usernames=[u.strip().lower() for u in args.getlist('username') if u.strip()] or None,
+            status=args.get('status') or None,
+            since=args.get('since') or None,
+            until=args.get('until') or None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    return jsonify({"history": doctors[username]["history"]})
+    gzipped = compress if compress is not None else fmt == "columns"
+    filename = f"icapp-history.{fmt}" + (".gz" if gzipped else "")
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if gzipped else 'application/x-ndjson',
+        headers={"Content-Disposition": f"attachment; filename={filename}", "X-Accel-Buffering": "no"}
+    )
 
 @app.route('/api/history/delete', methods=['POST'])
 def delete_history():
@@ -91,143 +253,217 @@ def delete_history():
     username = data.get('username', '').strip().lower()
     session_id = data.get('session_id', None)  # If None, delete all
     
-    if not username or username not in doctors:
+    doctor = doctors.get(username) if username else None
+    if doctor is None:
         return jsonify({"error": "Doctor not found"}), 404
+    _migrate_history(username, doctor)
     
     if session_id:
         # Delete specific session
-        doctors[username]["history"] = [
-            h for h in doctors[username]["history"] if h.get("session_id") != session_id
-        ]
+        history.delete(username, session_id)
         return jsonify({"message": "Session deleted"})
     else:
         # Clear all history
-        doctors[username]["history"] = []
+        history.clear(username)
         return jsonify({"message": "All history cleared"})
 
+def _create_session(patient_case, doctor_username):
+    """Store a fresh session for a case and return the /api/start response body."""
+    # Compile the case's symptom matcher now rather than on the first turn
+    get_symptom_index(patient_case.get("symptoms", []))
+    
+    session_id = str(uuid.uuid4())
+    # Render the session's system prompt once; every turn reuses it
+    agent.get_session_prompt({"session_id": session_id, "patient_case": patient_case})
+    
+    # Expire whatever has gone idle (also covers hosts where the reaper thread does not survive)
+    session_reaper.ensure_started()
+    session_reaper.reap()
+    
+    # Initialize session state (turns, revealed symptom ids and status; the rest is derived)
+    session = Session(session_id, patient_case, doctor_username=doctor_username)
+    agent.recent_cases.add(doctor_username, patient_case.get("disease", ""))
+    session_reaper.touch(session_id, session.last_active)
+    sessions.set(session_id, session)
+    
+    return {
+        "session_id": session_id, 
+        "message": "Session started",
+        "patient_summary": patient_case["presenting_summary"],
+        "patient": {
+            "name": patient_case.get("name", "Unknown"),
+            "age_range": patient_case.get("age_range", "Unknown"),
+            "sex": patient_case.get("sex", "Unknown")
+        }
+    }
+
 @app.route('/api/start', methods=['POST'])
 def start_session():
     try:
         data = request.json or {}
         doctor_username = data.get('doctor_username', '').strip().lower()
         
-        # Generate a new patient case (uses 8b instant for speed + fallback safety)
-        patient_case = generate_patient_case()
-        
-        session_id = str(uuid.uuid4())
-        
-        # Initialize session state
-        sessions[session_id] = {
-            "session_id": session_id,
-            "doctor_username": doctor_username,  # Link to doctor
-            "patient_case": patient_case,
-            "revealed_symptoms": [],
-            "asked_questions": [],
-            "treatment_given": [],
-            "status": "active",
-            "messages": [],
-            "chat_history": []  # Store readable chat for history
-        }
-        
-        return jsonify({
-            "session_id": session_id, 
-            "message": "Session started",
-            "patient_summary": patient_case["presenting_summary"],
-            "patient": {
-                "name": patient_case.get("name", "Unknown"),
-                "age_range": patient_case.get("age_range", "Unknown"),
-                "sex": patient_case.get("sex", "Unknown")
-            }
-        })
+        # Pop a pre-generated case (falls back to live 8b generation, then the case library)
+        with admission.admit("start", doctor_username):
+            patient_case = get_patient_case(doctor_username)
+        return jsonify(_create_session(patient_case, doctor_username))
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"Error starting session: {e}")
+        log_event("start_failed", logging.ERROR, error=str(e))
         return jsonify({"error": str(e)}), 500
 
+START_BATCH_MAX = int(os.getenv("START_BATCH_MAX", "100"))
+
+@app.route('/api/start/batch', methods=['POST'])
+def start_session_batch():
+    """Start `count` sessions at once (e.g. a whole class), one case each."""
+    data = request.json or {}
+    count = data.get('count')
+    if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= START_BATCH_MAX:
+        return jsonify({"error": f"count must be an integer between 1 and {START_BATCH_MAX}"}), 400
+    usernames = data.get('doctor_usernames') or []
+    if not isinstance(usernames, list) or len(usernames) > count:
+        return jsonify({"error": "doctor_usernames must be a list of at most count usernames"}), 400
+    default_username = data.get('doctor_username', '').strip().lower()
+    try:
+        case_pool.ensure_started()
+        with admission.admit("start", default_username):
+            cases = generate_patient_cases(count)
+        started = []
+        for i, patient_case in enumerate(cases):
+            username = usernames[i] if i < len(usernames) else default_username
+            started.append(_create_session(patient_case, str(username).strip().lower()))
+        return jsonify({"count": len(started), "sessions": started})
+    except Overloaded:
+        raise
+    except Exception as e:
+        log_event("start_batch_failed", logging.ERROR, count=count, error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+def _turn_response(state, result):
+    return {
+        "reply": result["reply"],
+        "metadata": result.get("metadata", {}),
+        "usage": result.get("usage", {}),
+        "state_summary": {
+            "revealed_symptoms": state.revealed_symptoms,
+            "status": state.status
+        }
+    }
+
 @app.route('/api/message', methods=['POST'])
 def message():
     data = request.json
     session_id = data.get('session_id')
     user_message = data.get('message')
     
-    if not session_id or session_id not in sessions:
+    state = sessions.get(session_id) if session_id else None
+    if state is None:
         return jsonify({"error": "Invalid or expired session"}), 404
     
     if not user_message:
         return jsonify({"error": "Message is required"}), 400
-        
-    state = sessions[session_id]
     
     try:
-        # Process the turn using the detailed agent logic (uses 70b for chat)
-        result = process_turn(state, user_message)
+        # Run the turn (uses 70b for chat); its last step folds the turn into state
+        with admission.admit("chat", state.doctor_username, session_id):
+            result = process_turn(state, user_message)
         
-        # Update state
-        state["messages"].extend(result["history_update"])
+        # Persist so any worker can serve the next turn
+        with stage("store"):
+            sessions.set(session_id, state)
+        session_reaper.touch(session_id, state.last_active)
         
-        # Update metadata if provided
-        if "metadata" in result:
-            meta = result["metadata"]
-            if "revealed" in meta:
-                # Add unique new symptoms
-                for sym in meta["revealed"]:
-                    if sym not in state["revealed_symptoms"]:
-                        state["revealed_symptoms"].append(sym)
-            if "status" in meta:
-                state["status"] = meta["status"]
-        
-        # Store readable chat for history replay
-        state["chat_history"].append({"role": "doctor", "text": user_message})
-        state["chat_history"].append({"role": "patient", "text": result["reply"]})
-                
-        # Persist (in-memory)
-        sessions[session_id] = state
-        
-        return jsonify({
-            "reply": result["reply"],
-            "metadata": result.get("metadata", {}),
-            "state_summary": {
-                "revealed_symptoms": state["revealed_symptoms"],
-                "status": state["status"]
-            }
-        })
+        return jsonify(_turn_response(state, result))
         
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"Error processing message: {e}")
+        log_event("message_failed", logging.ERROR, error=str(e))
         return jsonify({"error": str(e)}), 500
 
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.route('/api/message/stream', methods=['POST'])
+def message_stream():
+    """Same contract as /api/message, but streams reply_text as Server-Sent Events.
+
+    Emits `token` events ({"text": ...}) while the patient reply is generated and a final
+    `done` event carrying the usual /api/message response body.
+    """
+    data = request.json
+    session_id = data.get('session_id')
+    user_message = data.get('message')
+    
+    state = sessions.get(session_id) if session_id else None
+    if state is None:
+        return jsonify({"error": "Invalid or expired session"}), 404
+    
+    if not user_message:
+        return jsonify({"error": "Message is required"}), 400
+    
+    # Admitted before the stream opens so a refusal is a plain 429/503 response
+    ticket = admission.admit("chat", state.doctor_username, session_id)
+    
+    def generate():
+        # The generator runs outside this view's context, so the deadline is passed explicitly
+        try:
+            for event, payload in stream_turn(state, user_message, deadline=ticket.deadline):
+                if event == "token":
+                    yield _sse("token", {"text": payload})
+                    continue
+                state.record_turn(user_message, payload)
+                sessions.set(session_id, state)
+                session_reaper.touch(session_id, state.last_active)
+                yield _sse("done", _turn_response(state, payload))
+        except Exception as e:
+            log_event("stream_failed", logging.ERROR, error=str(e))
+            yield _sse("error", {"error": str(e)})
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # The response owns the ticket: its slot is freed when the stream ends or the client
+    # goes away, including before the first chunk
+    response.call_on_close(ticket.release)
+    return response
+
 @app.route('/api/state', methods=['GET'])
 def get_state():
     session_id = request.args.get('session_id')
-    if not session_id or session_id not in sessions:
+    state = sessions.get(session_id) if session_id else None
+    if state is None:
         return jsonify({"error": "Session not found"}), 404
         
-    state = sessions[session_id]
     # Redact full case for client, only send public info
     public_state = {
-        "revealed_symptoms": state["revealed_symptoms"],
-        "status": state["status"],
-        "message_count": len(state["messages"]) // 2
+        "revealed_symptoms": state.revealed_symptoms,
+        "status": state.status,
+        "message_count": len(state.turns)
     }
     return jsonify(public_state)
 
-@app.route('/api/end', methods=['POST'])
-def end_session():
-    data = request.json
-    session_id = data.get('session_id')
-    final_diagnosis = data.get('final_diagnosis', '').strip()
-    prescriptions = data.get('prescriptions', '').strip()
-    
-    if session_id not in sessions:
-        return jsonify({"message": "Session not found"}), 404
+def _finish_session(session_id, session, final_diagnosis="", prescriptions=""):
+    """Score a session, save it to its doctor's history and drop its state. Returns the score."""
+    doctor_username = session.doctor_username
+    doctor = doctors.get(doctor_username) if doctor_username else None
     
-    session = sessions[session_id]
-    doctor_username = session.get("doctor_username", "")
+    # Grade locally against the hidden case (no LLM call)
+    score = score_session(
+        session.patient_case, final_diagnosis, prescriptions,
+        session.revealed_symptoms, session.treatment_given,
+    )
+    log_event("session_scored", total=score["total"], diagnosis_match=score["diagnosis"]["match"])
     
     # Save to doctor's history if logged in
-    if doctor_username and doctor_username in doctors:
+    if doctor is not None:
         from datetime import datetime
-        patient_case = session["patient_case"]
-        revealed = session["revealed_symptoms"]
+        patient_case = session.patient_case
+        revealed = session.revealed_symptoms
         
         history_entry = {
             "session_id": session_id,
@@ -237,77 +473,66 @@ def end_session():
             "revealed_symptoms": revealed if revealed else [],
             "final_diagnosis": final_diagnosis if final_diagnosis else "Not provided",
             "prescriptions": prescriptions if prescriptions else "Not provided",
-            "status": session["status"],
+            "status": session.status,
+            "score": score,
             "timestamp": datetime.now().isoformat()
         }
-        doctors[doctor_username]["history"].append(history_entry)
-        print(f"Session saved to {doctor_username}'s history")
+        _migrate_history(doctor_username, doctor)
+        history.add(doctor_username, history_entry, transcript=session.chat_history)
+        log_event("history_saved", doctor=doctor_username)
     
-    del sessions[session_id]
-    return jsonify({"message": "Session ended", "saved_to_history": bool(doctor_username)})
+    sessions.delete(session_id)
+    session_reaper.forget(session_id)
+    agent.forget_session(session_id)
+    return score
+
+def _expire_session(session_id, reason):
+    """Reaper callback: mark an idle (or capacity-evicted) session abandoned and finish it."""
+    session = sessions.get(session_id)
+    if session is None:
+        agent.forget_session(session_id)
+        return None
+    if reason == "idle" and session.last_active + session_reaper.idle_ttl > time.time():
+        # Another worker served it since we last saw it
+        return session.last_active
+    session.status = "abandoned"
+    _finish_session(session_id, session)
+    log_event("session_abandoned", session=session_id, reason=reason, turns=len(session.turns))
+    return None
+
+# Idle sessions (closed tabs) are marked abandoned after SESSION_IDLE_TTL; past
+# SESSION_MAX_ENTRIES the least recently active session is abandoned to make room
+session_reaper = SessionReaper(_expire_session, max_sessions=SESSION_MAX_ENTRIES)
+
+@app.route('/api/end', methods=['POST'])
+def end_session():
+    data = request.json
+    session_id = data.get('session_id')
+    final_diagnosis = data.get('final_diagnosis', '').strip()
+    prescriptions = data.get('prescriptions', '').strip()
+    
+    session = sessions.get(session_id) if session_id else None
+    if session is None:
+        return jsonify({"message": "Session not found"}), 404
+    
+    score = _finish_session(session_id, session, final_diagnosis, prescriptions)
+    return jsonify({"message": "Session ended", "saved_to_history": bool(session.doctor_username), "score": score})
 
 @app.route('/api/analyze', methods=['POST'])
-def analyze_symptoms():
+def analyze():
     """Analyze revealed symptoms using LLM to suggest possible conditions."""
-    from agent import get_groq_llm, rotate_api_key, API_KEYS
-    from langchain_core.messages import HumanMessage
-    
     data = request.json
     symptoms = data.get('symptoms', [])
     
     if not symptoms or len(symptoms) < 1:
         return jsonify({"error": "No symptoms provided"}), 400
     
-    # Build prompt for diagnosis analysis
-    prompt = f"""You are a medical diagnostic assistant (for educational simulation only).
-Given the following symptoms, suggest the top 3 most likely medical conditions.
-
-Symptoms: {', '.join(symptoms)}
-
-Return ONLY a JSON object in this exact format:
-{{
-    "conditions": [
-        {{"name": "Condition Name", "confidence": "High/Medium/Low", "reasoning": "brief explanation"}},
-        {{"name": "Condition Name", "confidence": "High/Medium/Low", "reasoning": "brief explanation"}},
-        {{"name": "Condition Name", "confidence": "High/Medium/Low", "reasoning": "brief explanation"}}
-    ]
-}}
-
-IMPORTANT: Return ONLY the JSON, no markdown, no extra text."""
-
-    max_attempts = len(API_KEYS) if API_KEYS else 1
-    
-    for attempt in range(max_attempts):
-        try:
-            llm = get_groq_llm(temperature=0.3, model_name="llama-3.1-8b-instant")
-            response = llm.invoke([HumanMessage(content=prompt)])
-            content = response.content.strip()
-            
-            # Clean JSON
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            content = content.strip()
-            
-            result = json.loads(content)
-            return jsonify(result)
-            
-        except Exception as e:
-            error_str = str(e).lower()
-            print(f"Analyze attempt {attempt + 1} failed: {e}")
-            
-            if "rate" in error_str or "429" in error_str or "limit" in error_str:
-                if rotate_api_key():
-                    continue
-            break
-    
-    # Fallback response
-    return jsonify({
-        "conditions": [
-            {"name": "Analysis unavailable", "confidence": "N/A", "reasoning": "API rate limit reached. Try again later."}
-        ]
-    })
+    # Served from the normalized symptom-set cache when possible; only misses need admission
+    found, cached = agent.analysis_cache.get(symptom_set_key(symptoms))
+    if found:
+        return jsonify(cached)
+    with admission.admit("analyze", data.get('doctor_username', '').strip().lower(), data.get('session_id') or ""):
+        return jsonify(analyze_symptoms(symptoms))
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
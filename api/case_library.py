@@ -0,0 +1,347 @@
+"""On-disk library of pre-generated patient cases.
+
+    python api/case_library.py build --out api/data/cases --count 2000
+    python api/case_library.py build --out api/data/cases --from curated.jsonl
+    python api/case_library.py stats api/data/cases
+"""
+import os
+import sys
+import json
+import mmap
+import random
+import struct
+import asyncio
+import argparse
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from scoring import diagnosis_key
+
+# --- Case library ---
+# Two files per library: <path>.jsonl holds one case per line (each with its "domain"),
+# <path>.idx is a binary index over it. Both are memory-mapped on first use; a case is
+# only parsed when it is sampled, so startup cost does not grow with the library.
+#
+# .idx layout: MAGIC, u32 header length, JSON header, then one RECORD per case (byte
+# offset and length in the .jsonl, disease id) and a u32 case-id list grouped by disease.
+# Cases are sorted by (domain, sex, severity) and the header maps each such bucket and
+# each disease to a [start, end) range, so a filtered sample is one random index.
+
+CASE_LIBRARY_PATH = os.getenv("CASE_LIBRARY_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "cases")
+CASE_RECENT_PER_DOCTOR = int(os.getenv("CASE_RECENT_PER_DOCTOR", "20"))  # diseases a doctor will not see again soon
+
+MAGIC = b"ICAPPCL1"
+RECORD = struct.Struct("<QII")  # offset, length, disease id
+CASE_ID = struct.Struct("<I")
+SEVERITIES = ("mild", "moderate", "severe")
+SAMPLE_ATTEMPTS = 8  # random draws before recent-disease exclusion gives up
+
+
+def normalize_severity(value) -> str:
+    text = str(value or "").lower()
+    return next((s for s in SEVERITIES if s in text), "other")
+
+
+def normalize_sex(value) -> str:
+    text = str(value or "").strip().lower()
+    return text if text in ("male", "female") else "other"
+
+
+def write_library(path: str, entries: Iterable[Tuple[str, Dict]]) -> Dict:
+    """Write (domain, case) entries as a library at `path`. Returns the index header."""
+    rows = []
+    for domain, case in entries:
+        case = dict(case)
+        case.pop("domain", None)
+        rows.append((domain, normalize_sex(case.get("sex")), normalize_severity(case.get("severity")),
+                     diagnosis_key(case["disease"]), case))
+    rows.sort(key=lambda r: r[:4])
+
+    domains = sorted({r[0] for r in rows})
+    sexes = sorted({r[1] for r in rows})
+    severities = sorted({r[2] for r in rows})
+    disease_ids, disease_labels = {}, []
+    buckets = OrderedDict()
+    records = bytearray()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + ".jsonl.tmp", "wb") as f:
+        for i, (domain, sex, severity, key, case) in enumerate(rows):
+            line = json.dumps({"domain": domain, **case}, separators=(",", ":")).encode() + b"\n"
+            if key not in disease_ids:
+                disease_ids[key] = len(disease_labels)
+                disease_labels.append([key, case["disease"]])
+            records += RECORD.pack(f.tell(), len(line) - 1, disease_ids[key])
+            f.write(line)
+            bucket = (domains.index(domain), sexes.index(sex), severities.index(severity))
+            buckets.setdefault(bucket, [i, i])[1] = i + 1
+
+    by_disease = sorted(range(len(rows)), key=lambda i: (disease_ids[rows[i][3]], i))
+    diseases, start = [], 0
+    counts = Counter(disease_ids[r[3]] for r in rows)
+    for disease_id, (key, label) in enumerate(disease_labels):
+        diseases.append([key, label, start, start + counts[disease_id]])
+        start += counts[disease_id]
+    header = {
+        "version": 1,
+        "count": len(rows),
+        "domains": domains,
+        "sexes": sexes,
+        "severities": severities,
+        "buckets": [[*bucket, *span] for bucket, span in buckets.items()],
+        "diseases": diseases,
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    header_bytes += b" " * (-(len(MAGIC) + 4 + len(header_bytes)) % 8)
+    with open(path + ".idx.tmp", "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        f.write(records)
+        f.write(b"".join(CASE_ID.pack(i) for i in by_disease))
+    os.replace(path + ".jsonl.tmp", path + ".jsonl")
+    os.replace(path + ".idx.tmp", path + ".idx")
+    return header
+
+
+class CaseLibrary:
+    """Read-only, memory-mapped view of a library written by write_library()."""
+
+    def __init__(self, path: str = CASE_LIBRARY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._data = None
+        self._index = None
+        self.header = {"count": 0, "domains": [], "sexes": [], "severities": [], "buckets": [], "diseases": []}
+        self.served = 0
+        self._span_cache = {}
+
+    def __len__(self):
+        self._ensure_loaded()
+        return self.header["count"]
+
+    @property
+    def available(self) -> bool:
+        return len(self) > 0
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with open(self.path + ".idx", "rb") as f:
+                    index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                with open(self.path + ".jsonl", "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (FileNotFoundError, ValueError):
+                # Missing or empty files: run without a library (the hard-coded fallbacks remain)
+                self._loaded = True
+                return
+            if index[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{self.path}.idx is not a case library index")
+            (header_length,) = struct.unpack_from("<I", index, len(MAGIC))
+            start = len(MAGIC) + 4
+            self.header = json.loads(index[start:start + header_length])
+            self._records_at = start + header_length
+            self._by_disease_at = self._records_at + self.header["count"] * RECORD.size
+            self._disease_ids = {key: i for i, (key, _, _, _) in enumerate(self.header["diseases"])}
+            self._index, self._data = index, data
+            self._loaded = True
+
+    def case(self, case_id: int) -> Dict:
+        """Parse one case (its "domain" included) straight from the mapped .jsonl."""
+        offset, length, _ = RECORD.unpack_from(self._index, self._records_at + case_id * RECORD.size)
+        return json.loads(self._data[offset:offset + length])
+
+    def _disease_of(self, case_id: int) -> int:
+        return RECORD.unpack_from(self._index, self._records_at + case_id * RECORD.size)[2]
+
+    def _spans(self, domain: Optional[str], sex: Optional[str], severity: Optional[str]) -> List[Tuple[int, int]]:
+        """[start, end) ranges of the buckets matching the filters (None matches any)."""
+        wanted = [None if value is None else names.index(value) if value in names else -1
+                  for value, names in ((domain, self.header["domains"]), (sex, self.header["sexes"]),
+                                       (severity, self.header["severities"]))]
+        return [(start, end) for *bucket, start, end in self.header["buckets"]
+                if all(w is None or w == b for w, b in zip(wanted, bucket))]
+
+    def _candidates(self, domain, sex, severity) -> Tuple[List[Tuple[int, int]], int]:
+        """Matching spans and their total size, relaxing filters that match nothing. Memoized per filter."""
+        filters = (domain, sex, severity)
+        cached = self._span_cache.get(filters)
+        if cached is None:
+            spans = (self._spans(domain, sex, severity) or self._spans(domain, sex, None)
+                     or self._spans(domain, None, None) or self._spans(None, None, None))
+            cached = self._span_cache[filters] = (spans, sum(end - start for start, end in spans))
+        return cached
+
+    def sample(self, domain: Optional[str] = None, sex: Optional[str] = None, severity: Optional[str] = None,
+               disease: Optional[str] = None, exclude: Iterable[str] = (), rng=random) -> Optional[Dict]:
+        """A random case matching the filters, avoiding `exclude` disease keys when it can.
+
+        Filters that match nothing are relaxed (severity, then sex, then domain). Each
+        draw is O(1); exclusion retries up to SAMPLE_ATTEMPTS draws within the filters,
+        then as many over the whole library, then settles for the last draw.
+        """
+        if not self.available:
+            return None
+        if disease is not None:
+            disease_id = self._disease_ids.get(diagnosis_key(disease))
+            if disease_id is None:
+                return None
+            _, _, start, end = self.header["diseases"][disease_id]
+            (case_id,) = CASE_ID.unpack_from(self._index, self._by_disease_at + rng.randrange(start, end) * CASE_ID.size)
+            return self._serve(case_id)
+
+        excluded = {self._disease_ids[k] for k in exclude if k in self._disease_ids}
+        # Avoiding a recent disease matters more than the filters: widen to the whole library if needed
+        for spans, total in (self._candidates(domain, sex, severity), self._candidates(None, None, None)):
+            for _ in range(SAMPLE_ATTEMPTS):
+                case_id = self._draw(spans, total, rng)
+                if self._disease_of(case_id) not in excluded:
+                    return self._serve(case_id)
+        return self._serve(case_id)
+
+    @staticmethod
+    def _draw(spans: List[Tuple[int, int]], total: int, rng) -> int:
+        pick = rng.randrange(total)
+        for start, end in spans:
+            if pick < end - start:
+                return start + pick
+            pick -= end - start
+
+    def _serve(self, case_id: int) -> Dict:
+        case = self.case(case_id)
+        case.pop("domain", None)
+        self.served += 1
+        return case
+
+    def stats(self) -> Dict:
+        self._ensure_loaded()
+        return {
+            "path": self.path,
+            "cases": self.header["count"],
+            "domains": len(self.header["domains"]),
+            "diseases": len(self.header["diseases"]),
+            "served": self.served,
+        }
+
+
+# --- Recent cases ---
+
+class RecentCases:
+    """Per-doctor LRU of recently served diseases (disease key -> label), bounded in doctors too."""
+
+    def __init__(self, per_doctor: int = CASE_RECENT_PER_DOCTOR, max_doctors: int = 10000):
+        self.per_doctor = per_doctor
+        self.max_doctors = max_doctors
+        self._doctors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, doctor: str, disease: str):
+        if not doctor or self.per_doctor <= 0:
+            return
+        key = diagnosis_key(disease)
+        with self._lock:
+            recent = self._doctors.pop(doctor, None) or OrderedDict()
+            recent.pop(key, None)
+            recent[key] = disease
+            while len(recent) > self.per_doctor:
+                recent.popitem(last=False)
+            self._doctors[doctor] = recent
+            while len(self._doctors) > self.max_doctors:
+                self._doctors.popitem(last=False)
+
+    def get(self, doctor: str) -> Dict[str, str]:
+        """Disease key -> label for the doctor's recent cases, oldest first."""
+        with self._lock:
+            return dict(self._doctors.get(doctor) or {})
+
+
+# --- CLI ---
+
+def _dedup_key(case: Dict) -> tuple:
+    return diagnosis_key(case["disease"]), frozenset(s.strip().lower() for s in case["symptoms"])
+
+
+def _read_jsonl(paths: List[str]) -> List[Tuple[str, Dict]]:
+    entries = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    case = json.loads(line)
+                    entries.append((case.pop("domain", None) or "General Practice", case))
+    return entries
+
+
+async def _agenerate(count: int, max_per_disease: int, rounds: int) -> List[Tuple[str, Dict]]:
+    import agent
+
+    concurrency = agent.CASE_BATCH_CONCURRENCY or max(2, 2 * len(agent.API_KEYS))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def batch(profiles):
+        async with semaphore:
+            return profiles, await agent._agenerate_case_batch(profiles)
+
+    entries, seen, per_disease = [], set(), Counter()
+    for round_ in range(rounds):
+        missing = count - len(entries)
+        if missing <= 0:
+            break
+        profiles = agent._batch_profiles(missing)
+        chunks = [profiles[i:i + agent.CASE_BATCH_SIZE] for i in range(0, missing, agent.CASE_BATCH_SIZE)]
+        for profiles, cases in await asyncio.gather(*(batch(chunk) for chunk in chunks)):
+            for profile, case in zip(profiles, cases):
+                key = _dedup_key(case)
+                if key in seen or per_disease[key[0]] >= max_per_disease:
+                    continue
+                seen.add(key)
+                per_disease[key[0]] += 1
+                entries.append((profile["domain"], case))
+        print(f"round {round_ + 1}: {len(entries)}/{count} cases", file=sys.stderr)
+    return entries[:count]
+
+
+def build(args) -> int:
+    import agent
+
+    if args.from_files:
+        entries = _read_jsonl(args.from_files)
+    else:
+        if not agent.API_KEYS:
+            print("no GROQ API keys configured; use --from to build from existing cases", file=sys.stderr)
+            return 1
+        entries = agent.run_async(_agenerate(args.count, args.max_per_disease, args.rounds))
+    valid = [(domain, case) for domain, case in entries if agent.validate_patient_case(case)]
+    header = write_library(args.out, valid)
+    print(f"wrote {header['count']} cases ({len(entries) - len(valid)} invalid dropped), "
+          f"{len(header['diseases'])} diseases, {len(header['domains'])} domains -> {args.out}.jsonl/.idx")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the on-disk patient case library.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="generate (or import) and validate cases, then write the library")
+    build_parser.add_argument("--out", default=CASE_LIBRARY_PATH, help="library path without extension")
+    build_parser.add_argument("--count", type=int, default=2000)
+    build_parser.add_argument("--max-per-disease", type=int, default=25, help="cap on cases sharing one disease")
+    build_parser.add_argument("--rounds", type=int, default=20, help="generation rounds before giving up on --count")
+    build_parser.add_argument("--from", dest="from_files", nargs="+", help="JSONL case files to import instead of generating")
+    stats_parser = commands.add_parser("stats", help="summarize a library")
+    stats_parser.add_argument("path", nargs="?", default=CASE_LIBRARY_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        sys.exit(build(args))
+    library = CaseLibrary(args.path)
+    by_domain = Counter()
+    for domain, _, _, start, end in library.header["buckets"] if library.available else []:
+        by_domain[library.header["domains"][domain]] += end - start
+    print(json.dumps({**library.stats(), "by_domain": by_domain}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+from typing import Any, Dict, List, Tuple
+
+# Prompt token budget for a patient turn (system prompt + summary + history + new input)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Most recent doctor/patient exchanges always replayed verbatim (if they fit the budget)
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "6"))
+
+# Caps on what goes into the running summary so it stays small on long sessions
+SUMMARY_MAX_QUESTIONS = 12
+SUMMARY_QUESTION_CHARS = 80
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for Llama-family tokenizers)."""
+    return len(text) // 4 + 1
+
+
+def _message_tokens(message: Any) -> int:
+    # A few tokens of per-message overhead for role markers
+    return estimate_tokens(message.content) + 4
+
+
+def _split_turns(messages: List[Any]) -> List[List[Any]]:
+    """Group a flat message list into turns, each starting at a HumanMessage."""
+    turns = []
+    for m in messages:
+        if m.type == "human" or not turns:
+            turns.append([m])
+        else:
+            turns[-1].append(m)
+    return turns
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def summarize_state(state: Dict, summarized_turns: int) -> str:
+    """Compact summary of turns that no longer fit the window, built from tracked state fields."""
+    lines = [f"Earlier in this consultation ({summarized_turns} exchanges, summarized):"]
+    revealed = state.get("revealed_symptoms") or []
+    treatments = state.get("treatment_given") or []
+    questions = state.get("asked_questions") or []
+    lines.append("- Symptoms you already told the doctor about: " + (", ".join(revealed) if revealed else "none yet"))
+    lines.append("- Treatments the doctor proposed: " + (", ".join(treatments) if treatments else "none yet"))
+    if questions:
+        recent = questions[-SUMMARY_MAX_QUESTIONS:]
+        lines.append("- Questions the doctor already asked: " + " | ".join(_clip(q, SUMMARY_QUESTION_CHARS) for q in recent))
+    lines.append("Stay consistent with these facts.")
+    return "\n".join(lines)
+
+
+class ContextWindow:
+    """Bounded, token-budgeted view of a PatientState conversation.
+
+    The last `keep_turns` exchanges are replayed verbatim; anything older (or anything
+    that would push the prompt over `token_budget`) is folded into a running summary.
+    """
+
+    def __init__(self, token_budget: int = None, keep_turns: int = None):
+        self.token_budget = token_budget if token_budget is not None else CONTEXT_TOKEN_BUDGET
+        self.keep_turns = keep_turns if keep_turns is not None else CONTEXT_KEEP_TURNS
+
+    def build(self, system_prompt: str, state: Dict, user_input: str) -> Tuple[List[Any], Dict]:
+        """Return (messages, usage) for the next LLM call."""
+        from langchain_core.messages import SystemMessage, HumanMessage
+        system = SystemMessage(content=system_prompt)
+        latest = HumanMessage(content=user_input)
+        turns = _split_turns(state.get("messages") or [])
+
+        kept = turns[-self.keep_turns:] if self.keep_turns > 0 else []
+        kept_tokens = [sum(_message_tokens(m) for m in turn) for turn in kept]
+        fixed = _message_tokens(system) + _message_tokens(latest)
+
+        summary = None
+        summary_tokens = 0
+        while True:
+            summarized = len(turns) - len(kept)
+            if summarized:
+                summary = SystemMessage(content=summarize_state(state, summarized))
+                summary_tokens = _message_tokens(summary)
+            total = fixed + summary_tokens + sum(kept_tokens)
+            if total <= self.token_budget or not kept:
+                break
+            # Over budget: fold the oldest verbatim turn into the summary
+            kept.pop(0)
+            kept_tokens.pop(0)
+
+        messages = [system]
+        if summary is not None:
+            messages.append(summary)
+        for turn in kept:
+            messages.extend(turn)
+        messages.append(latest)
+
+        usage = {
+            "prompt_tokens": total,
+            "token_budget": self.token_budget,
+            "verbatim_turns": len(kept),
+            "summarized_turns": len(turns) - len(kept),
+        }
+        return messages, usage
+
+
+default_window = ContextWindow()
@@ -0,0 +1,169 @@
+import re
+import json
+from typing import Any, Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+# --- Envelope parsing ---
+# Every LLM call in the app expects one JSON object back (turn envelope, patient case,
+# differential). Models wrap it in code fences, prefix prose, truncate it or leave
+# trailing commas; parse_envelope() recovers the object in a single linear scan.
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```$")
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+class Envelope(NamedTuple):
+    value: Any              # parsed object, or None when nothing usable was found
+    repair: Optional[str]   # None for clean JSON, otherwise how it was recovered
+    span: Tuple[int, int]   # where the object sat in the (fence-stripped) text
+    text: str               # fence-stripped text the span refers to
+
+
+def strip_code_fence(text: str) -> str:
+    return _FENCE.sub("", text.strip()).strip()
+
+
+def iter_json_objects(text: str) -> Iterator[Tuple[int, int, bool]]:
+    """(start, end, closed) for each outermost balanced {...} object in text, in one pass.
+
+    Braces inside JSON strings are ignored, and stray unmatched "{" before the object
+    (prose, noise) do not hide it. An object still open at the end of the text is
+    reported last with closed=False so the caller can try closing it.
+    """
+    opened = []  # start offsets of currently open braces
+    spans = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            if opened:
+                in_string = True
+        elif ch == "{":
+            opened.append(i)
+        elif ch == "}" and opened:
+            start = opened.pop()
+            # Drop the objects nested inside this one; each offset is popped at most once
+            while spans and spans[-1][0] > start:
+                spans.pop()
+            spans.append((start, i + 1))
+    for start, end in spans:
+        yield start, end, True
+    if opened:
+        yield opened[0], len(text), False
+
+
+def _close(fragment: str, closers: List[str], in_string: bool, escaped: bool) -> str:
+    if escaped:
+        fragment = fragment[:-1]
+    if in_string:
+        fragment += '"'
+    fragment = fragment.rstrip().rstrip(",")
+    if fragment.endswith(":"):
+        fragment += " null"
+    return fragment + "".join(reversed(closers))
+
+
+def close_truncated(fragment: str) -> List[str]:
+    """Candidate completions for an object cut off mid-stream.
+
+    The first closes every open string, array and object as-is; the second drops the
+    member being written at the cut (a half-written key or literal) by backing up to
+    the last comma outside a string.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    last_comma, stack_at_comma = -1, []
+    for i, ch in enumerate(fragment):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+        elif ch == ",":
+            last_comma, stack_at_comma = i, list(stack)
+    candidates = [_close(fragment, stack, in_string, escaped)]
+    if last_comma > 0:
+        candidates.append(_close(fragment[:last_comma], stack_at_comma, False, False))
+    return candidates
+
+
+def _loads(fragment: str) -> Tuple[Any, bool]:
+    """json.loads, then once more with trailing commas removed. Returns (value, repaired)."""
+    try:
+        return json.loads(fragment), False
+    except ValueError:
+        pass
+    fixed = _TRAILING_COMMA.sub(r"\1", fragment)
+    if fixed != fragment:
+        try:
+            return json.loads(fixed), True
+        except ValueError:
+            pass
+    raise ValueError("not JSON")
+
+
+def parse_envelope(raw: str, validate: Optional[Callable[[Any], bool]] = None) -> Envelope:
+    """Recover the JSON object an LLM was asked for.
+
+    Tries the whole (fence-stripped) completion first, then each embedded object from
+    last to first, closing a truncated trailing object if needed. `validate` rejects
+    objects of the wrong shape (e.g. the schema example echoed before the real answer).
+    repair is one of: None, "code_fence", "trailing_comma", "embedded_json",
+    "truncated", or "unparsed" when nothing usable was found.
+    """
+    raw = raw or ""
+    fenced = raw.lstrip().startswith("```")
+    text = strip_code_fence(raw) if fenced else raw.strip()
+    ok = validate or (lambda value: isinstance(value, dict))
+
+    try:
+        value, fixed = _loads(text)
+        if ok(value):
+            repair = "trailing_comma" if fixed else ("code_fence" if fenced else None)
+            return Envelope(value, repair, (0, len(text)), text)
+    except (ValueError, RecursionError):
+        pass
+
+    for start, end, closed in reversed(list(iter_json_objects(text))):
+        fragment = text[start:end]
+        for candidate in ([fragment] if closed else close_truncated(fragment)):
+            try:
+                value, _ = _loads(candidate)
+            except (ValueError, RecursionError):
+                continue
+            if ok(value):
+                return Envelope(value, "embedded_json" if closed else "truncated", (start, end), text)
+    return Envelope(None, "unparsed", (0, 0), text)
+
+
+# --- Schemas ---
+
+def is_turn_envelope(value: Any) -> bool:
+    """A patient turn: {"reply_text": ..., "metadata": {...}} or a bare metadata object."""
+    if not isinstance(value, dict):
+        return False
+    if "reply_text" in value:
+        return isinstance(value["reply_text"], str) and isinstance(value.get("metadata", {}), dict)
+    return "metadata" in value and isinstance(value["metadata"], dict) or "revealed" in value
+
+
+def is_analysis(value: Any) -> bool:
+    """A differential: {"conditions": [{"name": ...}, ...]}."""
+    if not isinstance(value, dict) or not isinstance(value.get("conditions"), list):
+        return False
+    return all(isinstance(c, dict) and isinstance(c.get("name"), str) for c in value["conditions"])
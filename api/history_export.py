@@ -0,0 +1,121 @@
+"""Bulk export of finished sessions, with transcripts, across every doctor.
+
+    python api/history_export.py --out history.ndjson [--since 2026-09-01] [--until 2026-09-30]
+    python api/history_export.py --format columns --out history.columns.gz
+    python api/history_export.py --out history.2.ndjson --cursor <cursor of the last complete line>
+"""
+import sys
+import json
+import zlib
+import argparse
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from history_store import HistoryStore, create_history_store, decode_export_cursor
+
+# --- History export ---
+# Records stream from HistoryStore.export() through a formatter and an optional gzip
+# stage, all generators, so an export holds one query batch and one column block in
+# memory however much history there is. Every record (ndjson) or block (columns)
+# carries the cursor to resume after it.
+#
+#   ndjson    one JSON object per session: the history entry plus username, transcript
+#             and cursor
+#   columns   one JSON object per block of EXPORT_BLOCK_ROWS sessions:
+#             {"cursor", "rows", "columns": {name: [value per session]}}; gzipped by default
+
+EXPORT_FORMATS = ("ndjson", "columns")
+EXPORT_BLOCK_ROWS = 500
+EXPORT_COLUMNS = [
+    "username", "session_id", "timestamp", "status", "patient_name", "patient_sex", "patient_age",
+    "final_diagnosis", "prescriptions", "revealed_symptoms", "score", "transcript",
+]
+
+
+def ndjson_lines(records: Iterable[Tuple[str, Dict]]) -> Iterator[bytes]:
+    for cursor, record in records:
+        record["cursor"] = cursor
+        yield (json.dumps(record, separators=(",", ":")) + "\n").encode()
+
+
+def column_blocks(records: Iterable[Tuple[str, Dict]], block_rows: int = EXPORT_BLOCK_ROWS) -> Iterator[bytes]:
+    columns: Dict[str, List] = {name: [] for name in EXPORT_COLUMNS}
+    rows, cursor = 0, None
+
+    def block() -> bytes:
+        line = json.dumps({"cursor": cursor, "rows": rows, "columns": columns}, separators=(",", ":"))
+        return (line + "\n").encode()
+
+    for cursor, record in records:
+        for name in EXPORT_COLUMNS:
+            columns[name].append(record.get(name))
+        rows += 1
+        if rows == block_rows:
+            yield block()
+            columns = {name: [] for name in EXPORT_COLUMNS}
+            rows = 0
+    if rows:
+        yield block()
+
+
+def gzipped(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """One gzip member; the parts of a resumed export can be concatenated as they are."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def export_stream(store: HistoryStore, fmt: str = "ndjson", compress: Optional[bool] = None,
+                  cursor: Optional[str] = None, usernames: Optional[List[str]] = None, status: Optional[str] = None,
+                  since: Optional[str] = None, until: Optional[str] = None) -> Iterator[bytes]:
+    """Bytes of an export. compress defaults to on for columns, off for ndjson.
+
+    Arguments are checked before the generator is returned, so a bad format or cursor
+    raises ValueError here rather than halfway through a response.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    if cursor:
+        decode_export_cursor(cursor)
+    records = store.export(cursor=cursor, usernames=usernames, status=status, since=since, until=until)
+    chunks = ndjson_lines(records) if fmt == "ndjson" else column_blocks(records)
+    return gzipped(chunks) if (compress if compress is not None else fmt == "columns") else chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export every doctor's session history, with transcripts.")
+    parser.add_argument("--out", default="-", help="file to write, - for stdout")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+    parser.add_argument("--gzip", action=argparse.BooleanOptionalAction, default=None,
+                        help="compress the output (default: on for columns, off for ndjson)")
+    parser.add_argument("--cursor", help="resume after this cursor (the last one in an interrupted export)")
+    parser.add_argument("--username", action="append", help="only these doctors (repeatable)")
+    parser.add_argument("--status", help="only sessions with this status (e.g. abandoned)")
+    parser.add_argument("--since", help="ISO date or timestamp, inclusive")
+    parser.add_argument("--until", help="ISO date or timestamp, inclusive")
+    parser.add_argument("--db", help="history database (default: HISTORY_DB_PATH, as the app resolves it)")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.db) if args.db else create_history_store()
+    if store.path is None:
+        sys.exit("No history database: set HISTORY_DB_PATH (or SESSION_BACKEND=sqlite) or pass --db.")
+    try:
+        chunks = export_stream(store, args.format, args.gzip, args.cursor, args.username, args.status,
+                               args.since, args.until)
+    except ValueError as e:
+        sys.exit(str(e))
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    written = 0
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"{written:,} bytes written", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import os
+import json
+import base64
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# --- Doctor history ---
+# One row per finished session, clustered by (username, timestamp) so a page of a
+# doctor's history is a short index range scan regardless of how many sessions they ran.
+# The transcript sits in its own column: history pages never read it, exports do.
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+HISTORY_PAGE_MAX = 100
+HISTORY_EXPORT_BATCH = 500  # rows per query while exporting
+
+
+def encode_cursor(timestamp: str, session_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp}|{session_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        timestamp, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return timestamp, session_id
+
+
+def encode_export_cursor(username: str, timestamp: str, session_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([username, timestamp, session_id]).encode()).decode()
+
+
+def decode_export_cursor(cursor: str) -> Tuple[str, str, str]:
+    try:
+        username, timestamp, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return str(username), str(timestamp), str(session_id)
+
+
+def _filters(status: Optional[str], diagnosis: Optional[str], since: Optional[str],
+             until: Optional[str]) -> Tuple[List[str], List]:
+    where, params = [], []
+    if status:
+        where.append("status = ?")
+        params.append(status)
+    if diagnosis:
+        where.append("diagnosis LIKE ? ESCAPE '\\'")
+        escaped = diagnosis.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+    if since:
+        where.append("ts >= ?")
+        params.append(since)
+    if until:
+        where.append("ts <= ?")
+        # A bare date means the whole day
+        params.append(until + "T23:59:59.999999" if len(until) == 10 else until)
+    return where, params
+
+
+class HistoryStore:
+    """SQLite-backed history, newest first, with keyset (cursor) pagination.
+
+    path may be a file (shared by every worker on the host) or None for a private
+    in-memory database that lives as long as the process.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # An in-memory database exists per connection, so every thread shares one
+        self._shared = None if path else sqlite3.connect(":memory:", check_same_thread=False)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            " username TEXT NOT NULL, ts TEXT NOT NULL, session_id TEXT NOT NULL,"
+            " status TEXT, diagnosis TEXT, entry TEXT NOT NULL, transcript TEXT,"
+            " PRIMARY KEY (username, ts, session_id)) WITHOUT ROWID"
+        )
+        if "transcript" not in {row[1] for row in conn.execute("PRAGMA table_info(history)")}:
+            # Stores created before transcripts were kept
+            conn.execute("ALTER TABLE history ADD COLUMN transcript TEXT")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS history_session ON history (username, session_id)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._shared is not None:
+            return self._shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, username: str, entry: Dict, transcript: Optional[List[Dict]] = None):
+        """Insert (or replace) the entry for entry["session_id"], with its chat transcript."""
+        with self._lock:
+            self._write(
+                ("DELETE FROM history WHERE username = ? AND session_id = ?", (username, entry["session_id"])),
+                ("INSERT INTO history (username, ts, session_id, status, diagnosis, entry, transcript)"
+                 " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (username, entry["timestamp"], entry["session_id"], entry.get("status"),
+                  entry.get("final_diagnosis"), json.dumps(entry, separators=(",", ":")),
+                  json.dumps(transcript, separators=(",", ":")) if transcript is not None else None)),
+            )
+
+    def _write(self, *statements) -> int:
+        """Run statements in one transaction; returns the last one's rowcount."""
+        conn = self._conn()
+        changed = 0
+        for sql, params in statements:
+            changed = conn.execute(sql, params).rowcount
+        conn.commit()
+        return changed
+
+    def page(self, username: str, limit: int = HISTORY_PAGE_SIZE, cursor: Optional[str] = None,
+             status: Optional[str] = None, diagnosis: Optional[str] = None,
+             since: Optional[str] = None, until: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """One page of a doctor's history, newest first. Returns (entries, next_cursor).
+
+        diagnosis is a case-insensitive substring match; since/until are ISO timestamps
+        (or dates) bounding the session end time, inclusive.
+        """
+        limit = max(1, min(int(limit), HISTORY_PAGE_MAX))
+        where = ["username = ?"]
+        params = [username]
+        if cursor:
+            timestamp, session_id = decode_cursor(cursor)
+            where.append("(ts, session_id) < (?, ?)")
+            params += [timestamp, session_id]
+        filters, filter_params = _filters(status, diagnosis, since, until)
+        where += filters
+        params += filter_params
+        with self._lock:
+            rows = self._conn().execute(
+                f"SELECT ts, session_id, entry FROM history WHERE {' AND '.join(where)}"
+                " ORDER BY ts DESC, session_id DESC LIMIT ?",
+                params + [limit + 1],
+            ).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1][0], rows[limit - 1][1]) if len(rows) > limit else None
+        return [json.loads(row[2]) for row in rows[:limit]], next_cursor
+
+    def export(self, cursor: Optional[str] = None, usernames: Optional[Sequence[str]] = None,
+               status: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+               batch: int = HISTORY_EXPORT_BATCH) -> Iterator[Tuple[str, Dict]]:
+        """Every matching entry of every doctor, oldest first per doctor, with its transcript.
+
+        Yields (cursor, record) where record is the entry plus "username" and "transcript";
+        passing a yielded cursor back resumes right after that record. Rows are read
+        `batch` at a time, so memory does not grow with the size of the history.
+        """
+        where, params = _filters(status, None, since, until)
+        if usernames:
+            where.append(f"username IN ({', '.join('?' * len(usernames))})")
+            params += list(usernames)
+        position = decode_export_cursor(cursor) if cursor else None
+        while True:
+            keyset = ["(username, ts, session_id) > (?, ?, ?)"] if position else []
+            clause = " AND ".join(keyset + where) or "1"
+            with self._lock:
+                rows = self._conn().execute(
+                    f"SELECT username, ts, session_id, entry, transcript FROM history WHERE {clause}"
+                    " ORDER BY username, ts, session_id LIMIT ?",
+                    list(position or ()) + params + [batch],
+                ).fetchall()
+            for username, ts, session_id, entry, transcript in rows:
+                record = json.loads(entry)
+                record["username"] = username
+                record["transcript"] = json.loads(transcript) if transcript else []
+                yield encode_export_cursor(username, ts, session_id), record
+            if len(rows) < batch:
+                return
+            position = rows[-1][:3]
+
+    def delete(self, username: str, session_id: str) -> bool:
+        """Drop one entry via the (username, session_id) index."""
+        with self._lock:
+            return bool(self._write(("DELETE FROM history WHERE username = ? AND session_id = ?", (username, session_id))))
+
+    def clear(self, username: str) -> int:
+        with self._lock:
+            return self._write(("DELETE FROM history WHERE username = ?", (username,)))
+
+
+def create_history_store() -> HistoryStore:
+    """File-backed when HISTORY_DB_PATH (or the sqlite session backend) names a file, else in-memory."""
+    path = os.getenv("HISTORY_DB_PATH")
+    if not path and os.getenv("SESSION_BACKEND", "memory").lower() == "sqlite":
+        path = os.getenv("SESSION_DB_PATH", "icapp.db")
+    return HistoryStore(path or None)
@@ -0,0 +1,176 @@
+import re
+import json
+import random
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+from symptom_index import CONCEPTS, COMPOUNDS, get_symptom_index
+
+# --- Rule-based patient ---
+# Last tier of the model router: when every hosted model is down or over budget, the
+# patient is answered from the PatientCase itself. Replies are plain first-person text
+# in the same JSON envelope the LLM produces, so parsing and reveal detection are shared.
+
+_NAME = re.compile(r"\b(your name|who are you|call you|introduce yourself)\b")
+_AGE = re.compile(r"\b(how old|your age|age are you|date of birth|born)\b")
+_ONSET = re.compile(r"\b(when did|how long|since when|when was|start(?:ed)?|began|begin|first notice(?:d)?)\b")
+_SEVERITY = re.compile(r"\b(how bad|how severe|scale|rate (?:it|the)|out of (?:10|ten)|how much does it)\b")
+_OPEN = re.compile(r"\b(what brings|what seems|what's wrong|what is wrong|how can i help|tell me|how are you|"
+                   r"anything else|any other|other symptoms|what else|describe)\b")
+_TREATMENT = re.compile(r"\b(prescrib\w*|recommend\w*|i'?ll give you|take (?:some|this|these)|try (?:some|taking)|"
+                        r"start you on|you should (?:take|use|rest|drink))\b")
+
+
+@lru_cache(maxsize=None)
+def _any_symptom() -> re.Pattern:
+    """Any symptom vocabulary word; compiled on first use (a few hundred alternatives)."""
+    words = sorted({w for words in CONCEPTS.values() for w in words} | set(COMPOUNDS), key=len, reverse=True)
+    return re.compile(r"\b(" + "|".join(re.escape(w) for w in words) + r")s?\b")
+
+
+SEVERITY_SCORES = {"mild": 3, "moderate": 6, "severe": 8}
+
+
+def describe_age(age_range: str) -> str:
+    """'25-34' -> 'in my late twenties'."""
+    numbers = [int(n) for n in re.findall(r"\d+", age_range or "")]
+    if not numbers:
+        return "not sure I want to say"
+    age = sum(numbers[:2]) // len(numbers[:2])
+    if age < 20:
+        return f"{age}"
+    decades = {2: "twenties", 3: "thirties", 4: "forties", 5: "fifties", 6: "sixties", 7: "seventies", 8: "eighties"}
+    part = "early" if age % 10 < 4 else "mid" if age % 10 < 7 else "late"
+    return f"in my {part} {decades.get(age // 10, 'nineties')}"
+
+
+def describe_onset(days) -> str:
+    try:
+        days = int(days)
+    except (TypeError, ValueError):
+        return "a little while ago"
+    if days <= 1:
+        return "yesterday"
+    if days < 14:
+        return f"about {days} days ago"
+    if days < 60:
+        return f"about {round(days / 7)} weeks ago"
+    return "a few months ago"
+
+
+def _join(items: List[str]) -> str:
+    return items[0] if len(items) == 1 else ", ".join(items[:-1]) + " and " + items[-1]
+
+
+def answer(case: Dict, question: str, revealed: Iterable[str] = (), rng: Optional[random.Random] = None) -> Dict:
+    """{"reply_text", "metadata"} for one doctor question, answered from the case."""
+    rng = rng or random
+    q = " ".join(question.lower().split())
+    symptoms = case.get("symptoms") or []
+    revealed = set(revealed)
+    new = []
+    treatments = []
+
+    if _NAME.search(q):
+        reply = f"I'm {case.get('name', 'the patient')}."
+    elif _AGE.search(q):
+        reply = f"I'm {describe_age(case.get('age_range', ''))}."
+    elif _TREATMENT.search(q):
+        known = (case.get("correct_treatments") or []) + (case.get("incorrect_treatments") or [])
+        treatments = [t for t in known if isinstance(t, str) and t.lower() in q]
+        reply = rng.choice(["Okay, doctor, I can do that.", "Alright, I'll give that a try.", "Okay. How soon should I feel better?"])
+    elif _ONSET.search(q):
+        reply = f"It started {describe_onset(case.get('onset_days'))}."
+    elif _SEVERITY.search(q):
+        score = SEVERITY_SCORES.get(str(case.get("severity", "")).lower(), 5)
+        reply = f"I'd say about a {score} out of 10."
+    else:
+        asked = get_symptom_index(symptoms).scan(q)
+        if asked:
+            reply = f"Yes, I've had {_join(asked)}."
+            new = [s for s in asked if s not in revealed]
+        elif _any_symptom().search(q):
+            reply = rng.choice(["No, not that I've noticed.", "No, I don't think so.", "Not really, no."])
+        else:
+            hidden = [s for s in symptoms if s not in revealed]
+            if not revealed and case.get("presenting_summary"):
+                reply = case["presenting_summary"]
+            elif hidden and _OPEN.search(q):
+                reply = f"I've also noticed some {hidden[0]}."
+                new = [hidden[0]]
+            elif hidden:
+                reply = "I'm not sure what you mean, doctor. I just really don't feel well."
+            else:
+                reply = "I think I've told you everything, doctor."
+    return {
+        "reply_text": reply,
+        "metadata": {"revealed": new, "treatment_given": treatments, "needs_escalation": False, "status": "active"},
+    }
+
+
+def answer_json(case: Dict, question: str, revealed: Iterable[str] = ()) -> str:
+    return json.dumps(answer(case, question, revealed))
+
+
+# --- Fast path ---
+# Identity and demographic questions have one right answer in the case, so they are
+# answered here ahead of the LLM. classify() matches precompiled intent patterns and
+# scores how much of the question the match explains: greetings and politeness are
+# free, every other leftover word costs confidence, a symptom word or a second intent
+# ("what's your name and where does it hurt?") sinks it below any sensible threshold.
+
+_INTENTS = {
+    "name": re.compile(r"\b(?:what(?:'s| is) your (?:full |first )?name|your name|who are you|"
+                       r"who am i (?:speaking|talking) (?:to|with)|what should i call you|introduce yourself)\b"),
+    "age": re.compile(r"\b(?:how old are you|what(?:'s| is) your age|your age|age are you|when were you born|"
+                      r"(?:what(?:'s| is) )?your date of birth)\b"),
+    "sex": re.compile(r"\b(?:are you (?:a )?(?:male|female|man|woman)(?: or (?:a )?(?:male|female|man|woman))?|what(?:'s| is) your (?:sex|gender)|your (?:sex|gender))\b"),
+    "onset": re.compile(r"\b(?:when did (?:this|it|all this|this all|all of this|the problem|this problem|"
+                        r"(?:the|your) symptoms) (?:first )?(?:start|begin)|how long (?:has this been going on|"
+                        r"has it been going on|has this been happening|have you had this|have you had these symptoms|"
+                        r"have you been (?:feeling )?like this|ago did (?:this|it) (?:start|begin))|since when)\b"),
+}
+_FILLER = re.compile(r"\b(?:(?:i'?m|i am|my name is|this is) dr\.? \w+|nice to meet you|let'?s start|start with|to start|"
+                     r"first of all|first|tell me|thank you|thanks|good (?:morning|afternoon|evening)|hi|hello|hey|"
+                     r"ok(?:ay)?|so|well|please|doctor|sir|madam|ma'?am|can|could|may|i|ask|just|again|exactly|"
+                     r"roughly|approximately)\b")
+_WORD = re.compile(r"[a-z0-9']+")
+
+FAST_PATH_WORD_PENALTY = 0.1  # confidence lost per word the intent pattern and filler leave unexplained
+
+_FAST_REPLIES = {
+    "name": ["I'm {name}.", "My name is {name}.", "It's {name}, doctor."],
+    "age": ["I'm {age}.", "I'm {age}, doctor.", "Well, I'm {age}."],
+    "sex": ["I'm {sex}.", "I'm {sex}, doctor.", "{Sex}."],
+    "onset": ["It started {onset}.", "It all began {onset}.", "It came on {onset}."],
+}
+_SEX_WORDS = {"male": "a man", "female": "a woman"}
+
+
+def classify(question: str) -> tuple:
+    """(intent, confidence 0-1) for an identity/demographic question; (None, 0.0) otherwise."""
+    q = " ".join(question.lower().split())
+    found = [(intent, match) for intent, pattern in _INTENTS.items() for match in [pattern.search(q)] if match]
+    if len(found) != 1:
+        return None, 0.0
+    intent, match = found[0]
+    rest = _FILLER.sub(" ", q[:match.start()] + " " + q[match.end():])
+    if _any_symptom().search(rest):
+        return intent, 0.2
+    leftover = len(_WORD.findall(rest))
+    return intent, max(0.0, 1.0 - FAST_PATH_WORD_PENALTY * leftover)
+
+
+def fast_answer(case: Dict, intent: str, variant: int = 0) -> Dict:
+    """{"reply_text", "metadata"} for a classified intent. `variant` picks the phrasing;
+    keep it fixed per session so the patient always talks the same way."""
+    sex = _SEX_WORDS.get(str(case.get("sex", "")).lower())
+    if intent == "sex" and sex is None:
+        reply = "I'd rather not say, if that's alright."
+    else:
+        template = _FAST_REPLIES[intent][variant % len(_FAST_REPLIES[intent])]
+        reply = template.format(name=case.get("name", "the patient"), age=describe_age(case.get("age_range", "")),
+                                sex=sex, Sex=(sex or "").capitalize(), onset=describe_onset(case.get("onset_days")))
+    return {
+        "reply_text": reply,
+        "metadata": {"revealed": [], "treatment_given": [], "needs_escalation": False, "status": "active"},
+    }
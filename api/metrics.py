@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterable, Tuple
+
+# --- Structured logging ---
+# One JSON object per line; session_id is attached automatically from the current context.
+
+session_id_var = contextvars.ContextVar("session_id", default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "event": record.getMessage(),
+        }
+        session_id = getattr(record, "session_id", None) or session_id_var.get()
+        if session_id:
+            payload["session_id"] = session_id
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+logger = logging.getLogger("icapp")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(JsonFormatter())
+    logger.addHandler(_handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    logger.log(level, event, extra={"fields": fields})
+
+
+# --- Metrics ---
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(n, "")) for n in self.labels), 0)
+
+    def total(self, **labels) -> float:
+        """Sum over every series matching the given labels (the others are summed over)."""
+        wanted = [(i, str(labels[n])) for i, n in enumerate(self.labels) if n in labels]
+        with self._lock:
+            return sum(v for key, v in self._values.items() if all(key[i] == value for i, value in wanted))
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_label_str(self.labels, key)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_label_str(self.labels, key, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_label_str(self.labels, key, le)} {series[-1]}"
+            yield f"{self.name}_sum{_label_str(self.labels, key)} {series[-2]}"
+            yield f"{self.name}_count{_label_str(self.labels, key)} {series[-1]}"
+
+
+REQUEST_SECONDS = Histogram("icapp_http_request_seconds", "HTTP request latency by endpoint.", ["endpoint", "status"])
+TURN_STAGE_SECONDS = Histogram("icapp_turn_stage_seconds", "Time spent in each stage of a patient turn.", ["stage"])
+LLM_SECONDS = Histogram("icapp_llm_request_seconds", "LLM call latency.", ["model", "key", "outcome"])
+LLM_TOKENS = Counter("icapp_llm_tokens_total", "Tokens sent to / received from the LLM.", ["model", "key", "kind"])
+FALLBACKS = Counter("icapp_fallback_total", "Canned fallbacks served instead of a model answer.", ["kind"])
+PARSE_REPAIRS = Counter("icapp_parse_repair_total", "Model outputs that needed repair before use.", ["source", "kind"])
+MODEL_TIER_CALLS = Counter("icapp_model_tier_total", "Calls per model tier by outcome (ok, timeout, error, skipped).", ["tier", "outcome"])
+TURN_PATHS = Counter("icapp_turns_total", "Patient turns by who answered them (fast_path or llm) and fast-path intent.", ["path", "intent"])
+ADMISSIONS = Counter("icapp_admission_total", "Admission decisions by request kind and outcome (admitted, queued, or why it was refused).", ["kind", "outcome"])
+ADMISSION_WAIT_SECONDS = Histogram("icapp_admission_wait_seconds", "Time admitted requests spent queued for a slot.", ["kind"])
+HEDGES = Counter("icapp_llm_hedge_total", "Hedged LLM calls by primary model and outcome (sent, won, lost, denied_rate, denied_cost).", ["model", "outcome"])
+
+REGISTRY = [REQUEST_SECONDS, TURN_STAGE_SECONDS, LLM_SECONDS, LLM_TOKENS, FALLBACKS, PARSE_REPAIRS, MODEL_TIER_CALLS, TURN_PATHS,
+            ADMISSIONS, ADMISSION_WAIT_SECONDS, HEDGES]
+
+
+def stage(name: str):
+    """Time one stage of a turn: `with stage("llm"): ...`."""
+    return TURN_STAGE_SECONDS.time(stage=name)
+
+
+def render_prometheus(extra: Dict[str, float] = None) -> str:
+    """Prometheus text exposition of every registered metric, plus optional plain gauges."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    typed = set()
+    for name, value in (extra or {}).items():
+        base = name.split("{", 1)[0]
+        if base not in typed:
+            typed.add(base)
+            lines.append(f"# TYPE {base} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,144 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Flight:
+    """A computation in progress that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResponseCache:
+    """LRU + TTL cache with single-flight coalescing.
+
+    get_or_compute() returns a cached value, joins an identical computation already in
+    flight, or runs `compute` itself. compute returns (value, cacheable) so fallback
+    responses (e.g. "analysis unavailable") are returned but never stored.
+    """
+
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._hit_latency = deque(maxlen=self.LATENCY_SAMPLES)
+        self._miss_latency = deque(maxlen=self.LATENCY_SAMPLES)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _lookup_locked(self, key: Hashable, now: float) -> Tuple[bool, Any]:
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires_at, value = item
+        if expires_at < now:
+            del self._data[key]
+            self.expirations += 1
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def _store_locked(self, key: Hashable, value: Any, now: float):
+        self._data[key] = (now + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """(found, value) without computing; a miss is left for get_or_compute to count."""
+        start = time.perf_counter()
+        with self._lock:
+            found, value = self._lookup_locked(key, time.monotonic())
+            if found:
+                self.hits += 1
+                self._hit_latency.append(time.perf_counter() - start)
+            return found, value
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Tuple[Any, bool]]) -> Any:
+        start = time.perf_counter()
+        with self._lock:
+            found, value = self._lookup_locked(key, time.monotonic())
+            if found:
+                self.hits += 1
+                self._hit_latency.append(time.perf_counter() - start)
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value, cacheable = compute()
+            flight.value = value
+            with self._lock:
+                if cacheable:
+                    self._store_locked(key, value, time.monotonic())
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                self._miss_latency.append(time.perf_counter() - start)
+            flight.done.set()
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    @staticmethod
+    def _summary_us(samples) -> Dict:
+        if not samples:
+            return {"count": 0}
+        ordered = sorted(samples)
+        return {
+            "count": len(ordered),
+            "p50_us": round(ordered[len(ordered) // 2] * 1e6, 1),
+            "p99_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1e6, 1),
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_latency": self._summary_us(list(self._hit_latency)),
+                "miss_latency": self._summary_us(list(self._miss_latency)),
+            }
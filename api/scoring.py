@@ -0,0 +1,246 @@
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from symptom_index import get_symptom_index, stem
+
+# --- Aliases ---
+# Canonical term -> other ways trainees write it. Matching happens on canonical tokens,
+# so "acetaminophen", "Tylenol" and "paracetamol" all score as the same treatment.
+
+DIAGNOSIS_ALIASES = {
+    "common cold": ["cold", "head cold", "coryza", "upper respiratory infection", "upper respiratory tract infection", "uri", "urti", "viral uri", "rhinovirus", "nasopharyngitis"],
+    "influenza": ["flu", "the flu", "influenza a", "influenza b"],
+    "pharyngitis": ["sore throat", "strep throat", "streptococcal pharyngitis", "throat infection"],
+    "tonsillitis": ["tonsil infection", "inflamed tonsils"],
+    "gastroenteritis": ["stomach flu", "stomach bug", "gastro", "tummy bug", "food poisoning", "norovirus", "rotavirus"],
+    "migraine": ["migraine headache", "migraines"],
+    "tension headache": ["tension type headache", "tension-type headache", "stress headache"],
+    "pneumonia": ["chest infection", "lung infection", "lower respiratory tract infection", "lrti"],
+    "bronchitis": ["chest cold"],
+    "sinusitis": ["sinus infection", "rhinosinusitis"],
+    "otitis media": ["ear infection", "middle ear infection"],
+    "urinary tract infection": ["uti", "bladder infection", "cystitis"],
+    "conjunctivitis": ["pink eye"],
+    "ankle sprain": ["sprained ankle", "twisted ankle", "rolled ankle"],
+    "fracture": ["broken bone", "break", "broken"],
+    "concussion": ["mild traumatic brain injury", "mtbi"],
+    "allergic rhinitis": ["hay fever", "seasonal allergies", "allergies"],
+    "asthma": ["asthma attack", "asthma exacerbation"],
+    "gastroesophageal reflux disease": ["gerd", "acid reflux", "reflux", "heartburn"],
+    "appendicitis": ["inflamed appendix"],
+    "cellulitis": ["skin infection"],
+    "dehydration": ["volume depletion"],
+    "covid 19": ["covid", "coronavirus", "sars cov 2"],
+    "mononucleosis": ["mono", "glandular fever", "infectious mononucleosis", "ebv"],
+    "anxiety": ["panic attack", "anxiety attack", "generalized anxiety"],
+}
+
+TREATMENT_ALIASES = {
+    "paracetamol": ["acetaminophen", "tylenol", "panadol", "calpol"],
+    "ibuprofen": ["advil", "motrin", "nurofen", "brufen", "nsaid", "nsaids", "anti inflammatory", "anti inflammatories"],
+    "naproxen": ["aleve", "naprosyn"],
+    "aspirin": ["asa", "acetylsalicylic acid"],
+    "rest": ["bed rest", "resting", "take it easy", "time off"],
+    "hydration": ["fluids", "drink fluids", "drink water", "drink plenty of fluids", "plenty of fluids", "increase fluids", "stay hydrated", "water"],
+    "oral rehydration solution": ["ors", "oral rehydration", "oral rehydration salts", "rehydration salts", "dioralyte", "pedialyte", "electrolyte solution", "electrolytes"],
+    "antibiotics": ["antibiotic", "amoxicillin", "amoxil", "augmentin", "co amoxiclav", "penicillin", "azithromycin", "zithromax", "z pack", "doxycycline", "ciprofloxacin", "cipro", "cephalexin", "keflex", "clarithromycin", "erythromycin", "nitrofurantoin", "trimethoprim"],
+    "antivirals": ["antiviral", "oseltamivir", "tamiflu", "acyclovir", "paxlovid"],
+    "antihistamines": ["antihistamine", "cetirizine", "zyrtec", "loratadine", "claritin", "fexofenadine", "allegra", "diphenhydramine", "benadryl"],
+    "opioids": ["opioid", "opiates", "morphine", "oxycodone", "codeine", "tramadol", "hydrocodone", "fentanyl"],
+    "surgery": ["operation", "surgical repair", "surgical intervention"],
+    "ice": ["ice pack", "cold compress", "icing"],
+    "compression": ["compression bandage", "elastic bandage", "tubigrip"],
+    "elevation": ["elevate", "elevate the leg", "elevate the ankle", "raise the leg"],
+    "rice": ["rest ice compression elevation"],
+    "stress management": ["stress reduction", "relaxation", "relaxation techniques", "reduce stress", "mindfulness", "meditation"],
+    "salt water gargles": ["salt water gargle", "saltwater gargle", "warm salt water", "gargle", "gargling"],
+    "inhaler": ["salbutamol", "albuterol", "ventolin", "bronchodilator", "reliever inhaler"],
+    "steroids": ["steroid", "corticosteroids", "prednisolone", "prednisone", "dexamethasone"],
+    "antacids": ["antacid", "gaviscon", "tums", "rennie"],
+    "proton pump inhibitor": ["ppi", "omeprazole", "lansoprazole", "pantoprazole", "esomeprazole", "nexium"],
+    "decongestant": ["decongestants", "pseudoephedrine", "sudafed", "nasal spray", "saline spray"],
+    "immobilization": ["cast", "splint", "sling", "immobilisation", "immobilise", "immobilize"],
+}
+
+# Words that qualify a diagnosis or treatment without changing what it is
+QUALIFIERS = {
+    "acute", "chronic", "mild", "moderate", "severe", "viral", "simple", "uncomplicated", "likely", "probable",
+    "possible", "suspected", "probably", "maybe", "episode", "case", "of", "a", "an", "the", "with", "some", "and",
+    "take", "give", "prescribe", "start", "use", "regular", "daily", "as", "needed", "prn", "mg", "tablets", "tablet",
+    "dose", "over", "counter", "otc", "for", "to", "plenty", "lots", "more", "in", "on", "patient", "advise", "advised",
+    "recommend", "recommended", "should", "please", "try", "oral", "by", "mouth", "immediately", "x", "times", "day",
+}
+
+# Qualifiers that announce a subtype ("type 2", "stage 3"): dropped, the subtype after them kept
+SUBTYPE_MARKERS = {"type", "stage", "grade", "class"}
+
+FUZZY_RATIO = 0.85  # SequenceMatcher ratio for a misspelt token to still count ("gastroentritis")
+FUZZY_MIN_LENGTH = 5  # shorter words must match exactly
+
+SCORE_WEIGHTS = {"diagnosis": 50, "treatment": 30, "discovery": 20}
+HARMFUL_TREATMENT_PENALTY = 10  # points off the treatment score per incorrect treatment given
+
+_SPLIT_ITEMS = re.compile(r"[,;/\n+&]|\band\b|\bplus\b|\bthen\b|\balso\b")
+_SPLIT_CANDIDATES = re.compile(r"[,;/\n]|\bor\b|\bvs\b|\bversus\b")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+# A candidate diagnosis or prescription item that opens with one of these is excluded, not given
+_NEGATED = re.compile(r"^\s*(?:not|no|avoid|without|do not|don t|dont|rule out|ruled out|r o)\b")
+_RULE_OUT = re.compile(r"\br\s*/\s*o\b")  # "r/o" must not be split on its slash
+
+
+def _build_alias_pattern(*tables: Dict[str, List[str]]) -> Tuple[re.Pattern, Dict[str, str]]:
+    to_canonical = {}
+    for table in tables:
+        for canonical, aliases in table.items():
+            for phrase in [canonical] + aliases:
+                to_canonical.setdefault(_NON_WORD.sub(" ", phrase.lower()).strip(), canonical)
+    alternatives = sorted(to_canonical, key=len, reverse=True)
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(a) for a in alternatives) + r")\b")
+    return pattern, to_canonical
+
+
+@lru_cache(maxsize=None)
+def _alias_pattern(kind: str) -> Tuple[re.Pattern, Dict[str, str]]:
+    # Compiled on first use rather than at import: these alternations are large
+    return _build_alias_pattern(DIAGNOSIS_ALIASES if kind == "diagnosis" else TREATMENT_ALIASES)
+
+
+def _is_subtype(word: str) -> bool:
+    return word.isdigit() or len(word) == 1
+
+@lru_cache(maxsize=8192)
+def _terms(text: str, kind: str) -> FrozenSet[str]:
+    """Canonical tokens of a diagnosis or treatment phrase.
+
+    A numeral or single letter right after a kept word or a SUBTYPE_MARKERS word is a
+    subtype ("type 2 diabetes", "hepatitis a") and is kept even when it is also a
+    qualifier ("a", "x"); anywhere else it is dropped like a qualifier.
+    """
+    pattern, canonical = _alias_pattern(kind)
+    text = " " + _NON_WORD.sub(" ", text.lower()) + " "
+    text = pattern.sub(lambda m: " " + canonical[m.group(0)] + " ", text)
+    terms, previous_kept = [], False
+    for word in text.split():
+        keep = (previous_kept and _is_subtype(word)) or (
+            word not in QUALIFIERS and word not in SUBTYPE_MARKERS and not _is_subtype(word))
+        if keep:
+            terms.append(word if _is_subtype(word) else stem(word))
+        previous_kept = (keep and not _is_subtype(word)) or word in SUBTYPE_MARKERS
+    return frozenset(terms)
+
+
+def _subtypes(terms: FrozenSet[str]) -> FrozenSet[str]:
+    return frozenset(t for t in terms if _is_subtype(t))
+
+
+@lru_cache(maxsize=65536)
+def _similar(a: str, b: str) -> bool:
+    if len(a) < FUZZY_MIN_LENGTH or len(b) < FUZZY_MIN_LENGTH or abs(len(a) - len(b)) > 3:
+        return False
+    matcher = SequenceMatcher(None, a, b)
+    return matcher.real_quick_ratio() >= FUZZY_RATIO and matcher.ratio() >= FUZZY_RATIO
+
+
+def _coverage(expected: FrozenSet[str], given: FrozenSet[str]) -> float:
+    """Fraction of the expected terms present in the given ones, allowing small typos.
+
+    A different subtype ("type 1" for "type 2") is a different condition: no credit.
+    """
+    if not expected or not given:
+        return 0.0
+    expected_subtypes, given_subtypes = _subtypes(expected), _subtypes(given)
+    if expected_subtypes and given_subtypes and not expected_subtypes & given_subtypes:
+        return 0.0
+    hits = 0
+    for term in expected:
+        if term in given or any(_similar(term, g) for g in given):
+            hits += 1
+    return hits / len(expected)
+
+
+def diagnosis_key(disease: str) -> str:
+    """Canonical form of a disease name: "Acute Viral Gastroenteritis" and "gastroenteritis (viral)" agree."""
+    return " ".join(sorted(_terms(disease, "diagnosis")))
+
+
+def match_diagnosis(expected: str, given: str) -> Tuple[str, float]:
+    """("exact" | "partial" | "none", credit 0-1). Listing several candidates splits the credit."""
+    target = _terms(expected, "diagnosis")
+    given = _RULE_OUT.sub("rule out", given.lower())
+    # "not pneumonia" or "rule out strep" names what it isn't; it neither scores nor splits the credit
+    candidates = [c for c in _SPLIT_CANDIDATES.split(given) if c.strip() and not _is_negated(c)]
+    if not target or not candidates:
+        return "none", 0.0
+    best = max(_coverage(target, _terms(c, "diagnosis")) for c in candidates)
+    if best >= 1.0:
+        match = "exact"
+    elif best >= 0.5:
+        match = "partial"
+    else:
+        return "none", 0.0
+    return match, best / len(candidates)
+
+
+def _is_negated(phrase: str) -> bool:
+    return bool(_NEGATED.match(_NON_WORD.sub(" ", phrase.lower())))
+
+
+def split_treatments(prescriptions: str, treatment_given: Iterable[str] = ()) -> List[str]:
+    """Prescribed items, lower-cased; items that withhold a treatment ("no antibiotics") are dropped."""
+    prescriptions = _RULE_OUT.sub("rule out", prescriptions.lower())
+    items = [i.strip() for i in _SPLIT_ITEMS.split(prescriptions) if i.strip() and not _is_negated(i)]
+    for t in treatment_given:
+        if isinstance(t, str) and t.strip() and t.strip().lower() not in items and not _is_negated(t):
+            items.append(t.strip().lower())
+    return items
+
+
+def _best_treatment(item: FrozenSet[str], options: List[Tuple[str, FrozenSet[str]]]) -> Tuple[Optional[str], float]:
+    best, best_score = None, 0.0
+    for name, terms in options:
+        score = _coverage(terms, item)
+        if score > best_score:
+            best, best_score = name, score
+    return best, best_score
+
+
+def score_session(patient_case: Dict, final_diagnosis: str = "", prescriptions: str = "",
+                  revealed_symptoms: Iterable[str] = (), treatment_given: Iterable[str] = ()) -> Dict:
+    """Deterministic 0-100 grade for a finished session (diagnosis 50, treatment 30, discovery 20)."""
+    # Diagnosis
+    match, credit = match_diagnosis(patient_case.get("disease", ""), final_diagnosis or "")
+    diagnosis_score = round(SCORE_WEIGHTS["diagnosis"] * credit, 1)
+
+    # Treatment: credit for each correct treatment covered, penalty for each harmful one
+    correct = [(t, _terms(t, "treatment")) for t in patient_case.get("correct_treatments", []) if isinstance(t, str)]
+    incorrect = [(t, _terms(t, "treatment")) for t in patient_case.get("incorrect_treatments", []) if isinstance(t, str)]
+    matched_correct, matched_incorrect = set(), set()
+    for item in split_treatments(prescriptions or "", treatment_given):
+        terms = _terms(item, "treatment")
+        good, good_score = _best_treatment(terms, correct)
+        bad, bad_score = _best_treatment(terms, incorrect)
+        if bad_score >= 0.5 and bad_score > good_score:
+            matched_incorrect.add(bad)
+        elif good_score >= 0.5:
+            matched_correct.add(good)
+    treatment_score = SCORE_WEIGHTS["treatment"] * len(matched_correct) / len(correct) if correct else 0.0
+    treatment_score = max(0.0, treatment_score - HARMFUL_TREATMENT_PENALTY * len(matched_incorrect))
+
+    # Discovery: case symptoms the trainee got the patient to mention
+    symptoms = [s for s in patient_case.get("symptoms", []) if isinstance(s, str)]
+    found = set(get_symptom_index(symptoms).canonicalize(revealed_symptoms)) & set(symptoms)
+    discovery_score = SCORE_WEIGHTS["discovery"] * len(found) / len(symptoms) if symptoms else 0.0
+
+    total = diagnosis_score + treatment_score + discovery_score
+    return {
+        "total": round(total),
+        "diagnosis": {"score": diagnosis_score, "max": SCORE_WEIGHTS["diagnosis"], "match": match,
+                      "expected": patient_case.get("disease", "")},
+        "treatment": {"score": round(treatment_score, 1), "max": SCORE_WEIGHTS["treatment"],
+                      "correct": sorted(matched_correct), "incorrect": sorted(matched_incorrect),
+                      "missed": sorted(t for t, _ in correct if t not in matched_correct)},
+        "discovery": {"score": round(discovery_score, 1), "max": SCORE_WEIGHTS["discovery"],
+                      "found": len(found), "total": len(symptoms)},
+    }
@@ -0,0 +1,209 @@
+import sys
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# --- Session model ---
+# A session keeps one list of turns. The LLM context (`messages`) and the readable
+# transcript (`chat_history`) are both derived from it on demand, and revealed symptoms
+# are small integer ids into the case's symptom table rather than repeated strings.
+# Both classes list their __slots__ by hand (dataclass(slots=True) needs Python 3.10), so
+# the dataclass only supplies repr and eq and each class writes its own __init__.
+
+
+@dataclass(init=False)
+class Turn:
+    __slots__ = ("doctor", "patient", "revealed", "treatments", "failed")
+    doctor: str
+    patient: str
+    revealed: Tuple[int, ...]  # symptom ids newly revealed this turn
+    treatments: Tuple[str, ...]
+    failed: bool  # LLM call failed; shown to the doctor but never replayed to the model
+
+    def __init__(self, doctor: str, patient: str, revealed: Tuple[int, ...] = (),
+                 treatments: Tuple[str, ...] = (), failed: bool = False):
+        self.doctor = doctor
+        self.patient = patient
+        self.revealed = revealed
+        self.treatments = treatments
+        self.failed = failed
+
+
+def _intern(values: Iterable[Any]) -> Tuple[str, ...]:
+    return tuple(sys.intern(v.strip()) for v in values if isinstance(v, str) and v.strip())
+
+
+@dataclass(init=False)
+class Session:
+    __slots__ = ("session_id", "patient_case", "doctor_username", "status", "turns", "revealed",
+                 "extra_symptoms", "created_at", "last_active")
+    session_id: str
+    patient_case: Dict
+    doctor_username: str
+    status: str
+    turns: List[Turn]
+    revealed: List[int]  # ids in reveal order
+    extra_symptoms: List[str]  # revealed names outside the case table
+    created_at: float
+    last_active: float
+
+    def __init__(self, session_id: str, patient_case: Dict, doctor_username: str = "", status: str = "active",
+                 turns: Optional[List[Turn]] = None, revealed: Optional[List[int]] = None,
+                 extra_symptoms: Optional[List[str]] = None, created_at: Optional[float] = None,
+                 last_active: Optional[float] = None):
+        now = time.time()
+        self.session_id = session_id
+        self.patient_case = patient_case
+        self.doctor_username = doctor_username
+        self.status = status
+        self.turns = turns if turns is not None else []
+        self.revealed = revealed if revealed is not None else []
+        self.extra_symptoms = extra_symptoms if extra_symptoms is not None else []
+        self.created_at = created_at if created_at is not None else now
+        self.last_active = last_active if last_active is not None else now
+
+    # Read access by key, so code written against the PatientState dict keeps working
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    # --- Symptom table ---
+
+    @property
+    def symptom_table(self) -> List[str]:
+        return self.patient_case.get("symptoms") or []
+
+    def symptom_name(self, symptom_id: int) -> str:
+        table = self.symptom_table
+        if symptom_id < len(table):
+            return table[symptom_id]
+        return self.extra_symptoms[symptom_id - len(table)]
+
+    def symptom_id(self, name: str) -> int:
+        table = self.symptom_table
+        if name in table:
+            return table.index(name)
+        if name not in self.extra_symptoms:
+            self.extra_symptoms.append(sys.intern(name))
+        return len(table) + self.extra_symptoms.index(name)
+
+    # --- Derived views ---
+
+    @property
+    def revealed_symptoms(self) -> List[str]:
+        return [self.symptom_name(i) for i in self.revealed]
+
+    @property
+    def asked_questions(self) -> List[str]:
+        return [t.doctor for t in self.turns if not t.failed]
+
+    @property
+    def treatment_given(self) -> List[str]:
+        seen = []
+        for t in self.turns:
+            seen.extend(x for x in t.treatments if x not in seen)
+        return seen
+
+    @property
+    def messages(self) -> List[Any]:
+        """LLM context: each answered turn as a doctor message plus a compact patient envelope."""
+        from langchain_core.messages import HumanMessage, AIMessage
+        out = []
+        for t in self.turns:
+            if t.failed:
+                continue
+            envelope = {"reply_text": t.patient, "metadata": {"revealed": [self.symptom_name(i) for i in t.revealed]}}
+            out.append(HumanMessage(content=t.doctor))
+            out.append(AIMessage(content=json.dumps(envelope, separators=(",", ":"))))
+        return out
+
+    @property
+    def chat_history(self) -> List[Dict]:
+        out = []
+        for t in self.turns:
+            out.append({"role": "doctor", "text": t.doctor})
+            out.append({"role": "patient", "text": t.patient})
+        return out
+
+    # --- Updates ---
+
+    def record_turn(self, doctor: str, result: Dict) -> Turn:
+        """Fold a process_turn/stream_turn result into the session."""
+        meta = result.get("metadata") or {}
+        new_ids = []
+        for name in meta.get("revealed") or []:
+            if isinstance(name, str) and name:
+                symptom_id = self.symptom_id(name)
+                if symptom_id not in self.revealed:
+                    self.revealed.append(symptom_id)
+                    new_ids.append(symptom_id)
+        treatments = meta.get("treatment_given") or []
+        turn = Turn(
+            doctor=doctor,
+            patient=result["reply"],
+            revealed=tuple(new_ids),
+            treatments=_intern(treatments if isinstance(treatments, list) else [treatments]),
+            failed=bool(result.get("failed")),
+        )
+        self.turns.append(turn)
+        if isinstance(meta.get("status"), str):
+            self.status = sys.intern(meta["status"])
+        self.last_active = time.time()
+        return turn
+
+    # --- Serialization ---
+
+    def to_record(self) -> Dict:
+        """Plain-JSON form for the shared session backends."""
+        return {
+            "session_id": self.session_id,
+            "doctor_username": self.doctor_username,
+            "patient_case": self.patient_case,
+            "status": self.status,
+            "revealed": self.revealed,
+            "extra_symptoms": self.extra_symptoms,
+            "turns": [[t.doctor, t.patient, list(t.revealed), list(t.treatments), int(t.failed)] for t in self.turns],
+            "created_at": self.created_at,
+            "last_active": self.last_active,
+        }
+
+    @classmethod
+    def from_record(cls, record: Dict) -> "Session":
+        if "turns" not in record:
+            return cls.from_legacy(record)
+        return cls(
+            session_id=record["session_id"],
+            patient_case=record["patient_case"],
+            doctor_username=record.get("doctor_username", ""),
+            status=record.get("status", "active"),
+            turns=[Turn(d, p, tuple(r), tuple(tr), bool(f)) for d, p, r, tr, f in record["turns"]],
+            revealed=list(record.get("revealed") or []),
+            extra_symptoms=list(record.get("extra_symptoms") or []),
+            created_at=record.get("created_at") or time.time(),
+            last_active=record.get("last_active") or time.time(),
+        )
+
+    @classmethod
+    def from_legacy(cls, state: Dict) -> "Session":
+        """Rebuild a session stored in the old dict layout (messages + chat_history)."""
+        session = cls(
+            session_id=state["session_id"],
+            patient_case=state["patient_case"],
+            doctor_username=state.get("doctor_username", ""),
+            status=state.get("status", "active"),
+        )
+        chat = state.get("chat_history") or []
+        for doctor, patient in zip(chat[::2], chat[1::2]):
+            session.turns.append(Turn(doctor["text"], patient["text"]))
+        for name in state.get("revealed_symptoms") or []:
+            symptom_id = session.symptom_id(name)
+            if symptom_id not in session.revealed:
+                session.revealed.append(symptom_id)
+        return session
+
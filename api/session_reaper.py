@@ -0,0 +1,140 @@
+import os
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from metrics import log_event
+
+# --- Idle-session reaper ---
+# Sessions left open in a closed tab never reach /api/end. Every session's idle deadline
+# sits in a min-heap keyed on last activity; a daemon thread sleeps until the earliest
+# deadline and hands expired sessions to a callback that marks them abandoned.
+# The heap top is also the least recently active session, which is what gets evicted
+# when the hard cap is reached.
+
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+
+
+class SessionReaper:
+    """Tracks last activity per session and expires idle (or excess) sessions.
+
+    on_expire(session_id, reason) is called outside the lock with reason "idle" or
+    "capacity". It may return a newer last-activity time (another worker served the
+    session) to reschedule instead of expiring.
+    """
+
+    def __init__(self, on_expire: Callable[[str, str], Optional[float]], idle_ttl: float = SESSION_IDLE_TTL,
+                 max_sessions: Optional[int] = None, clock=time.time):
+        self.on_expire = on_expire
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self._heap = []  # (last_active, session_id); superseded entries are skipped lazily
+        self._last_active = {}  # session_id -> last_active of its live heap entry
+        self._lock = threading.Lock()
+        self._thread = None
+        self.expired = {"idle": 0, "capacity": 0}
+        self.rescheduled = 0
+
+    def __len__(self):
+        return len(self._last_active)
+
+    def ensure_started(self):
+        if self._thread is not None or not self.idle_ttl:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="session-reaper", daemon=True)
+                self._thread.start()
+
+    def touch(self, session_id: str, last_active: Optional[float] = None):
+        """Record activity; evicts the least recently active sessions beyond max_sessions."""
+        last_active = last_active if last_active is not None else self.clock()
+        with self._lock:
+            previous = self._last_active.get(session_id)
+            self._last_active[session_id] = last_active
+            heapq.heappush(self._heap, (last_active, session_id))
+            # Rebuild once stale entries dominate, so the heap stays O(live sessions)
+            if len(self._heap) > 2 * len(self._last_active) + 64:
+                self._heap = [(t, s) for s, t in self._last_active.items()]
+                heapq.heapify(self._heap)
+            over = self._pop_over_capacity() if previous is None else []
+        self._expire(over, "capacity")
+
+    def forget(self, session_id: str):
+        """Stop tracking a session that ended normally."""
+        with self._lock:
+            self._last_active.pop(session_id, None)
+
+    def _pop_live(self) -> Optional[Tuple[float, str]]:
+        """Pop the least recently active live entry (lock held)."""
+        while self._heap:
+            last_active, session_id = heapq.heappop(self._heap)
+            if self._last_active.get(session_id) == last_active:
+                del self._last_active[session_id]
+                return last_active, session_id
+        return None
+
+    def _pop_over_capacity(self) -> List[str]:
+        over = []
+        while self.max_sessions and len(self._last_active) > self.max_sessions:
+            over.append(self._pop_live()[1])
+        return over
+
+    def _pop_idle(self, now: float) -> List[str]:
+        idle = []
+        while self._heap and self._heap[0][0] + self.idle_ttl <= now:
+            entry = self._pop_live()
+            if entry is None:
+                break
+            if entry[0] + self.idle_ttl > now:
+                # The live entry is newer than the stale ones ahead of it; put it back
+                self._last_active[entry[1]] = entry[0]
+                heapq.heappush(self._heap, entry)
+                break
+            idle.append(entry[1])
+        return idle
+
+    def _expire(self, session_ids: List[str], reason: str):
+        for session_id in session_ids:
+            newer = self.on_expire(session_id, reason)
+            if newer is not None and reason == "idle":
+                self.rescheduled += 1
+                self.touch(session_id, newer)
+            else:
+                self.expired[reason] += 1
+
+    def reap(self, now: Optional[float] = None) -> int:
+        """Expire every session idle for longer than idle_ttl; returns how many were handed off."""
+        with self._lock:
+            idle = self._pop_idle(now if now is not None else self.clock())
+        self._expire(idle, "idle")
+        return len(idle)
+
+    def next_deadline(self) -> Optional[float]:
+        with self._lock:
+            return self._heap[0][0] + self.idle_ttl if self._heap else None
+
+    def _run(self):
+        while True:
+            # A session touched from now on cannot expire before now + idle_ttl
+            deadline = self.next_deadline()
+            timeout = self.idle_ttl if deadline is None else max(0.0, deadline - self.clock())
+            time.sleep(min(timeout, 60.0))
+            try:
+                self.reap()
+            except Exception as e:
+                # A failing callback must not kill the thread
+                log_event("session_reap_failed", logging.ERROR, error=str(e))
+                time.sleep(1.0)
+
+    def stats(self) -> Dict:
+        return {
+            "tracked": len(self._last_active),
+            "idle_ttl_s": self.idle_ttl,
+            "max_sessions": self.max_sessions,
+            "expired_idle": self.expired["idle"],
+            "expired_capacity": self.expired["capacity"],
+            "rescheduled": self.rescheduled,
+        }
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from session_model import Session
+
+# --- Message serialization ---
+# LangChain message objects are stored as compact [role, content] pairs. Only legacy
+# session dicts still carry them, so langchain_core is imported when one turns up.
+
+_ROLE_BY_TYPE = {"human": "h", "ai": "a", "system": "s"}
+
+
+def serialize_messages(messages: List[Any]) -> List[List[str]]:
+    return [[_ROLE_BY_TYPE.get(m.type, "h"), m.content] for m in messages]
+
+
+def deserialize_messages(rows: List[List[str]]) -> List[Any]:
+    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+    types = {"h": HumanMessage, "a": AIMessage, "s": SystemMessage}
+    return [types[role](content=content) for role, content in rows]
+
+
+def encode_value(value: Any) -> str:
+    """JSON-encode a Session or doctor dict (legacy session dicts have their messages compacted)."""
+    if isinstance(value, Session):
+        value = {"_session": value.to_record()}
+    elif "messages" in value:
+        value = dict(value, messages=serialize_messages(value["messages"]))
+    return json.dumps(value, separators=(",", ":"))
+
+
+def decode_value(raw) -> Any:
+    value = json.loads(raw)
+    if "_session" in value:
+        return Session.from_record(value["_session"])
+    if "messages" in value:
+        # Written before the compact session model; upgrade on read
+        return Session.from_legacy(value)
+    return value
+
+
+# --- Backends ---
+
+class SessionStore:
+    """Keyed store for session state and doctor accounts.
+
+    Handlers load a value with get(), mutate it, and write it back with set(), so any
+    worker process can serve any session when a shared backend is configured.
+    """
+
+    def get(self, key: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store with LRU eviction and an idle TTL (refreshed on every set)."""
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while self.max_entries and len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Single-file store shared by every worker on the same host."""
+
+    PURGE_EVERY = 500  # writes between sweeps of expired rows
+
+    def __init__(self, path: str, namespace: str, ttl: Optional[float] = None):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at >= ?)",
+            (self.namespace, key, time.time()),
+        ).fetchone()
+        return decode_value(row[0]) if row else None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, encode_value(value), expires_at),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+
+    def delete(self, key):
+        conn = self._conn()
+        conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key))
+        conn.commit()
+
+
+class RedisSessionStore(SessionStore):
+    """Store backed by any client speaking the redis-py API (redis.Redis, fakeredis.FakeRedis)."""
+
+    def __init__(self, client: Any, namespace: str, ttl: Optional[float] = None):
+        self.client = client
+        self.namespace = namespace
+        self.ttl = int(ttl) if ttl else None
+
+    def _key(self, key: str) -> str:
+        return f"icapp:{self.namespace}:{key}"
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        return decode_value(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set(self._key(key), encode_value(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+    def __contains__(self, key):
+        return bool(self.client.exists(self._key(key)))
+
+
+# --- Factory ---
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "icapp.db")
+
+
+def create_store(namespace: str, ttl: Optional[float] = None, max_entries: Optional[int] = None) -> SessionStore:
+    """Build the store configured by SESSION_BACKEND (memory | sqlite | redis)."""
+    if SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(SESSION_DB_PATH, namespace, ttl=ttl)
+    if SESSION_BACKEND == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis).")
+        return RedisSessionStore(redis.Redis.from_url(os.environ["REDIS_URL"]), namespace, ttl=ttl)
+    return MemorySessionStore(ttl=ttl, max_entries=max_entries)
@@ -0,0 +1,225 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+# --- Vocabulary ---
+# Surface words/phrases mapped to a shared concept, so "my throat is sore",
+# "sore throat" and "throat hurts" all reduce to {throat, pain}.
+
+CONCEPTS = {
+    "pain": ["pain", "painful", "ache", "aching", "achy", "hurt", "hurts", "hurting", "sore", "soreness",
+             "tender", "tenderness", "throbbing", "burning", "stabbing"],
+    "head": ["head", "forehead", "temple", "temples"],
+    "abdomen": ["stomach", "belly", "tummy", "abdomen", "abdominal", "gut"],
+    "throat": ["throat"],
+    "chest": ["chest"],
+    "back": ["back", "spine"],
+    "neck": ["neck"],
+    "ear": ["ear"],
+    "tooth": ["tooth", "teeth"],
+    "joint": ["joint", "knee", "ankle", "wrist", "elbow", "shoulder", "hip"],
+    "muscle": ["muscle", "muscles", "body"],
+    "eye": ["eye", "eyes"],
+    "skin": ["skin"],
+    "nose": ["nose", "nasal"],
+    "runny": ["runny", "running", "drip", "dripping", "streaming"],
+    "congestion": ["congestion", "congested", "stuffy", "blocked", "bunged"],
+    "sneeze": ["sneeze", "sneezing"],
+    "cough": ["cough", "coughing"],
+    "fever": ["fever", "feverish", "temperature", "febrile"],
+    "chill": ["chill", "chills", "shiver", "shivering", "shivery"],
+    "sweat": ["sweat", "sweats", "sweating", "sweaty"],
+    "fatigue": ["fatigue", "tired", "tiredness", "exhausted", "exhaustion", "weary", "drained", "worn out", "no energy"],
+    "weak": ["weak", "weakness"],
+    "nausea": ["nausea", "nauseous", "nauseated", "queasy", "sick to my stomach"],
+    "vomit": ["vomit", "vomiting", "vomited", "throw up", "throwing up", "threw up", "puke", "puking"],
+    "diarrhea": ["diarrhea", "diarrhoea", "loose stool", "loose stools", "the runs"],
+    "constipation": ["constipation", "constipated"],
+    "cramp": ["cramp", "cramps", "cramping", "spasm", "spasms"],
+    "bloat": ["bloat", "bloated", "bloating"],
+    "dizzy": ["dizzy", "dizziness", "lightheaded", "light headed", "light-headed", "vertigo", "spinning"],
+    "faint": ["faint", "fainting", "fainted", "passed out", "blackout"],
+    "breath": ["breath", "breathing", "breathe", "breathless", "breathlessness", "winded"],
+    "short": ["short", "shortness", "hard", "difficult", "difficulty", "trouble"],
+    "wheeze": ["wheeze", "wheezing", "wheezy"],
+    "rash": ["rash", "spots", "hives", "blotches", "bumps"],
+    "itch": ["itch", "itchy", "itching", "itchiness"],
+    "red": ["red", "redness", "inflamed", "flushed"],
+    "swell": ["swell", "swelling", "swollen", "puffy", "puffiness", "lump"],
+    "gland": ["gland", "glands", "lymph", "nodes"],
+    "swallow": ["swallow", "swallowing"],
+    "bleed": ["bleed", "bleeding", "blood", "bloody"],
+    "bruise": ["bruise", "bruising", "bruised"],
+    "numb": ["numb", "numbness", "tingling", "pins and needles"],
+    "stiff": ["stiff", "stiffness", "tight", "tightness", "tense"],
+    "sensitive": ["sensitive", "sensitivity", "bother", "bothers", "bothering", "bothered", "can't stand"],
+    "light": ["light", "bright", "brightness", "photophobia"],
+    "noise": ["noise", "noises", "sound", "sounds", "loud"],
+    "appetite": ["appetite", "hungry", "eating"],
+    "sleep": ["sleep", "sleeping", "insomnia", "awake"],
+    "urinate": ["urinate", "urination", "urinating", "pee", "peeing", "wee"],
+    "frequent": ["frequent", "frequently", "often", "constantly", "all the time"],
+    "vision": ["vision", "sight", "seeing", "blurry", "blurred"],
+    "heartbeat": ["heartbeat", "palpitations", "palpitation", "racing heart", "heart racing", "pounding heart"],
+    "limp": ["limp", "limping"],
+    "move": ["move", "moving", "movement", "walk", "walking", "bear weight"],
+    "thirst": ["thirst", "thirsty"],
+    "dry": ["dry", "dryness", "parched"],
+    "mouth": ["mouth", "lips"],
+    "wound": ["wound", "cut", "gash", "laceration"],
+    "discharge": ["discharge", "pus", "oozing"],
+    "confusion": ["confusion", "confused", "foggy", "disoriented"],
+    "weight": ["weight"],
+    "loss": ["loss", "lost", "losing", "lack", "poor"],
+}
+
+# Compound words that stand for several concepts
+COMPOUNDS = {
+    "headache": ("head", "pain"), "headaches": ("head", "pain"),
+    "migraine": ("head", "pain"), "migraines": ("head", "pain"),
+    "stomachache": ("abdomen", "pain"), "bellyache": ("abdomen", "pain"),
+    "backache": ("back", "pain"), "toothache": ("tooth", "pain"), "earache": ("ear", "pain"),
+    "heartburn": ("chest", "pain"),
+}
+
+# Descriptors that refine a symptom but are not required to reveal it
+MODIFIERS = {
+    "mild", "moderate", "severe", "slight", "slightly", "dull", "sharp", "constant", "persistent",
+    "occasional", "intermittent", "chronic", "acute", "watery", "high", "low", "grade", "low-grade",
+    "sudden", "gradual", "general", "generalized", "generalised", "extreme", "intense", "minor",
+    "productive", "dry", "recurring", "frequent", "localized", "left", "right", "upper", "lower",
+}
+
+STOPWORDS = {"a", "an", "the", "of", "in", "on", "to", "and", "or", "with", "my", "at", "from", "for", "when", "around", "over", "is"}
+
+NEGATIONS = ["no", "not", "don't", "dont", "doesn't", "haven't", "hasn't", "never", "without", "isn't", "aren't", "nothing like"]
+NEGATION_WINDOW = 12  # characters between a negation and the word it cancels
+
+_SURFACE_TO_CONCEPT = {}
+for _concept, _forms in CONCEPTS.items():
+    for _form in _forms:
+        _SURFACE_TO_CONCEPT.setdefault(_form, _concept)
+
+_WORD = re.compile(r"[a-z0-9']+(?:-[a-z0-9']+)*")
+
+
+def stem(word: str) -> str:
+    """Light suffix stripping for words outside the vocabulary."""
+    for suffix in ("iness", "ness", "ing", "ies", "es", "ed", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            base = word[: -len(suffix)]
+            return base + "y" if suffix in ("ies", "iness") else base
+    return word
+
+
+def _concepts_for_word(word: str) -> Tuple[str, ...]:
+    if word in COMPOUNDS:
+        return COMPOUNDS[word]
+    if word in _SURFACE_TO_CONCEPT:
+        return (_SURFACE_TO_CONCEPT[word],)
+    stemmed = stem(word)
+    if stemmed in COMPOUNDS:
+        return COMPOUNDS[stemmed]
+    return (_SURFACE_TO_CONCEPT.get(stemmed, stemmed),)
+
+
+def symptom_concepts(symptom: str) -> frozenset:
+    """Concepts that must all be mentioned for a symptom to count as revealed."""
+    text = symptom.lower()
+    concepts, optional = set(), set()
+    # Multi-word vocabulary entries first ("shortness of breath" has no such entry, "throw up" does)
+    for phrase, concept in _SURFACE_TO_CONCEPT.items():
+        if " " in phrase and phrase in text:
+            concepts.add(concept)
+            text = text.replace(phrase, " ")
+    for word in _WORD.findall(text):
+        if word in STOPWORDS:
+            continue
+        target = optional if word in MODIFIERS else concepts
+        target.update(_concepts_for_word(word))
+    return frozenset(concepts or optional)
+
+
+class SymptomIndex:
+    """Per-case reveal detector: every surface form of the case's symptom concepts compiled
+    into one regex, so detection is a single pass over the reply."""
+
+    def __init__(self, symptoms: Iterable[str]):
+        self.symptoms = list(symptoms)
+        self.requirements = [symptom_concepts(s) for s in self.symptoms]
+        needed = set().union(*self.requirements) if self.requirements else set()
+
+        surfaces = {}
+        for surface, concept in _SURFACE_TO_CONCEPT.items():
+            if concept in needed:
+                surfaces[surface] = (concept,)
+        for word, concepts in COMPOUNDS.items():
+            if needed.intersection(concepts):
+                surfaces[word] = concepts
+        # Concepts with no vocabulary entry are matched on their own stem
+        for concept in needed:
+            if concept not in CONCEPTS and concept not in surfaces:
+                surfaces[concept] = (concept,)
+        self._surfaces = surfaces
+
+        alternatives = sorted(surfaces, key=len, reverse=True)
+        words = "|".join(re.escape(s) + r"(?:s|es|ed|ing)?" for s in alternatives) or r"(?!x)x"
+        negations = "|".join(re.escape(n) for n in NEGATIONS)
+        self._pattern = re.compile(
+            rf"(?P<brk>[.!?;]+)|(?P<comma>,)|\b(?P<neg>{negations})\b|\b(?P<word>{words})\b",
+            re.IGNORECASE,
+        )
+
+    def _lookup(self, surface: str) -> Tuple[str, ...]:
+        surface = surface.lower()
+        if surface in self._surfaces:
+            return self._surfaces[surface]
+        for suffix in ("ing", "es", "ed", "s"):
+            if surface.endswith(suffix) and surface[: -len(suffix)] in self._surfaces:
+                return self._surfaces[surface[: -len(suffix)]]
+        return ()
+
+    def scan(self, text: str) -> List[str]:
+        """Case symptoms mentioned in `text`, in case order."""
+        if not text or not self.requirements:
+            return []
+        sentences = [set()]
+        last_negation = -NEGATION_WINDOW - 1
+        for match in self._pattern.finditer(text):
+            if match.group("brk"):
+                sentences.append(set())
+                last_negation = -NEGATION_WINDOW - 1
+            elif match.group("comma"):
+                # A clause break ends the negation scope but not the sentence
+                last_negation = -NEGATION_WINDOW - 1
+            elif match.group("neg"):
+                last_negation = match.end()
+            elif match.start() - last_negation > NEGATION_WINDOW:
+                sentences[-1].update(self._lookup(match.group("word")))
+        found = []
+        for symptom, required in zip(self.symptoms, self.requirements):
+            if required and any(required <= concepts for concepts in sentences):
+                found.append(symptom)
+        return found
+
+    def canonicalize(self, mentions: Iterable[str]) -> List[str]:
+        """Map free-text symptom names (e.g. from LLM metadata) onto case symptoms where possible."""
+        result = []
+        for mention in mentions:
+            if not isinstance(mention, str):
+                continue
+            matched = self.scan(mention)
+            for symptom in matched or [mention]:
+                if symptom not in result:
+                    result.append(symptom)
+        return result
+
+
+@lru_cache(maxsize=4096)
+def _cached_index(symptoms: Tuple[str, ...]) -> SymptomIndex:
+    return SymptomIndex(symptoms)
+
+
+def get_symptom_index(symptoms: Iterable[str]) -> SymptomIndex:
+    """Index for a case's symptom list, built once per process and reused every turn."""
+    return _cached_index(tuple(symptoms))
@@ -0,0 +1,149 @@
+"""Chat latency, degraded replies and shedding for a class-wide burst, with and without admission.
+
+A class of doctors each chats with a patient (one turn every few seconds, each followed
+by an /api/analyze miss) while one trainee scripts the chat: --trainee-threads loops on
+one session, each firing a turn every --trainee-think seconds. The fake
+provider shares a fixed concurrency among its calls, so every call slows down once
+more than --capacity are in flight, as Groq does under load. Each mode runs through
+the Flask app for --duration seconds:
+
+  none        no admission (no queue, no rate limits), what the app did before
+  admission   per-doctor/session token buckets, a bounded priority queue, deadlines
+
+Prints per request kind: count, answered by a model, degraded (local patient or the
+"analysis unavailable" fallback), shed with 429/503 + Retry-After, other errors, and
+p50/p99 latency of everything that was not shed. The trainee's 429s are listed apart.
+
+    python benchmarks/bench_admission.py [--doctors 40] [--duration 20] [--capacity 4]
+"""
+import time
+import random
+import asyncio
+import argparse
+import threading
+from collections import defaultdict
+from langchain_core.messages import AIMessage
+
+from fake_llm import FakeChatModel, install
+import agent
+import app as app_module
+from admission import AdmissionController
+
+
+class SharedCapacityModel(FakeChatModel):
+    """Calls take `median` (lognormal) each, stretched by in_flight / capacity when overloaded."""
+
+    def __init__(self, median, capacity, seed):
+        super().__init__()
+        self.median = median
+        self.capacity = capacity
+        self.in_flight = 0
+        self._rng = random.Random(seed)
+
+    async def ainvoke(self, messages, **kwargs):
+        self.in_flight += 1
+        try:
+            load = max(1.0, self.in_flight / self.capacity)
+            await asyncio.sleep(self._rng.lognormvariate(0, 0.4) * self.median * load)
+            return AIMessage(content=self.respond(messages))
+        finally:
+            self.in_flight -= 1
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def run(mode, args):
+    model = SharedCapacityModel(args.median, args.capacity, args.seed)
+    install(agent, model)
+    agent.LOCAL_FAST_PATH = False
+    agent.analysis_cache.clear()
+    client = app_module.app.test_client()
+    if mode == "none":
+        app_module.admission = AdmissionController(10 ** 6, 0, doctor_rate=0, session_rate=0, start_rate=0)
+    else:
+        app_module.admission = AdmissionController(args.capacity)
+
+    doctors = [f"doc{i}" for i in range(args.doctors)] + ["trainee"]
+    sessions = {}
+    for doctor in doctors:
+        sessions[doctor] = client.post("/api/start", json={"doctor_username": doctor}).json["session_id"]
+
+    results = defaultdict(list)  # kind -> [(outcome, seconds, doctor)]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+
+    def call(kind, doctor, path, body):
+        start = time.perf_counter()
+        response = client.post(path, json=body)
+        elapsed = time.perf_counter() - start
+        if response.status_code in (429, 503):
+            assert response.headers.get("Retry-After")
+            outcome = "shed"
+        elif response.status_code != 200:
+            outcome = "error"
+        elif kind == "chat":
+            outcome = "degraded" if response.json["usage"].get("model") in ("local", None) else "model"
+        else:
+            outcome = "degraded" if response.json == agent.ANALYSIS_UNAVAILABLE else "model"
+        with lock:
+            results[kind].append((outcome, elapsed, doctor))
+
+    def doctor_loop(doctor, seed):
+        rng = random.Random(seed)
+        turn = 0
+        if doctor != "trainee":
+            time.sleep(rng.uniform(0, args.think))
+        while time.monotonic() < stop_at:
+            turn += 1
+            call("chat", doctor, "/api/message", {"session_id": sessions[doctor], "message": f"Where does it hurt? ({turn})"})
+            if doctor == "trainee":
+                time.sleep(args.trainee_think)
+            else:
+                symptoms = [f"symptom {doctor} {turn}", "sore throat"]
+                threading.Thread(target=call, args=("analyze", doctor, "/api/analyze", {"symptoms": symptoms}),
+                                 daemon=True).start()
+                time.sleep(rng.uniform(args.think / 2, args.think * 1.5))
+
+    threads = [threading.Thread(target=doctor_loop, args=(d, args.seed + i)) for i, d in enumerate(doctors)]
+    threads += [threading.Thread(target=doctor_loop, args=("trainee", 0)) for _ in range(args.trainee_threads - 1)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    time.sleep(agent.LLM_DEADLINE)  # let trailing analyze calls finish
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--doctors", type=int, default=40)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load per mode")
+    parser.add_argument("--think", type=float, default=10.0, help="mean seconds between a doctor's turns")
+    parser.add_argument("--trainee-think", type=float, default=0.3, help="seconds between the trainee's turns")
+    parser.add_argument("--trainee-threads", type=int, default=4, help="concurrent turn loops in the trainee's script")
+    parser.add_argument("--median", type=float, default=0.8, help="median provider latency when not overloaded")
+    parser.add_argument("--capacity", type=int, default=4, help="provider calls that run at full speed")
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.doctors} doctors (one turn per ~{args.think:.0f}s, each followed by /api/analyze) + 1 trainee "
+          f"script ({args.trainee_threads} loops, every {args.trainee_think:.1f}s); provider capacity {args.capacity}, median {args.median:.1f}s, {args.duration:.0f}s per mode")
+    print(f"{'mode':<10} {'kind':<8} {'requests':>8} {'model':>7} {'degraded':>9} {'shed':>6} {'error':>6} "
+          f"{'p50 s':>6} {'p99 s':>6} {'trainee 429':>12}")
+    for mode in ("none", "admission"):
+        results = run(mode, args)
+        for kind in ("chat", "analyze"):
+            rows = results[kind]
+            count = lambda outcome: sum(1 for o, _, _ in rows if o == outcome)
+            served = [s for o, s, _ in rows if o != "shed"]
+            trainee = [o for o, _, d in rows if d == "trainee"]
+            trainee_shed = f"{trainee.count('shed')}/{len(trainee)}" if trainee else "-"
+            print(f"{mode:<10} {kind:<8} {len(rows):>8} {count('model'):>7} {count('degraded'):>9} {count('shed'):>6} "
+                  f"{count('error'):>6} {percentile(served, 0.5):>6.2f} {percentile(served, 0.99):>6.2f} {trainee_shed:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""/api/analyze cache: repeat-lookup latency and single-flight coalescing.
+
+    python benchmarks/bench_analyze_cache.py --latency 0.3 --concurrent 50
+"""
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_llm import FakeChatModel, install
+import agent
+
+SYMPTOMS = ["sore throat", "fever", "swollen glands", "painful swallowing", "runny nose", "cough"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--concurrent", type=int, default=50, help="identical requests fired at once")
+    parser.add_argument("--lookups", type=int, default=20000, help="repeat lookups for the hit-path timing")
+    args = parser.parse_args()
+
+    model = install(agent, FakeChatModel(latency=args.latency))
+    agent.analysis_cache.clear()
+
+    # Single-flight: N identical cold requests, different orderings/casing
+    variants = [random.sample(SYMPTOMS[:3], 3) for _ in range(args.concurrent)]
+    variants = [[s.upper() if i % 2 else s for s in v] for i, v in enumerate(variants)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrent) as pool:
+        list(pool.map(agent.analyze_symptoms, variants))
+    cold = time.perf_counter() - start
+    print(f"{args.concurrent} concurrent identical requests: {cold:.2f}s wall, {model.calls} LLM call(s)")
+
+    # Hit path
+    start = time.perf_counter()
+    for i in range(args.lookups):
+        agent.analyze_symptoms(variants[i % len(variants)])
+    per_hit = (time.perf_counter() - start) / args.lookups
+    print(f"repeat lookups: {per_hit * 1e6:.1f} us each (vs {args.latency * 1000:.0f} ms per LLM call)")
+    print(json.dumps(agent.analysis_cache.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Wall time to start a whole class: N x /api/start vs one /api/start/batch.
+
+Case generation goes to a fake model with a fixed per-request latency, so the numbers
+show request fan-out rather than Groq's mood. The case pool is disabled so every case
+is generated on demand.
+
+    python benchmarks/bench_batch_start.py [--students 60] [--latency 0.8] [--keys 3]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_llm import FakeChatModel, install
+
+import agent
+agent.case_pool.high = 0
+import app as app_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.8, help="seconds per LLM request")
+    parser.add_argument("--keys", type=int, default=3)
+    args = parser.parse_args()
+
+    model = FakeChatModel(latency=args.latency)
+    install(agent, models_by_key={f"key-{i}": model for i in range(args.keys)})
+    client = app_module.app.test_client()
+
+    start = time.perf_counter()
+    for _ in range(args.students):
+        client.post("/api/start", json={})
+    sequential = time.perf_counter() - start
+    sequential_calls = model.calls
+
+    start = time.perf_counter()
+    body = client.post("/api/start/batch", json={"count": args.students}).get_json()
+    batch = time.perf_counter() - start
+    batch_calls = model.calls - sequential_calls
+
+    names = {s["patient"]["name"] for s in body["sessions"]}
+    print(f"{args.students} students, {args.keys} keys, {args.latency:.2f}s per LLM request")
+    print(f"{'mode':<12} {'wall s':>8} {'LLM calls':>10}")
+    print(f"{'sequential':<12} {sequential:>8.2f} {sequential_calls:>10}")
+    print(f"{'batch':<12} {batch:>8.2f} {batch_calls:>10}")
+    print(f"batch returned {body['count']} sessions, {len(names)} distinct patients; speedup {sequential / batch:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Case library startup, sampling cost and per-doctor repeats vs a parsed in-memory list.
+
+Writes a synthetic library of N cases (variants of the fallback cases spread over
+domains, sexes and D distinct diseases), then compares:
+
+  startup   parsing every case into dicts vs memory-mapping the library (time, heap)
+  sample    a filtered random pick: list scan over parsed dicts vs one bucket index
+  repeats   share of sessions where a doctor gets a disease from their last K cases,
+            random choice vs library sampling with recent-case exclusion
+
+    python benchmarks/bench_case_library.py [--cases 5000] [--doctors 50] [--sessions 30]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+import agent
+from case_library import CaseLibrary, RecentCases, write_library
+from scoring import diagnosis_key
+
+SITES = ["Knee", "Ankle", "Wrist", "Elbow", "Shoulder", "Hip", "Neck", "Lower Back", "Chest Wall", "Foot",
+         "Hand", "Jaw", "Ear", "Eye", "Sinus", "Throat", "Bladder", "Stomach", "Skin", "Scalp"]
+CONDITIONS = ["Sprain", "Strain", "Fracture", "Tendinitis", "Bursitis", "Infection", "Inflammation", "Contusion",
+              "Laceration", "Abscess"]
+
+
+def synthetic_entries(n, rng):
+    diseases = [f"{site} {condition}" for site in SITES for condition in CONDITIONS]
+    for i in range(n):
+        case = dict(rng.choice(agent.FALLBACK_CASES))
+        case["sex"] = rng.choice(agent.CASE_SEXES)
+        case["severity"] = rng.choice(["mild", "moderate", "severe"])
+        case["disease"] = rng.choice(diseases)
+        case["name"] = agent.random_patient_name(case["sex"])
+        yield agent.CASE_DOMAINS[i % len(agent.CASE_DOMAINS)], case
+
+
+def timed_heap(fn):
+    """(result, seconds, traced heap bytes); timed and traced in separate runs."""
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    value = fn()
+    heap = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, elapsed, heap
+
+
+def parse_all(path):
+    with open(path + ".jsonl") as f:
+        return [json.loads(line) for line in f]
+
+
+def open_library(path):
+    library = CaseLibrary(path)
+    library.sample()
+    return library
+
+
+def per_sample_us(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def repeat_rate(pick, doctors, sessions, keep):
+    repeats = 0
+    for d in range(doctors):
+        history = []
+        for _ in range(sessions):
+            key = diagnosis_key(pick(f"doc{d}")["disease"])
+            repeats += key in history[-keep:]
+            history.append(key)
+    return repeats / (doctors * sessions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=5000)
+    parser.add_argument("--doctors", type=int, default=50)
+    parser.add_argument("--sessions", type=int, default=30, help="sessions per doctor")
+    parser.add_argument("--recent", type=int, default=20, help="K, diseases a doctor should not see again")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    path = os.path.join(tempfile.mkdtemp(), "cases")
+    header = write_library(path, synthetic_entries(args.cases, rng))
+    size = os.path.getsize(path + ".jsonl") + os.path.getsize(path + ".idx")
+    print(f"{header['count']} cases, {len(header['diseases'])} diseases, {len(header['buckets'])} buckets, {size / 1024:,.0f} KB on disk")
+
+    library, open_s, open_heap = timed_heap(lambda: open_library(path))
+    cases, parse_s, parse_heap = timed_heap(lambda: parse_all(path))
+    print(f"\n{'startup':<20} {'ms':>8} {'heap KB':>9}")
+    print(f"{'parse all':<20} {parse_s * 1e3:>8.2f} {parse_heap / 1024:>9,.0f}")
+    print(f"{'memory-map':<20} {open_s * 1e3:>8.2f} {open_heap / 1024:>9,.0f}")
+
+    domain, sex = "Cardiology", "female"
+    scan = lambda: rng.choice([c for c in cases if c["domain"] == domain and c["sex"] == sex])
+    recent = dict.fromkeys(diagnosis_key(d) for d in list({c["disease"] for c in cases})[:args.recent])
+    print(f"\n{'sample':<34} {'us':>8}")
+    print(f"{'list scan, domain + sex':<34} {per_sample_us(scan, 200):>8.1f}")
+    print(f"{'library, unfiltered':<34} {per_sample_us(lambda: library.sample(rng=rng), 5000):>8.1f}")
+    print(f"{'library, domain + sex':<34} {per_sample_us(lambda: library.sample(domain, sex, rng=rng), 5000):>8.1f}")
+    print(f"{'library, domain + sex, exclude K':<34} "
+          f"{per_sample_us(lambda: library.sample(domain, sex, exclude=recent, rng=rng), 5000):>8.1f}")
+
+    recent_cases = RecentCases(per_doctor=args.recent)
+
+    def library_pick(doctor):
+        case = library.sample(exclude=recent_cases.get(doctor), rng=rng)
+        recent_cases.add(doctor, case["disease"])
+        return case
+
+    print(f"\n{'repeats within last K':<34} {'share':>8}")
+    print(f"{'random choice':<34} {repeat_rate(lambda _: rng.choice(cases), args.doctors, args.sessions, args.recent):>8.1%}")
+    print(f"{'library + recent exclusion':<34} {repeat_rate(library_pick, args.doctors, args.sessions, args.recent):>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
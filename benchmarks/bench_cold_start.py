@@ -0,0 +1,89 @@
+"""Serverless cold start: import time and time to the first /api/health, /api/start and /api/message.
+
+Every sample is a fresh interpreter (what a new Vercel instance pays), run offline with
+no Groq keys; the /api/message run uses the fake LLM. Two import modes:
+
+  lazy    the app as shipped: the LLM stack loads on the first route that needs a model
+  eager   langgraph, langchain_core and langchain_groq imported and the turn graph
+          compiled up front, as the app did before
+
+Medians of the lazy mode are checked against BUDGETS_MS; the script exits 1 when one is
+exceeded, so it can gate a deploy.
+
+    python benchmarks/bench_cold_start.py [--runs 5]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(BENCH_DIR, "..", "api")
+
+# Regression budget for the lazy mode (median ms from interpreter start of the import)
+BUDGETS_MS = {"import": 600, "health": 650, "start": 700, "message": 2500}
+
+EAGER = """
+import langgraph.graph, langchain_core.messages, langchain_groq
+import agent
+agent.get_turn_graph()
+"""
+
+PROBE = """
+import sys, time, json
+sys.path[:0] = [{api!r}, {bench!r}]
+start = time.perf_counter()
+{eager}
+import app
+out = {{"import": time.perf_counter() - start}}
+client = app.app.test_client()
+if {step!r} == "health":
+    client.get("/api/health")
+elif {step!r} == "start":
+    client.post("/api/start", json={{"doctor_username": "doc"}})
+elif {step!r} == "message":
+    import fake_llm, agent
+    fake_llm.install(agent)
+    session_id = client.post("/api/start", json={{"doctor_username": "doc"}}).json["session_id"]
+    client.post("/api/message", json={{"session_id": session_id, "message": "Where does it hurt?"}})
+out[{step!r}] = time.perf_counter() - start
+out["llm_stack_loaded"] = any(m in sys.modules for m in ("langgraph", "langchain_core", "langchain_groq"))
+print(json.dumps(out))
+"""
+
+
+def probe(step, eager):
+    env = {k: v for k, v in os.environ.items() if not k.startswith("GROQ_API_KEY")}
+    env.update(CASE_POOL_HIGH="0", LOG_LEVEL="WARNING")
+    code = PROBE.format(api=API_DIR, bench=BENCH_DIR, eager=EAGER if eager else "", step=step)
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    args = parser.parse_args()
+
+    probe("health", eager=False)  # write .pyc files so every sample starts equal
+    print(f"median of {args.runs} fresh interpreters, ms")
+    print(f"{'step':<9} {'eager':>7} {'lazy':>7} {'budget':>7}  LLM stack loaded (lazy)")
+    over = []
+    for step in ("import", "health", "start", "message"):
+        probe_step = "health" if step == "import" else step
+        eager = [probe(probe_step, True)[step] * 1e3 for _ in range(args.runs)]
+        lazy_runs = [probe(probe_step, False) for _ in range(args.runs)]
+        lazy = statistics.median(r[step] * 1e3 for r in lazy_runs)
+        loaded = "yes" if lazy_runs[-1]["llm_stack_loaded"] else "no"
+        print(f"{step:<9} {statistics.median(eager):>7.0f} {lazy:>7.0f} {BUDGETS_MS[step]:>7}  {loaded}")
+        if lazy > BUDGETS_MS[step]:
+            over.append(step)
+    if over:
+        print(f"over budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
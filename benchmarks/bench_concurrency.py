@@ -0,0 +1,81 @@
+"""Concurrency of the async LLM path vs the old blocking path, with a fake LLM.
+
+Blocking path: what process_turn used to do - a fresh client per call and a blocking
+invoke() on a worker thread (bounded by the worker's thread count).
+Async path: aprocess_turn() awaited on the shared loop with one pooled client.
+
+    python benchmarks/bench_concurrency.py --latency 0.5 --threads 16
+"""
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_llm import FakeChatModel, install
+import agent
+from session_model import Session
+
+
+def _state():
+    return Session("bench", dict(agent.FALLBACK_CASES[0]))
+
+
+def run_blocking(n, threads, latency, setup_cost):
+    # Latencies are measured from batch start, so they include time queued for a thread
+    def one(_):
+        llm = FakeChatModel(latency=latency, setup_cost=setup_cost)
+        state = _state()
+        messages, _ = agent._build_turn_messages(state, "How are you feeling?")
+        response = llm.invoke(messages)
+        agent.parse_turn_content(response.content, state)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(one, range(n)))
+    return time.perf_counter() - start, latencies, threads
+
+
+def run_async(n, latency):
+    install(agent, FakeChatModel(latency=latency))
+
+    async def one():
+        await agent.aprocess_turn(_state(), "How are you feeling?")
+        return time.perf_counter() - start
+
+    async def all_turns():
+        return await asyncio.gather(*(one() for _ in range(n)))
+
+    agent.get_event_loop()
+    threads_before = threading.active_count()
+    start = time.perf_counter()
+    latencies = agent.run_async(all_turns())
+    return time.perf_counter() - start, latencies, threading.active_count() - threads_before + 1
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM latency per call (s)")
+    parser.add_argument("--setup-cost", type=float, default=0.02, help="fresh client setup cost (s)")
+    parser.add_argument("--threads", type=int, default=16, help="worker threads for the blocking path")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 200, 500])
+    args = parser.parse_args()
+
+    print(f"{'path':<10} {'in-flight':>9} {'threads':>7} {'wall s':>8} {'turns/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for n in args.concurrency:
+        for name, (wall, lat, threads) in (
+            ("blocking", run_blocking(n, args.threads, args.latency, args.setup_cost)),
+            ("async", run_async(n, args.latency)),
+        ):
+            print(f"{name:<10} {n:>9} {threads:>7} {wall:>8.2f} {n / wall:>8.1f} "
+                  f"{_pct(lat, 50) * 1000:>8.0f} {_pct(lat, 95) * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
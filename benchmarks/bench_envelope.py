@@ -0,0 +1,145 @@
+"""Repair rate and parse time of the turn-envelope parser on a fuzzed corpus.
+
+Takes well-formed turn envelopes, damages them the way models do (code fences, prose
+around the JSON, trailing commas, truncation, echoed schema examples, braces in the
+reply) and checks whether the reply text comes back. Compares parse_envelope() with
+the old fence-slicing + greedy `\\{.*\\}` regex fallback.
+
+    python benchmarks/bench_envelope.py [--n 330] [--seed 7]
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from envelope import parse_envelope, is_turn_envelope
+
+REPLIES = [
+    "My throat is really sore, doctor, and it hurts to swallow.",
+    "I've had a headache for three days {it gets worse at night}.",
+    "It started after dinner. I threw up twice and my stomach cramps.",
+    'My mum said it\'s "just a cold" but I feel feverish and tired.',
+    "Honestly? I don't know. It's a dull ache, maybe a 6 out of 10.",
+]
+
+SCHEMA_ECHO = '{"reply_text": "string", "metadata": {"revealed": ["list"]}}'
+
+
+def envelope(reply, revealed):
+    return json.dumps({"reply_text": reply, "metadata": {"status": "active", "revealed": revealed, "needs_escalation": False}})
+
+
+# mutation -> f(clean_json, reply, rng) -> damaged text
+MUTATIONS = {
+    "clean": lambda s, reply, rng: s,
+    "fence": lambda s, reply, rng: f"```json\n{s}\n```",
+    "bare_fence": lambda s, reply, rng: f"```\n{s}\n```",
+    "prose_prefix": lambda s, reply, rng: f"Here is my response as the patient:\n{s}",
+    "prose_both": lambda s, reply, rng: f"Sure! {s}\nLet me know if you need anything else.",
+    "trailing_comma": lambda s, reply, rng: s[:-2] + ",}" + "}" if s.endswith("}}") else s,
+    "schema_echo": lambda s, reply, rng: f"Format: {SCHEMA_ECHO}\nAnswer: {s}",
+    "truncated": lambda s, reply, rng: s[: rng.randint(len(reply) // 2 + 16, len(s) - 2)],
+    "metadata_after": lambda s, reply, rng: f'{reply}\n{{"status": "active", "revealed": ["sore throat"]}}',
+    "no_json": lambda s, reply, rng: reply,
+    "brace_noise": lambda s, reply, rng: "{" * rng.randint(200, 400) + " " + s,
+}
+
+
+def legacy_parse(raw):
+    """The pre-envelope parser: slice fences, json.loads, then a greedy regex."""
+    content = raw.strip()
+    if content.startswith("```json"): content = content[7:]
+    if content.endswith("```"): content = content[:-3]
+    content = content.strip()
+    try:
+        parsed = json.loads(content)
+        return parsed.get("reply_text", "")
+    except Exception:
+        candidates = re.findall(r'(\{.*\})', content, re.DOTALL)
+        if candidates:
+            try:
+                parsed = json.loads(candidates[-1])
+                if "metadata" in parsed:
+                    return parsed.get("reply_text", "")
+                if "revealed" in parsed:
+                    return content.replace(candidates[-1], "").strip()
+            except Exception:
+                return content
+        return content
+
+
+def new_parse(raw):
+    result = parse_envelope(raw, is_turn_envelope)
+    if result.value is None:
+        return result.text
+    if "reply_text" in result.value or "metadata" in result.value:
+        return result.value.get("reply_text") or ""
+    start, end = result.span
+    return (result.text[:start] + result.text[end:]).strip()
+
+
+def recovered(got, reply, mutation):
+    if mutation == "truncated":
+        # A cut-off reply counts if we got a clean prefix of it (no JSON debris)
+        return bool(got) and reply.startswith(got)
+    return got == reply
+
+
+def build_corpus(n, seed):
+    rng = random.Random(seed)
+    rows = []
+    names = list(MUTATIONS)
+    for i in range(n):
+        mutation = names[i % len(names)]
+        reply = rng.choice(REPLIES)
+        raw = MUTATIONS[mutation](envelope(reply, ["sore throat"]), reply, rng)
+        rows.append((mutation, reply, raw))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=330)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rows = build_corpus(args.n, args.seed)
+    results = {}
+    for name, parse in (("legacy", legacy_parse), ("envelope", new_parse)):
+        per_mutation = {}
+        start = time.perf_counter()
+        for mutation, reply, raw in rows:
+            ok = recovered(parse(raw), reply, mutation)
+            hit, total = per_mutation.get(mutation, (0, 0))
+            per_mutation[mutation] = (hit + ok, total + 1)
+        elapsed = time.perf_counter() - start
+        results[name] = (per_mutation, elapsed / len(rows) * 1e6)
+
+    print(f"{len(rows)} fuzzed completions, {len(MUTATIONS)} mutation kinds")
+    print(f"{'mutation':<16} {'legacy':>8} {'envelope':>9}")
+    for mutation in MUTATIONS:
+        cells = []
+        for name in ("legacy", "envelope"):
+            hit, total = results[name][0][mutation]
+            cells.append(f"{hit / total:.0%}")
+        print(f"{mutation:<16} {cells[0]:>8} {cells[1]:>9}")
+    for name in ("legacy", "envelope"):
+        per_mutation, us = results[name]
+        hit = sum(h for h, _ in per_mutation.values())
+        print(f"{name:<10} recovered {hit / len(rows):.0%}   {us:.1f} us/parse")
+
+    # Worst case for the greedy regex: unmatched braces make it rescan from every "{"
+    for n in (2000, 20000):
+        hostile = "{" * n + " the patient sighs"
+        for name, parse in (("legacy", legacy_parse), ("envelope", new_parse)):
+            start = time.perf_counter()
+            parse(hostile)
+            print(f"{name:<10} {n} unmatched braces: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
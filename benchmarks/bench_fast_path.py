@@ -0,0 +1,92 @@
+"""Opening-turn latency and LLM calls with and without the local identity fast path.
+
+Replays a mix of opening questions (about a third identity/demographic, the rest
+clinical or mixed) through process_turn against a fake 70b with lognormal latency.
+Prints, for each fast-path threshold, the share of turns answered locally, how many
+clinical questions were wrongly taken locally, LLM calls, and turn latency.
+
+    python benchmarks/bench_fast_path.py [--sessions 40] [--median 0.05] [--seed 2]
+"""
+import time
+import random
+import argparse
+import statistics
+
+from fake_llm import FakeChatModel, lognormal_latency, install
+import agent
+from session_model import Session
+
+# (question, whether it has a single answer in the case)
+OPENERS = [
+    ("Hi, what's your name?", True),
+    ("Hello, I'm Dr. Patel. What is your name please?", True),
+    ("Who am I speaking with?", True),
+    ("How old are you?", True),
+    ("And what is your age?", True),
+    ("When did this start?", True),
+    ("How long has this been going on?", True),
+    ("Since when?", True),
+    ("Are you male or female?", True),
+    ("What brings you in today?", False),
+    ("How are you feeling?", False),
+    ("Where does it hurt?", False),
+    ("When did the headache start?", False),
+    ("How long have you had this cough?", False),
+    ("What's your name and where does it hurt?", False),
+    ("How old are you and do you smoke?", False),
+    ("Do you have any allergies?", False),
+    ("Any fever or chills?", False),
+    ("Are you taking any medication?", False),
+    ("Have you had anything like this before?", False),
+    ("Does anything make it better or worse?", False),
+    ("Tell me about your symptoms.", False),
+    ("Can you describe the pain?", False),
+    ("Have you travelled recently?", False),
+]
+
+
+def run(threshold, sessions, turns, median, seed):
+    agent.FAST_PATH_THRESHOLD = threshold
+    agent.LOCAL_FAST_PATH = threshold <= 1.0
+    rng = random.Random(seed)
+    model = FakeChatModel(latency=lognormal_latency(median, 0.5, seed))
+    install(agent, model)
+
+    async def all_sessions():
+        latencies, local, misrouted = [], 0, 0
+        for i in range(sessions):
+            session = Session(f"bench-{i}", dict(agent.FALLBACK_CASES[i % len(agent.FALLBACK_CASES)]))
+            for question, deterministic in rng.sample(OPENERS, turns):
+                start = time.perf_counter()
+                result = await agent.aprocess_turn(session, question)
+                latencies.append(time.perf_counter() - start)
+                if result["usage"].get("model") == "fast_path":
+                    local += 1
+                    misrouted += not deterministic
+        return latencies, local, misrouted
+
+    latencies, local, misrouted = agent.run_async(all_sessions())
+    latencies.sort()
+    return local / len(latencies), misrouted, model.calls, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=6, help="opening questions per session")
+    parser.add_argument("--median", type=float, default=0.05, help="median fake 70b latency in seconds")
+    parser.add_argument("--seed", type=int, default=2)
+    args = parser.parse_args()
+
+    identity = sum(d for _, d in OPENERS) / len(OPENERS)
+    print(f"{args.sessions} sessions x {args.turns} opening turns, {identity:.0%} of the question mix is identity/demographic")
+    print(f"{'threshold':<10} {'local':>7} {'misrouted':>10} {'LLM calls':>10} {'mean ms':>8} {'p50 ms':>7} {'p90 ms':>7}")
+    for threshold in (1.01, 1.0, 0.8, 0.6, 0.4):
+        share, misrouted, calls, latencies = run(threshold, args.sessions, args.turns, args.median, args.seed)
+        label = "off" if threshold > 1.0 else f"{threshold:.1f}"
+        print(f"{label:<10} {share:>7.1%} {misrouted:>10} {calls:>10} {statistics.mean(latencies) * 1e3:>8.1f} "
+              f"{latencies[len(latencies) // 2] * 1e3:>7.1f} {latencies[int(len(latencies) * 0.9)] * 1e3:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Turn latency percentiles and extra LLM calls with and without hedged requests.
+
+Patient turns run through process_turn against fake Groq keys whose latency is
+lognormal with occasional stalls (--stall of calls take --stall-factor times longer),
+the long tail seen on llama-3.3-70b-versatile. Modes:
+
+  off            one call per turn, as before
+  2 keys         hedge on the other key after the 70b's p90
+  1 key -> 8b    a single key, so the hedge goes to llama-3.1-8b-instant
+  rate 0.05      2 keys with a tighter HEDGE_MAX_RATE budget
+  6000 tok/min   2 keys with the default HEDGE_MAX_TOKENS_PER_MIN cost cap
+
+The run squeezes minutes of class traffic into seconds, so the token cap is off except
+in its own row, where it binds far harder than it would in real time. Calls started
+counts hedges too: a cancelled hedge still spends quota.
+
+    python benchmarks/bench_hedging.py [--turns 400] [--median 0.4] [--stall 0.05]
+"""
+import time
+import asyncio
+import random
+import argparse
+
+from fake_llm import FakeChatModel, install
+import agent
+from session_model import Session
+from metrics import HEDGES
+
+
+def stalling_latency(median, stall, stall_factor, seed):
+    rng = random.Random(seed)
+
+    def latency():
+        seconds = rng.lognormvariate(0, 0.3) * median
+        return seconds * stall_factor if rng.random() < stall else seconds
+    return latency
+
+
+def run(mode, args, max_rate, max_tokens_per_min):
+    agent.LLM_HEDGE = mode != "off"
+    agent.LOCAL_FAST_PATH = False
+    agent.hedge_policy = agent.HedgePolicy(max_rate=max_rate, max_tokens_per_min=max_tokens_per_min)
+    latency = lambda seed: stalling_latency(args.median, args.stall, args.stall_factor, seed)
+    if mode == "1 key -> 8b":
+        model = install(agent, FakeChatModel(latency=latency(args.seed)), models_by_model={
+            "llama-3.1-8b-instant": FakeChatModel(latency=stalling_latency(args.median / 2, args.stall, args.stall_factor, args.seed + 1))})
+        models = [model]
+    else:
+        models = [FakeChatModel(latency=latency(args.seed + i)) for i in range(2)]
+        install(agent, models_by_key={"fake-key-0": models[0], "fake-key-1": models[1]})
+    for name in agent.tier_breakers:
+        agent.tier_breakers[name] = agent.CircuitBreaker(name, agent.TIER_FAILURE_THRESHOLD, agent.TIER_RESET_SECONDS)
+
+    async def turns(n, start):
+        async def one(i):
+            session = Session(f"bench-{start + i}", dict(agent.FALLBACK_CASES[i % len(agent.FALLBACK_CASES)]))
+            began = time.perf_counter()
+            result = await agent.aprocess_turn(session, "Can you describe the pain?")
+            return time.perf_counter() - began, result["usage"].get("model")
+        results = []
+        for wave in range(0, n, args.concurrency):
+            results += await asyncio.gather(*(one(i) for i in range(wave, min(n, wave + args.concurrency))))
+        return results
+
+    agent.run_async(turns(args.warmup, 0))  # fills the latency window the hedge delay comes from
+    sent_before = HEDGES.total(outcome="sent")
+    won_before = HEDGES.total(outcome="won")
+    results = agent.run_async(turns(args.turns, args.warmup))
+    sent = HEDGES.total(outcome="sent") - sent_before
+    won = HEDGES.total(outcome="won") - won_before
+    latencies = sorted(seconds for seconds, _ in results)
+    return latencies, sent, won, sum(1 for _, model in results if model == "local")
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--median", type=float, default=0.4, help="median fake 70b latency in seconds")
+    parser.add_argument("--stall", type=float, default=0.05, help="share of calls that stall")
+    parser.add_argument("--stall-factor", type=float, default=8.0)
+    parser.add_argument("--seed", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{args.turns} turns, 70b median {args.median:.2f}s, {args.stall:.0%} of calls stall x{args.stall_factor:g}")
+    print(f"{'mode':<22} {'p50 s':>6} {'p90 s':>6} {'p99 s':>6} {'max s':>6} {'calls started':>14} {'hedges won':>11} {'local':>6}")
+    modes = [("off", "off", 0.15, 0), ("2 keys", "2 keys", 0.15, 0), ("1 key -> 8b", "1 key -> 8b", 0.15, 0),
+             ("2 keys, rate 0.05", "2 keys", 0.05, 0), ("2 keys, 6000 tok/min", "2 keys", 0.15, 6000)]
+    for label, mode, max_rate, max_tokens in modes:
+        latencies, sent, won, local = run(mode, args, max_rate, max_tokens)
+        calls = f"{args.turns + sent:.0f} (+{sent / args.turns:.0%})"
+        print(f"{label:<22} {percentile(latencies, 0.5):>6.2f} {percentile(latencies, 0.9):>6.2f} "
+              f"{percentile(latencies, 0.99):>6.2f} {latencies[-1]:>6.2f} {calls:>14} {won:>11.0f} {local:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""/api/history cost for a doctor with a long history: old in-record list vs HistoryStore.
+
+The old handler serialized the doctor's whole history list on every request and
+deleted an entry by rebuilding that list. The store serves one page per request from
+the (username, timestamp) primary key and deletes through the session_id index.
+
+    python benchmarks/bench_history.py [--entries 1000 10000 50000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from history_store import HistoryStore
+
+
+def entry(i):
+    return {
+        "session_id": f"session-{i:06d}",
+        "patient_name": "Jordan Lee",
+        "patient_sex": "female",
+        "patient_age": "25-34",
+        "revealed_symptoms": ["sore throat", "fever", "swollen glands"],
+        "final_diagnosis": "Pharyngitis" if i % 2 else "Influenza",
+        "prescriptions": "Rest, fluids",
+        "status": "treated" if i % 3 else "active",
+        "timestamp": (datetime(2026, 1, 1) + timedelta(minutes=i)).isoformat(),
+    }
+
+
+def timed_ms(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1e3, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    print(f"{'entries':>8} {'list ms':>8} {'list KB':>8} {'page ms':>8} {'page KB':>8} {'list del ms':>12} {'store del ms':>13}")
+    for n in args.entries:
+        legacy = [entry(i) for i in range(n)]
+        store = HistoryStore()
+        for e in legacy:
+            store.add("doc", e)
+
+        list_ms, body = timed_ms(lambda: json.dumps({"history": legacy}))
+        page_ms, page = timed_ms(lambda: json.dumps({"history": store.page("doc")[0]}))
+        target = f"session-{n // 2:06d}"
+        list_del_ms, _ = timed_ms(lambda: [h for h in legacy if h.get("session_id") != target])
+        start = time.perf_counter()
+        store.delete("doc", target)
+        store_del_ms = (time.perf_counter() - start) * 1e3
+        print(f"{n:>8} {list_ms:>8.2f} {len(body) / 1024:>8.0f} {page_ms:>8.2f} {len(page) / 1024:>8.1f} {list_del_ms:>12.2f} {store_del_ms:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
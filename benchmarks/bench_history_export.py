@@ -0,0 +1,84 @@
+"""Peak memory and throughput of the streaming history export vs one JSON array.
+
+Fills an in-memory history store with N finished sessions (20-turn transcripts, spread
+over --doctors doctors) and exports all of it three ways:
+
+  json array      every record loaded and serialized as one array, the shape
+                  /api/history had to produce for a full dump
+  ndjson          history_export.export_stream, one line per session
+  columns + gzip  the compressed columnar export
+
+The transcripts are synthetic and repetitive, so gzip ratios here flatter real ones.
+Peak is the traced heap high-water mark while the output is consumed chunk by chunk
+(the array is built whole first, as a JSON response body would be).
+
+    python benchmarks/bench_history_export.py [--sizes 2000 8000 32000] [--doctors 40]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from history_store import HistoryStore
+from history_export import export_stream
+
+
+def fill(store, sessions, doctors, rng):
+    for i in range(sessions):
+        transcript = []
+        for turn in range(20):
+            transcript.append({"role": "doctor", "text": f"Question {turn} about the pain, how long, how bad?"})
+            transcript.append({"role": "patient", "text": f"Answer {turn}: it has been aching for a few days, doctor."})
+        entry = {
+            "session_id": f"s{i:07d}", "patient_name": "Jordan Lee", "patient_sex": rng.choice(["female", "male"]),
+            "patient_age": "25-34", "revealed_symptoms": ["sore throat", "fever"], "final_diagnosis": "Pharyngitis",
+            "prescriptions": "Rest", "status": "active", "score": {"total": rng.randint(0, 100)},
+            "timestamp": f"2026-09-{1 + i % 28:02d}T10:{i % 60:02d}:00",
+        }
+        store.add(f"doc{i % doctors}", entry, transcript=transcript)
+
+
+def json_array(store):
+    records = [record for _, record in store.export()]
+    yield json.dumps(records).encode()
+
+
+def measure(chunks_fn):
+    """(peak traced bytes, output bytes, seconds); timed and traced in separate runs."""
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in chunks_fn())
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    sum(len(chunk) for chunk in chunks_fn())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 8000, 32000])
+    parser.add_argument("--doctors", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=6)
+    args = parser.parse_args()
+
+    print(f"{'sessions':>9} {'export':<15} {'peak MB':>8} {'output MB':>10} {'sessions/s':>11}")
+    for sessions in args.sizes:
+        store = HistoryStore()
+        fill(store, sessions, args.doctors, random.Random(args.seed))
+        modes = [
+            ("json array", lambda: json_array(store)),
+            ("ndjson", lambda: export_stream(store, "ndjson")),
+            ("columns + gzip", lambda: export_stream(store, "columns")),
+        ]
+        for label, chunks_fn in modes:
+            peak, size, elapsed = measure(chunks_fn)
+            print(f"{sessions:>9} {label:<15} {peak / 2**20:>8.1f} {size / 2**20:>10.1f} {sessions / elapsed:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
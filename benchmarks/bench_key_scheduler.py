@@ -0,0 +1,54 @@
+"""Key scheduler under concurrent load with scripted 429s.
+
+key_a returns a burst of 429s (with retry-after hints), key_b and key_c are healthy.
+Turns are issued from many threads at once; the scheduler should steer traffic away
+from key_a while it cools down and no turn should fall back to the error reply.
+Each key has a --rpm request budget; turns that find every key's budget spent for
+longer than LLM_MAX_WAIT go to the next tier or the local patient instead, and no key's
+load should end above 1.
+
+    python benchmarks/bench_key_scheduler.py --turns 200 --threads 32 [--rpm 120]
+"""
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_llm import FakeChatModel, FakeRateLimitError, install
+import agent
+from session_model import Session
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--burst", type=int, default=10, help="scripted 429s on key_a")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--rpm", type=int, default=120, help="requests per minute per key")
+    args = parser.parse_args()
+
+    models = {
+        "key_a": FakeChatModel(latency=args.latency, script=[FakeRateLimitError(args.retry_after)] * args.burst),
+        "key_b": FakeChatModel(latency=args.latency),
+        "key_c": FakeChatModel(latency=args.latency),
+    }
+    install(agent, models_by_key=models, rpm=args.rpm)
+
+    def turn(i):
+        return agent.process_turn(Session(f"s{i}", dict(agent.FALLBACK_CASES[0])), "Where does it hurt?")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(turn, range(args.turns)))
+    wall = time.perf_counter() - start
+
+    failed = sum(1 for r in results if "System Error" in r["reply"])
+    local = sum(1 for r in results if r["usage"].get("model") == "local")
+    print(f"{args.turns} turns in {wall:.2f}s, {failed} fell back to the error reply, {local} to the local patient")
+    print(json.dumps(agent.key_scheduler.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Turn outcomes under provider degradation, single-model path vs the tiered model router.
+
+Three scenarios on the fake LLM, with budgets scaled down so a run takes seconds:
+
+  storm    every 70b call is rate limited
+  stall    70b answers, but with a long-tailed latency far above its budget
+  outage   both hosted models fail; only the rule-based patient is left
+
+The single-model path is the pre-router turn (one model, canned error reply when it
+fails). For each path: how turns were answered, latency p50/p99/max against the
+deadline, and how many turns skipped the degraded 70b outright (open breaker).
+
+    python benchmarks/bench_model_router.py [--turns 40] [--budget 0.3] [--seed 1]
+"""
+import time
+import argparse
+import statistics
+
+from fake_llm import FakeChatModel, lognormal_latency, install
+import agent
+from session_model import Session
+from circuit_breaker import CircuitBreaker
+
+BIG, SMALL = "llama-3.3-70b-versatile", "llama-3.1-8b-instant"
+
+
+def scenario(name, budget, seed):
+    ok = lambda: FakeChatModel(latency=budget / 10)
+    if name == "storm":
+        return {BIG: FakeChatModel(latency=budget / 10, rate_limit_rate=1.0, seed=seed), SMALL: ok()}
+    if name == "stall":
+        return {BIG: FakeChatModel(latency=lognormal_latency(budget * 3, 0.8, seed)), SMALL: ok()}
+    return {BIG: FakeChatModel(error_rate=1.0, seed=seed), SMALL: FakeChatModel(error_rate=1.0, seed=seed + 1)}
+
+
+async def single_model_turn(session, question):
+    messages, usage = agent._build_turn_messages(session, question)
+    try:
+        response = await agent.ainvoke_llm(messages, temperature=0.5, model_name=BIG, json_mode=True)
+    except Exception as e:
+        result = agent._error_turn_result(question, e)
+        return "error", result
+    reply, metadata = agent.parse_turn_content(response.content, session)
+    return BIG, {"reply": reply, "metadata": metadata}
+
+
+async def routed_turn(session, question):
+    result = await agent.aprocess_turn(session, question)
+    return ("error" if result.get("failed") else result["usage"]["model"]), result
+
+
+def run(path, name, turns, budget, seed):
+    models = scenario(name, budget, seed)
+    install(agent, FakeChatModel(), models_by_model=models)
+    agent.MODEL_TIERS[:] = [(BIG, budget), (SMALL, budget / 2)]
+    agent.LLM_DEADLINE = budget * 2
+    for tier, _ in agent.MODEL_TIERS:
+        agent.tier_breakers[tier] = CircuitBreaker(tier, agent.TIER_FAILURE_THRESHOLD, reset_timeout=budget * 10)
+    turn = single_model_turn if path == "single" else routed_turn
+
+    async def all_turns():
+        session = Session("bench", dict(agent.FALLBACK_CASES[0]))
+        out = []
+        for i in range(turns):
+            start = time.perf_counter()
+            tier, _ = await turn(session, f"Question {i}: any fever?")
+            out.append((tier, time.perf_counter() - start))
+        return out
+
+    skipped_before = agent.MODEL_TIER_CALLS.value(tier=BIG, outcome="skipped")
+    results = agent.run_async(all_turns())
+    skipped = agent.MODEL_TIER_CALLS.value(tier=BIG, outcome="skipped") - skipped_before
+    latencies = sorted(t for _, t in results)
+    by_tier = {}
+    for tier, _ in results:
+        by_tier[tier] = by_tier.get(tier, 0) + 1
+    return by_tier, latencies, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--budget", type=float, default=0.3, help="70b tier budget in seconds (8b gets half, deadline is 2x)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    agent.LLM_MAX_WAIT = args.budget
+
+    print(f"{args.turns} turns per run; 70b budget {args.budget}s, 8b {args.budget / 2}s, deadline {args.budget * 2}s")
+    print(f"{'scenario':<8} {'path':<7} {'70b':>4} {'8b':>4} {'local':>6} {'error':>6} {'p50 s':>7} {'p99 s':>7} {'max s':>7} {'70b skipped':>12}")
+    for name in ("storm", "stall", "outage"):
+        for path in ("single", "router"):
+            by_tier, latencies, skipped = run(path, name, args.turns, args.budget, args.seed)
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{name:<8} {path:<7} {by_tier.get(BIG, 0):>4} {by_tier.get(SMALL, 0):>4} {by_tier.get('local', 0):>6} "
+                  f"{by_tier.get('error', 0):>6} {statistics.median(latencies):>7.3f} {p99:>7.3f} {latencies[-1]:>7.3f} {skipped:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Prompt-build time and prefix-cache hit ratio, old vs split system prompt.
+
+Simulates a classroom: N sessions on different cases taking turns round-robin. Each
+turn's prompt is built with (a) the old layout, which re-renders the whole system
+prompt with the case JSON near the top, and (b) the static-rules prefix + memoized
+per-session case block. A provider-style prefix cache (hash of every 128-token block
+plus everything before it) estimates how many prompt tokens a provider could reuse.
+
+    python benchmarks/bench_prompt_prefix.py [--sessions 30] [--turns 12]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+import agent
+from langchain_core.messages import HumanMessage, AIMessage
+
+BLOCK_CHARS = 128 * 4  # 128 tokens at ~4 chars/token
+
+
+def legacy_system_prompt(case):
+    """The old layout: persona and case JSON first, then the rules, re-rendered each turn."""
+    rules = agent.PATIENT_RULES_PROMPT.split("\n", 2)[2]
+    return (
+        f'\nSYSTEM: You are a single virtual patient agent named "{case.get("name", "Unknown")}".\n'
+        f"Your hidden patient_case (JSON) contains: {json.dumps(case)}.\n\n" + rules
+    )
+
+
+def split_system_prompt(state):
+    return agent.get_session_prompt(state)
+
+
+class PrefixCache:
+    """Counts the characters of each prompt covered by previously seen block prefixes."""
+
+    def __init__(self):
+        self.seen = set()
+
+    def lookup_and_insert(self, text):
+        digest = hashlib.sha1()
+        cached = 0
+        hit = True
+        for start in range(0, len(text) - BLOCK_CHARS + 1, BLOCK_CHARS):
+            digest.update(text[start:start + BLOCK_CHARS].encode())
+            key = digest.copy().hexdigest()
+            if hit and key in self.seen:
+                cached += BLOCK_CHARS
+            else:
+                hit = False
+                self.seen.add(key)
+        return cached
+
+
+def serialize(messages):
+    return "".join(f"{type(m).__name__}:{m.content}\n" for m in messages)
+
+
+def cases(n):
+    out = []
+    for i in range(n):
+        case = dict(agent.FALLBACK_CASES[i % len(agent.FALLBACK_CASES)])
+        case["name"] = f"{case['name']} {i}"
+        out.append(case)
+    return out
+
+
+def run(layout, sessions, turns):
+    agent.session_prompts.clear()
+    states = [{
+        "session_id": f"s{i}", "patient_case": case, "messages": [],
+        "revealed_symptoms": [], "asked_questions": [], "treatment_given": [],
+    } for i, case in enumerate(cases(sessions))]
+    cache = PrefixCache()
+    build_seconds = 0.0
+    total_chars = cached_chars = 0
+    first_total = first_cached = 0
+    for turn in range(turns):
+        for state in states:
+            question = f"Question {turn}: how long has this been going on?"
+            start = time.perf_counter()
+            if layout == "legacy":
+                system_prompt = legacy_system_prompt(state["patient_case"])
+            else:
+                system_prompt = split_system_prompt(state)
+            messages, _ = agent.default_window.build(system_prompt, state, question)
+            build_seconds += time.perf_counter() - start
+            text = serialize(messages)
+            cached = cache.lookup_and_insert(text)
+            total_chars += len(text)
+            cached_chars += cached
+            if turn == 0:
+                first_total += len(text)
+                first_cached += cached
+            state["messages"] += [HumanMessage(content=question), AIMessage(content='{"reply_text": "About two days, doctor.", "metadata": {}}')]
+            state["asked_questions"].append(question)
+    builds = sessions * turns
+    return build_seconds / builds * 1e6, cached_chars / total_chars, first_cached / first_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=30)
+    parser.add_argument("--turns", type=int, default=12)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions x {args.turns} turns, round-robin; system prompt ~{len(agent.PATIENT_RULES_PROMPT)} chars of rules")
+    print(f"{'layout':<8} {'build us/turn':>14} {'cached prompt':>14} {'cached 1st turn':>16}")
+    for layout in ("legacy", "split"):
+        us, ratio, first = run(layout, args.sessions, args.turns)
+        print(f"{layout:<8} {us:>14.1f} {ratio:>14.0%} {first:>16.0%}")
+
+
+if __name__ == "__main__":
+    main()
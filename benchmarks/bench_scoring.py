@@ -0,0 +1,78 @@
+"""Latency and match behaviour of the local session scorer over synthetic sessions.
+
+Builds thousands of end-of-session submissions from the fallback cases. Each is
+answered in one of several styles: exact, alias/brand names, typos, hedged
+differentials, or wrong. The benchmark reports per-call latency and how each style
+was graded.
+
+    python benchmarks/bench_scoring.py [--sessions 5000] [--seed 3]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from scoring import score_session
+
+CASES = [
+    {"disease": "Common Cold", "correct_treatments": ["Rest", "Hydration", "Paracetamol"], "incorrect_treatments": ["Antibiotics"],
+     "symptoms": ["runny nose", "sore throat", "sneezing", "mild fatigue"]},
+    {"disease": "Tension Headache", "correct_treatments": ["Ibuprofen", "Rest", "Stress management"], "incorrect_treatments": ["Opioids", "Surgery"],
+     "symptoms": ["dull headache", "neck tightness", "sensitivity to noise"]},
+    {"disease": "Acute Gastroenteritis", "correct_treatments": ["Oral Rehydration Solution", "Rest"], "incorrect_treatments": ["Antibiotics", "Solid food immediately"],
+     "symptoms": ["vomiting", "nausea", "watery diarrhea", "stomach cramps"]},
+]
+
+# style -> per-case (diagnosis, prescriptions)
+ANSWERS = {
+    "exact": [("Common Cold", "Rest, hydration, paracetamol"), ("Tension headache", "Ibuprofen, rest and stress management"),
+              ("Acute gastroenteritis", "Oral rehydration solution and rest")],
+    "alias": [("Viral URI", "Tylenol 500mg, bed rest, plenty of fluids"), ("tension-type headache", "Advil + relaxation techniques"),
+              ("stomach bug", "ORS, take it easy")],
+    "typo": [("comon cold", "paracetemol, rest"), ("tension headahce", "ibuprofin"), ("gastroentritis", "oral rehydration salts")],
+    "hedged": [("common cold or influenza", "rest"), ("migraine / tension headache", "ibuprofen"), ("gastroenteritis vs appendicitis", "ORS")],
+    "harmful": [("Common cold", "amoxicillin"), ("Tension headache", "oxycodone, surgery"), ("Gastroenteritis", "cipro")],
+    "wrong": [("Pneumonia", "antibiotics"), ("Brain tumour", "surgery"), ("Appendicitis", "surgery")],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    styles = list(ANSWERS)
+    timings = []
+    graded = defaultdict(lambda: defaultdict(int))
+    totals = defaultdict(list)
+    for i in range(args.sessions):
+        case_index = rng.randrange(len(CASES))
+        case = CASES[case_index]
+        style = styles[i % len(styles)]
+        diagnosis, prescriptions = ANSWERS[style][case_index]
+        revealed = rng.sample(case["symptoms"], rng.randint(0, len(case["symptoms"])))
+        # Vary the text so per-phrase caches only help as much as real traffic would
+        diagnosis = diagnosis if rng.random() < 0.5 else f"{diagnosis} (day {rng.randint(1, 999)})"
+        start = time.perf_counter()
+        score = score_session(case, diagnosis, prescriptions, revealed)
+        timings.append(time.perf_counter() - start)
+        graded[style][score["diagnosis"]["match"]] += 1
+        totals[style].append(score["total"])
+
+    timings.sort()
+    p = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))] * 1e6
+    print(f"{args.sessions} sessions: p50 {p(0.5):.0f} us, p99 {p(0.99):.0f} us, max {timings[-1] * 1e6:.0f} us")
+    print(f"{'style':<9} {'exact':>6} {'partial':>8} {'none':>6} {'mean score':>11}")
+    for style in styles:
+        counts = graded[style]
+        n = sum(counts.values())
+        print(f"{style:<9} {counts['exact'] / n:>6.0%} {counts['partial'] / n:>8.0%} {counts['none'] / n:>6.0%} {sum(totals[style]) / n:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
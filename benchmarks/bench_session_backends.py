@@ -0,0 +1,180 @@
+"""Start / message / end through the app on each session backend, legacy records included.
+
+For each backend the app's session and doctor stores are swapped for that backend's:
+
+  memory   the default in-process store
+  sqlite   SQLiteSessionStore on a temporary file
+  redis    RedisSessionStore on fakeredis (no server needed)
+
+N sessions run /api/start -> T x /api/message -> /api/end against the fake LLM. After
+/api/start every session is served by a second store instance on the same file or
+server, as another worker would serve it. One more session per backend is written in
+the legacy dict layout (LangChain messages + chat_history, as stored before the Session
+model), then continued with /api/message and ended, so the upgrade on read runs too.
+
+Prints per backend the p50/p99 of each endpoint, stored bytes per session, and whether
+the legacy session kept its turns and reveals. Exits 1 when a request fails, a state
+is lost between workers or the legacy upgrade drops anything.
+
+    python benchmarks/bench_session_backends.py [--sessions 50] [--turns 6]
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+
+os.environ.setdefault("CASE_POOL_HIGH", "0")
+import fake_llm
+import agent
+
+fake_llm.install(agent)
+import app
+from admission import AdmissionController
+from session_model import Session
+from session_store import MemorySessionStore, SQLiteSessionStore, RedisSessionStore, encode_value
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+
+QUESTIONS = ["What brings you in today?", "How long has this been going on?", "Any fever?",
+             "Does anything make it better or worse?", "Are you taking any medication?", "Any allergies?"]
+
+
+def backends(workdir):
+    """name -> (store factory for a namespace, bytes stored in a namespace or None)."""
+    out = {"memory": None}
+    path = os.path.join(workdir, "sessions.db")
+
+    def sqlite_bytes(namespace):
+        conn = SQLiteSessionStore(path, namespace)._conn()
+        return conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM kv WHERE namespace = ?", (namespace,)).fetchone()[0]
+    out["sqlite"] = (lambda namespace: SQLiteSessionStore(path, namespace, ttl=3600), sqlite_bytes)
+    try:
+        import fakeredis
+    except ImportError:
+        print("fakeredis not installed; skipping the redis backend (pip install fakeredis)")
+        return out
+    server = fakeredis.FakeServer()
+
+    def redis_bytes(namespace):
+        client = fakeredis.FakeRedis(server=server)
+        return sum(client.strlen(key) for key in client.scan_iter(f"icapp:{namespace}:*"))
+    out["redis"] = (lambda namespace: RedisSessionStore(fakeredis.FakeRedis(server=server), namespace, ttl=3600), redis_bytes)
+    return out
+
+
+def legacy_record(session_id, case):
+    """Two answered turns in the pre-Session dict layout."""
+    symptom = case["symptoms"][0]
+    state = {
+        "session_id": session_id, "doctor_username": "doc", "patient_case": case,
+        "revealed_symptoms": [symptom], "asked_questions": [], "treatment_given": [], "status": "active",
+        "messages": [SystemMessage(content="You are the patient.")], "chat_history": [],
+    }
+    for question, reply in (("What brings you in?", f"I've had {symptom} since Monday."), ("Any fever?", "Not that I know of.")):
+        state["messages"] += [HumanMessage(content=question), AIMessage(content=json.dumps({"reply_text": reply}))]
+        state["chat_history"] += [{"role": "doctor", "text": question}, {"role": "patient", "text": reply}]
+    return state
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def run(name, backend, sessions, turns):
+    """(timings per endpoint, stored bytes per session or None, legacy upgrade ok, problems)."""
+    make, stored = backend or (None, None)
+    app.sessions = make("session") if make else MemorySessionStore()
+    app.doctors = make("doctor") if make else MemorySessionStore()
+    client = app.app.test_client()
+    timings = {endpoint: [] for endpoint in ("start", "message", "end")}
+    problems = []
+
+    def call(endpoint, path, body):
+        start = time.perf_counter()
+        response = client.post(path, json=body)
+        timings[endpoint].append(time.perf_counter() - start)
+        if response.status_code != 200:
+            problems.append(f"{path} -> {response.status_code}: {response.get_data(as_text=True)[:120]}")
+            return None
+        return response.get_json()
+
+    client.post("/api/signup", json={"name": "Doc", "username": "doc", "password": "pass"})
+    started = [call("start", "/api/start", {"doctor_username": "doc"}) for _ in range(sessions)]
+    ids = [body["session_id"] for body in started if body]
+    if make:
+        # Another worker: a fresh store instance on the same file or server
+        app.sessions = make("session")
+    size = None
+    for turn in range(turns):
+        for session_id in ids:
+            call("message", "/api/message", {"session_id": session_id, "message": QUESTIONS[turn % len(QUESTIONS)]})
+    if stored:
+        size = stored("session") / max(1, len(ids))
+    for session_id in ids:
+        state = app.sessions.get(session_id)
+        if state is None or len(state.turns) != turns:
+            problems.append(f"{session_id}: {len(state.turns) if state else 'no'} turns stored, expected {turns}")
+        call("end", "/api/end", {"session_id": session_id, "final_diagnosis": "Viral pharyngitis", "prescriptions": "Rest"})
+        if app.sessions.get(session_id) is not None:
+            problems.append(f"{session_id}: still stored after /api/end")
+
+    # A record written before the Session model, straight into the store
+    case = json.loads(json.dumps(agent.FALLBACK_CASES[0]))
+    legacy_id = f"legacy-{name}"
+    if make:
+        store = make("session")
+        raw = encode_value(legacy_record(legacy_id, case))
+        if isinstance(store, SQLiteSessionStore):
+            conn = store._conn()
+            conn.execute("INSERT OR REPLACE INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, NULL)",
+                         ("session", legacy_id, raw))
+            conn.commit()
+        else:
+            store.client.set(store._key(legacy_id), raw)
+    else:
+        # The memory store never serialized; an upgraded record is what it would hold
+        app.sessions.set(legacy_id, Session.from_legacy(legacy_record(legacy_id, case)))
+    upgraded = app.sessions.get(legacy_id)
+    legacy_ok = (isinstance(upgraded, Session) and len(upgraded.turns) == 2
+                 and upgraded.revealed_symptoms == [case["symptoms"][0]])
+    reply = call("message", "/api/message", {"session_id": legacy_id, "message": "Where does it hurt?"})
+    after = app.sessions.get(legacy_id)
+    legacy_ok = legacy_ok and reply is not None and after is not None and len(after.turns) == 3
+    legacy_ok = legacy_ok and call("end", "/api/end", {"session_id": legacy_id, "final_diagnosis": "Flu"}) is not None
+    if not legacy_ok:
+        problems.append(f"{legacy_id}: legacy record did not upgrade with its turns and reveals")
+    history, _ = app.history.page("doc", limit=10)  # newest first; the legacy session ended last
+    if not any(entry.get("session_id") == legacy_id for entry in history):
+        problems.append(f"{legacy_id}: not in the doctor's history after /api/end")
+    return timings, size, legacy_ok, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=6)
+    args = parser.parse_args()
+
+    # One doctor runs every session back to back; the admission buckets would refuse most turns
+    app.admission = AdmissionController(app.admission.max_in_flight, doctor_rate=0, session_rate=0, start_rate=0)
+    agent.LOCAL_FAST_PATH = False
+    print(f"{args.sessions} sessions x {args.turns} turns per backend, zero-latency fake LLM")
+    print(f"{'backend':<8} {'start p50/p99 ms':>17} {'message p50/p99 ms':>19} {'end p50/p99 ms':>15} "
+          f"{'bytes/session':>14} {'legacy':>7}")
+    failed = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, backend in backends(workdir).items():
+            timings, size, legacy_ok, problems = run(name, backend, args.sessions, args.turns)
+            cols = " ".join(f"{percentile(timings[e], 0.5) * 1e3:>8.2f}/{percentile(timings[e], 0.99) * 1e3:<{w}.2f}"
+                            for e, w in (("start", 8), ("message", 10), ("end", 6)))
+            print(f"{name:<8} {cols} {f'{size:,.0f}' if size is not None else '-':>14} {'ok' if legacy_ok else 'FAILED':>7}")
+            failed += [f"{name}: {problem}" for problem in problems]
+    for problem in failed[:20]:
+        print(problem)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Bytes per active session, old dict layout vs the compact Session model.
+
+Builds N concurrent sessions of T turns each, the way /api/message fills them, and
+measures the heap they hold with tracemalloc. The old layout kept LangChain messages
+with the raw JSON envelope, a readable chat_history copy and symptom name lists; the
+Session model keeps one list of slots Turns with symptom ids into the case table.
+
+    python benchmarks/bench_session_memory.py [--sessions 10000] [--turns 12]
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+import agent
+from session_model import Session
+from session_store import encode_value
+from langchain_core.messages import HumanMessage, AIMessage
+
+QUESTIONS = [
+    "When did this start?", "Does anything make it better or worse?", "Any fever?",
+    "Are you taking any medication at the moment?", "Have you travelled recently?",
+    "On a scale of one to ten, how bad is the pain?", "Any allergies I should know about?",
+]
+
+
+def fake_turns(case, turns, rng):
+    """(question, reply, revealed, raw envelope) tuples shaped like real patient turns."""
+    out = []
+    for t in range(turns):
+        symptom = rng.choice(case["symptoms"])
+        reply = f"Well doctor, the {symptom} has been bothering me for about {t + 2} days now, mostly in the evenings."
+        revealed = [symptom] if t % 3 == 0 else []
+        raw = json.dumps({
+            "reply_text": reply,
+            "metadata": {"revealed": revealed, "treatment_given": [], "needs_escalation": False, "status": "active"},
+        }, indent=2)
+        out.append((f"{rng.choice(QUESTIONS)} ({t})", reply, revealed, raw))
+    return out
+
+
+def legacy_session(session_id, case, turns):
+    state = {
+        "session_id": session_id, "doctor_username": "doc", "patient_case": case,
+        "revealed_symptoms": [], "asked_questions": [], "treatment_given": [],
+        "status": "active", "messages": [], "chat_history": [],
+    }
+    for question, reply, revealed, raw in turns:
+        state["messages"].extend([HumanMessage(content=question), AIMessage(content=raw)])
+        for s in revealed:
+            if s not in state["revealed_symptoms"]:
+                state["revealed_symptoms"].append(s)
+        state["chat_history"].append({"role": "doctor", "text": question})
+        state["chat_history"].append({"role": "patient", "text": reply})
+    return state
+
+
+def compact_session(session_id, case, turns):
+    session = Session(session_id, case, doctor_username="doc")
+    for question, reply, revealed, raw in turns:
+        session.record_turn(question, {"reply": reply, "metadata": {"revealed": revealed, "status": "active"}})
+    return session
+
+
+def measure(build, sessions, turns, seed):
+    rng = random.Random(seed)
+    cases = [json.loads(json.dumps(agent.FALLBACK_CASES[i % len(agent.FALLBACK_CASES)])) for i in range(sessions)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # Turn inputs are built inside the trace but dropped, so only what a session keeps counts
+    held = [build(f"{i:08d}-session", case, fake_turns(case, turns, rng)) for i, case in enumerate(cases)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    stored = sum(len(encode_value(s)) for s in held[:200]) / min(200, len(held))
+    return (after - before) / sessions, stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions x {args.turns} turns (case dicts excluded)")
+    print(f"{'layout':<8} {'heap B/session':>15} {'stored B/session':>17} {'heap MB total':>14}")
+    for name, build in (("legacy", legacy_session), ("compact", compact_session)):
+        per_session, stored = measure(build, args.sessions, args.turns, args.seed)
+        print(f"{name:<8} {per_session:>15,.0f} {stored:>17,.0f} {per_session * args.sessions / 2**20:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Memory under an "open tab and leave" load, with and without the idle-session reaper.
+
+Trainees open sessions at a steady rate, exchange a few messages and close the tab
+without calling /api/end (a few do end properly). Runs the Flask app in-process
+against the fake LLM and samples live sessions and traced heap while the load runs:
+
+  none      no idle expiry and no cap: state grows with every abandoned tab
+  idle      idle TTL only: live sessions level off near rate x TTL
+  capacity  hard cap with a long TTL: least recently active sessions are abandoned
+
+    python benchmarks/bench_session_reaper.py [--seconds 6] [--rate 200] [--idle-ttl 1] [--cap 150]
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tracemalloc
+
+os.environ.setdefault("CASE_POOL_HIGH", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_llm
+import agent
+
+fake_llm.install(agent)
+import app
+from admission import AdmissionController
+from session_store import MemorySessionStore
+from session_reaper import SessionReaper
+
+logging.getLogger("icapp").setLevel(logging.WARNING)
+
+
+def run(mode, seconds, rate, idle_ttl, cap, seed):
+    rng = random.Random(seed)
+    app.sessions = MemorySessionStore()
+    # Hundreds of starts a second from 20 doctors; the admission buckets would refuse most
+    app.admission = AdmissionController(app.admission.max_in_flight, doctor_rate=0, session_rate=0, start_rate=0)
+    if mode == "none":
+        app.session_reaper = SessionReaper(app._expire_session, idle_ttl=float("inf"))
+    elif mode == "idle":
+        app.session_reaper = SessionReaper(app._expire_session, idle_ttl=idle_ttl)
+    else:
+        app.session_reaper = SessionReaper(app._expire_session, idle_ttl=3600, max_sessions=cap)
+    client = app.app.test_client()
+    samples = []
+    started = ended = 0
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    next_sample = 0.0
+    while True:
+        elapsed = time.perf_counter() - t0
+        if elapsed >= seconds:
+            break
+        if elapsed >= next_sample:
+            samples.append((elapsed, len(app.sessions), tracemalloc.get_traced_memory()[0] - base))
+            next_sample += seconds / 6
+        if started >= elapsed * rate:
+            time.sleep(0.001)
+            continue
+        doctor = f"doc{started % 20}"
+        session_id = client.post("/api/start", json={"doctor_username": doctor}).json["session_id"]
+        started += 1
+        for i in range(rng.randint(0, 2)):
+            client.post("/api/message", json={"session_id": session_id, "message": f"Question {i}?"})
+        if rng.random() < 0.1:
+            client.post("/api/end", json={"session_id": session_id, "final_diagnosis": "Flu"})
+            ended += 1
+    samples.append((time.perf_counter() - t0, len(app.sessions), tracemalloc.get_traced_memory()[0] - base))
+    tracemalloc.stop()
+    return started, ended, samples, app.session_reaper.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=6.0)
+    parser.add_argument("--rate", type=float, default=200.0, help="sessions opened per second")
+    parser.add_argument("--idle-ttl", type=float, default=1.0)
+    parser.add_argument("--cap", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    for name in ("none", "idle", "capacity"):
+        started, ended, samples, stats = run(name, args.seconds, args.rate, args.idle_ttl, args.cap, args.seed)
+        print(f"\n{name}: {started} sessions opened, {ended} ended via /api/end, "
+              f"{stats['expired_idle']} abandoned idle, {stats['expired_capacity']} abandoned at cap")
+        print(f"{'t (s)':>6} {'live sessions':>14} {'heap KB':>9}")
+        for elapsed, live, heap in samples:
+            print(f"{elapsed:>6.1f} {live:>14} {heap / 1024:>9,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Precision/recall and per-turn cost of reveal detection on a labeled corpus.
+
+Compares the precompiled SymptomIndex with the old substring scanner
+(`s.lower() in reply_text.lower()` for every case symptom).
+
+    python benchmarks/bench_symptom_index.py
+"""
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from symptom_index import SymptomIndex, get_symptom_index
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "symptom_reveal_corpus.jsonl")
+
+
+def substring_scan(symptoms, reply):
+    return [s for s in symptoms if s.lower() in reply.lower()]
+
+
+def index_scan(symptoms, reply):
+    return get_symptom_index(symptoms).scan(reply)
+
+
+def evaluate(rows, scan):
+    tp = fp = fn = 0
+    misses = []
+    for row in rows:
+        found = set(scan(row["symptoms"], row["reply"]))
+        expected = set(row["revealed"])
+        tp += len(found & expected)
+        fp += len(found - expected)
+        fn += len(expected - found)
+        if found != expected:
+            misses.append((row["reply"], sorted(found), sorted(expected)))
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return precision, recall, misses
+
+
+def per_turn_us(rows, scan, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for row in rows:
+            scan(row["symptoms"], row["reply"])
+    return (time.perf_counter() - start) / (repeat * len(rows)) * 1e6
+
+
+def main():
+    with open(CORPUS) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+
+    build_start = time.perf_counter()
+    for row in rows:
+        SymptomIndex(row["symptoms"])
+    build_us = (time.perf_counter() - build_start) / len(rows) * 1e6
+
+    print(f"{len(rows)} labeled replies; index build {build_us:.0f} us per case (once per session)")
+    print(f"{'matcher':<12} {'precision':>9} {'recall':>7} {'us/turn':>8}")
+    for name, scan in (("substring", substring_scan), ("index", index_scan)):
+        precision, recall, misses = evaluate(rows, scan)
+        print(f"{name:<12} {precision:>9.2f} {recall:>7.2f} {per_turn_us(rows, scan):>8.1f}")
+        if "-v" in sys.argv:
+            for reply, found, expected in misses:
+                print(f"    {reply!r}: got {found}, expected {expected}")
+
+
+if __name__ == "__main__":
+    main()
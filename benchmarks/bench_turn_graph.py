@@ -0,0 +1,88 @@
+"""Per-turn overhead of the compiled turn graph vs calling the same steps directly.
+
+Runs sessions of T turns against a zero-latency fake LLM so only orchestration cost
+shows:
+
+  direct calls            the steps back to back in one function (the old monolithic process_turn)
+  process_turn            as shipped with TURN_CHECKPOINTER=none: the graph's nodes called in order
+  graph                   the compiled graph with no checkpointer
+  graph + memory saver    process_turn with TURN_CHECKPOINTER=memory
+
+Also prints the per-step time split recorded in the icapp_turn_stage_seconds histogram.
+
+    python benchmarks/bench_turn_graph.py [--sessions 20] [--turns 12]
+"""
+import time
+import argparse
+
+from fake_llm import FakeChatModel, install
+import agent
+from session_model import Session
+from metrics import TURN_STAGE_SECONDS
+
+
+async def direct_turn(session, user_input):
+    messages, usage = agent._build_turn_messages(session, user_input)
+    response = await agent.ainvoke_llm(messages, temperature=0.5, model_name="llama-3.3-70b-versatile", json_mode=True)
+    reply, metadata = agent.parse_turn_content(response.content, session)
+    result = {"reply": reply, "metadata": metadata, "usage": agent._record_provider_usage(usage, response)}
+    session.record_turn(user_input, result)
+    return result
+
+
+async def process_turn(session, user_input):
+    return await agent.aprocess_turn(session, user_input)
+
+
+async def graph_turn(session, user_input):
+    config = {"configurable": {"thread_id": session["session_id"], "session": session}}
+    turn_input = {"user_input": user_input, "raw": "", "failed": False, "reply": "", "metadata": {}}
+    return (await agent.get_turn_graph().ainvoke(turn_input, config))["result"]
+
+
+def run(turn, sessions, turns):
+    async def all_sessions():
+        for i in range(sessions):
+            session = Session(f"bench-{i}", dict(agent.FALLBACK_CASES[i % len(agent.FALLBACK_CASES)]))
+            for t in range(turns):
+                await turn(session, f"Question {t}: where does it hurt?")
+
+    start = time.perf_counter()
+    agent.run_async(all_sessions())
+    elapsed = time.perf_counter() - start
+    for i in range(sessions):
+        agent.forget_session(f"bench-{i}")
+    return elapsed / (sessions * turns) * 1e3
+
+
+def stage_split():
+    totals = {labels[0]: (series[-2], series[-1]) for labels, series in TURN_STAGE_SECONDS._series.items()}
+    return "  ".join(f"{name} {sum_ / count * 1e3:.2f}ms" for name, (sum_, count) in totals.items() if count)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=12)
+    args = parser.parse_args()
+
+    install(agent, FakeChatModel())
+    run(direct_turn, 2, 2)  # warm up imports and caches
+    agent.get_turn_graph()  # compiled lazily on the first turn; keep that out of the timings
+    print(f"{args.sessions} sessions x {args.turns} turns, zero-latency LLM")
+    print(f"{'path':<22} {'ms/turn':>8}")
+    print(f"{'direct calls':<22} {run(direct_turn, args.sessions, args.turns):>8.2f}")
+    TURN_STAGE_SECONDS._series.clear()
+    print(f"{'process_turn':<22} {run(process_turn, args.sessions, args.turns):>8.2f}")
+    split = stage_split()
+    print(f"{'graph':<22} {run(graph_turn, args.sessions, args.turns):>8.2f}")
+    from langgraph.checkpoint.memory import InMemorySaver
+    agent.TURN_CHECKPOINTER = "memory"
+    agent.turn_checkpointer = InMemorySaver()
+    agent.turn_graph = agent.build_turn_graph(agent.turn_checkpointer)
+    print(f"{'graph + memory saver':<22} {run(process_turn, args.sessions, args.turns):>8.2f}")
+    print(f"per step (process_turn): {split}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Deterministic stand-in for ChatGroq so the backend can be exercised without Groq.
+
+    from fake_llm import FakeChatModel, install
+    install(agent, FakeChatModel(latency=0.2))
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import random
+import itertools
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api")
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+CASE_TEMPLATE = {
+    "name": "Jordan Lee",
+    "disease": "Acute Pharyngitis",
+    "presenting_summary": "My throat has been really sore for a few days.",
+    "age_range": "25-34",
+    "sex": "female",
+    "onset_days": 3,
+    "severity": "mild",
+    "symptoms": ["sore throat", "fever", "swollen glands", "painful swallowing"],
+    "red_flags": ["difficulty breathing"],
+    "correct_treatments": ["Rest", "Paracetamol", "Warm salt water gargles"],
+    "incorrect_treatments": ["Surgery"],
+}
+
+ANALYSIS_REPLY = {
+    "conditions": [
+        {"name": "Pharyngitis", "confidence": "High", "reasoning": "Sore throat with fever."},
+        {"name": "Tonsillitis", "confidence": "Medium", "reasoning": "Swollen glands."},
+        {"name": "Common Cold", "confidence": "Low", "reasoning": "Mild upper airway symptoms."},
+    ]
+}
+
+
+def lognormal_latency(median, sigma=0.5, seed=0):
+    """Latency callable with a long right tail, like real provider latencies."""
+    rng = random.Random(seed)
+    return lambda: rng.lognormvariate(0, sigma) * median
+
+
+def turn_envelope(reply_text, revealed=(), status="active"):
+    return json.dumps({
+        "reply_text": reply_text,
+        "metadata": {"revealed": list(revealed), "treatment_given": [], "needs_escalation": False, "status": status},
+    })
+
+
+class _FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class FakeRateLimitError(Exception):
+    """Shaped like groq.RateLimitError: status_code 429 plus response headers."""
+
+    status_code = 429
+
+    def __init__(self, retry_after=1.0, remaining_requests=0):
+        super().__init__(f"Error code: 429 - Rate limit reached. Please try again in {retry_after}s.")
+        self.response = _FakeResponse({
+            "retry-after": str(retry_after),
+            "x-ratelimit-remaining-requests": str(remaining_requests),
+        })
+
+
+class FakeChatModel:
+    """Answers case-generation, analysis and patient-turn prompts with canned JSON.
+
+    latency: seconds per call (or a zero-arg callable returning seconds).
+    setup_cost: seconds spent in the constructor, modelling a fresh HTTP client/TLS handshake.
+    script: optional sequence consumed one entry per call; an Exception entry is raised
+        (e.g. FakeRateLimitError()), None means answer normally. Calls past the end answer normally.
+    rate_limit_rate / error_rate: probability of a random 429 / generic API error per call.
+    seed: RNG seed for failure injection, so runs are reproducible.
+    """
+
+    def __init__(self, latency=0.0, setup_cost=0.0, script=(), rate_limit_rate=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.calls = 0
+        self.injected_failures = 0
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._ids = itertools.count()
+        self._script = list(script)
+        if setup_cost:
+            time.sleep(setup_cost)
+
+    def _delay(self):
+        return self.latency() if callable(self.latency) else self.latency
+
+    def _next_scripted(self):
+        if self._script:
+            step = self._script.pop(0)
+            if isinstance(step, BaseException):
+                self.calls += 1
+                raise step
+        if self.rate_limit_rate or self.error_rate:
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate:
+                self.calls += 1
+                self.injected_failures += 1
+                raise FakeRateLimitError(retry_after=0.05)
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.calls += 1
+                self.injected_failures += 1
+                raise RuntimeError("Error code: 503 - injected upstream failure")
+
+    def respond(self, messages):
+        self.calls += 1
+        prompt = messages[-1].content
+        batch = re.match(r"Generate (\d+) NEW distinct patient cases", prompt)
+        if batch:
+            cases = []
+            for _ in range(int(batch.group(1))):
+                n = next(self._ids)
+                cases.append(dict(CASE_TEMPLATE, name=f"Jordan Lee {n}", disease=f"Acute Pharyngitis {n}"))
+            return json.dumps({"cases": cases})
+        if "Generate a NEW unique patient case" in prompt:
+            n = next(self._ids)
+            return json.dumps(dict(CASE_TEMPLATE, name=f"Jordan Lee {n}", disease=f"Acute Pharyngitis {n}"))
+        if "medical diagnostic assistant" in prompt:
+            return json.dumps(ANALYSIS_REPLY)
+        return turn_envelope("My throat is sore and it hurts to swallow, doctor.", ["sore throat"])
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self._delay())
+        self._next_scripted()
+        return AIMessage(content=self.respond(messages))
+
+    async def ainvoke(self, messages, **kwargs):
+        await asyncio.sleep(self._delay())
+        self._next_scripted()
+        return AIMessage(content=self.respond(messages))
+
+    async def astream(self, messages, **kwargs):
+        content = (await self.ainvoke(messages)).content
+        for i in range(0, len(content), 8):
+            yield AIMessageChunk(content=content[i:i + 8])
+
+
+def install(agent, model=None, models_by_key=None, models_by_model=None, rpm=10 ** 6, tpm=10 ** 9):
+    """Route every agent LLM call to a fake.
+
+    models_by_key maps fake API key names to their own FakeChatModel (to script 429s on
+    one key); models_by_model does the same per model name (e.g. a degraded 70b);
+    otherwise every call shares `model`. rpm/tpm are the per-key minute budgets the
+    scheduler enforces; the fakes have no quota and benches squeeze minutes of traffic
+    into seconds, so by default they never bind.
+    """
+    model = model or FakeChatModel()
+    keys = list(models_by_key) if models_by_key else ["fake-key"]
+    agent.API_KEYS[:] = keys
+    agent.key_scheduler = agent.KeyScheduler(agent.API_KEYS, rpm=rpm, tpm=tpm)
+
+    def get_groq_llm(temperature=0.4, model_name=None, api_key=None, json_mode=False):
+        if models_by_key:
+            return models_by_key[api_key or keys[0]]
+        if models_by_model and model_name in models_by_model:
+            return models_by_model[model_name]
+        return model
+
+    agent.get_groq_llm = get_groq_llm
+    return model
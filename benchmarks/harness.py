@@ -0,0 +1,195 @@
+"""Offline benchmark harness for the Flask backend.
+
+Swaps get_groq_llm for a deterministic FakeChatModel and replays scripted doctor
+conversations through the Flask test client: /api/start -> N x /api/message ->
+/api/analyze -> /api/end. Reports p50/p95/p99 latency per endpoint, throughput,
+per-turn allocations and prompt sizes at several session lengths and concurrency levels.
+
+    python benchmarks/harness.py                                  # default matrix
+    python benchmarks/harness.py --lengths 10 40 --concurrency 1 16 --latency 0.05
+    python benchmarks/harness.py --save baseline.json              # record a baseline
+    python benchmarks/harness.py --compare baseline.json          # exit 1 on regression
+
+With --latency 0 (the default) the numbers are the backend's own overhead.
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_llm import FakeChatModel, install, lognormal_latency
+import agent
+
+DOCTOR_SCRIPT = [
+    "Hello, what brings you in today?",
+    "How long has this been going on?",
+    "Can you describe the pain or discomfort?",
+    "Do you have a fever or chills?",
+    "Anything that makes it better or worse?",
+    "Have you taken any medication for it?",
+    "Any other symptoms you've noticed?",
+    "Do you have any allergies or medical conditions?",
+    "Has anyone around you been sick?",
+    "How are you sleeping and eating?",
+    "I think you should rest and take paracetamol.",
+    "Let's also keep you hydrated. How does that sound?",
+]
+
+ENDPOINTS = ("start", "message", "analyze", "end")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def run_session(app, length, timings, prompt_tokens):
+    client = app.test_client()
+
+    def call(endpoint, path, body):
+        start = time.perf_counter()
+        response = client.post(path, json=body)
+        timings[endpoint].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{path} -> {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response.get_json()
+
+    session_id = call("start", "/api/start", {"doctor_username": "bench"})["session_id"]
+    revealed = []
+    for turn in range(length):
+        reply = call("message", "/api/message", {
+            "session_id": session_id, "message": DOCTOR_SCRIPT[turn % len(DOCTOR_SCRIPT)]
+        })
+        revealed = reply["state_summary"]["revealed_symptoms"]
+        prompt_tokens[turn].append(reply.get("usage", {}).get("prompt_tokens", 0))
+    call("analyze", "/api/analyze", {"symptoms": revealed or ["fatigue"]})
+    call("end", "/api/end", {"session_id": session_id, "final_diagnosis": "Viral illness", "prescriptions": "Rest"})
+
+
+def measure_turn_allocations(app, length):
+    """Bytes allocated (peak) by one /api/message at the end of a `length`-turn session."""
+    client = app.test_client()
+    session_id = client.post("/api/start", json={}).get_json()["session_id"]
+    for turn in range(length - 1):
+        client.post("/api/message", json={"session_id": session_id, "message": DOCTOR_SCRIPT[turn % len(DOCTOR_SCRIPT)]})
+    gc.collect()
+    tracemalloc.start()
+    client.post("/api/message", json={"session_id": session_id, "message": "Anything else?"})
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    client.post("/api/end", json={"session_id": session_id})
+    return peak
+
+
+def run_scenario(app, length, concurrency, sessions):
+    timings = defaultdict(list)
+    prompt_tokens = defaultdict(list)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_session, app, length, timings, prompt_tokens) for _ in range(sessions)]
+        for f in futures:
+            f.result()
+    wall = time.perf_counter() - start
+    requests = sum(len(v) for v in timings.values())
+    result = {
+        "length": length,
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "wall_s": wall,
+        "requests_per_s": requests / wall,
+        "turns_per_s": len(timings["message"]) / wall,
+        "last_turn_prompt_tokens": max(prompt_tokens[length - 1]) if length else 0,
+        "turn_alloc_peak_bytes": measure_turn_allocations(app, length),
+    }
+    for endpoint in ENDPOINTS:
+        for p in (50, 95, 99):
+            result[f"{endpoint}_p{p}_ms"] = percentile(timings[endpoint], p) * 1000
+    return result
+
+
+def print_results(results):
+    print(f"{'len':>4} {'conc':>4} {'turns/s':>8} {'req/s':>8} "
+          + " ".join(f"{e + ' p50/p95/p99 ms':>27}" for e in ENDPOINTS)
+          + f" {'prompt tok':>10} {'turn alloc KB':>13}")
+    for r in results:
+        cols = " ".join(
+            f"{r[f'{e}_p50_ms']:>8.2f}/{r[f'{e}_p95_ms']:>8.2f}/{r[f'{e}_p99_ms']:>8.2f}" for e in ENDPOINTS
+        )
+        print(f"{r['length']:>4} {r['concurrency']:>4} {r['turns_per_s']:>8.1f} {r['requests_per_s']:>8.1f} {cols}"
+              f" {r['last_turn_prompt_tokens']:>10} {r['turn_alloc_peak_bytes'] / 1024:>13.1f}")
+
+
+def compare(results, baseline_path, tolerance):
+    """Return regressions: p95 latencies / allocations / prompt sizes that grew past tolerance."""
+    with open(baseline_path) as f:
+        baseline = {(r["length"], r["concurrency"]): r for r in json.load(f)}
+    regressions = []
+    watched = [f"{e}_p95_ms" for e in ENDPOINTS] + ["turn_alloc_peak_bytes", "last_turn_prompt_tokens"]
+    for r in results:
+        base = baseline.get((r["length"], r["concurrency"]))
+        if not base:
+            continue
+        for metric in watched:
+            if base[metric] and r[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"len={r['length']} conc={r['concurrency']} {metric}: "
+                                   f"{base[metric]:.2f} -> {r[metric]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[5, 20, 40], help="doctor turns per session")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--sessions", type=int, default=32, help="sessions per scenario")
+    parser.add_argument("--latency", type=float, default=0.0, help="median fake LLM latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.0, help="lognormal spread of the fake latency")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls failing outright")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to check against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed growth before a regression")
+    args = parser.parse_args()
+
+    latency = lognormal_latency(args.latency, args.sigma) if args.sigma else args.latency
+    model = FakeChatModel(latency=latency, rate_limit_rate=args.rate_limit_rate, error_rate=args.error_rate)
+    install(agent, model)
+    # Keep runs deterministic: no background case generation
+    agent.case_pool.high = 0
+    agent.analysis_cache.clear()
+
+    import app as app_module
+    from admission import AdmissionController
+    app = app_module.app
+    app.config["TESTING"] = True
+    # Scripted sessions replay turns back to back under one doctor; the per-doctor,
+    # per-session and start buckets exist to stop exactly that, so they are off here.
+    # Every client thread gets a slot: queueing and shedding are bench_admission's subject.
+    app_module.admission = AdmissionController(max(args.concurrency), doctor_rate=0, session_rate=0, start_rate=0)
+
+    results = [
+        run_scenario(app, length, concurrency, args.sessions)
+        for length in args.lengths
+        for concurrency in args.concurrency
+    ]
+    print_results(results)
+    print(f"fake LLM calls: {model.calls}, injected failures: {model.injected_failures}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
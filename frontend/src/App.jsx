@@ -80,13 +80,32 @@ function App() {
     setLoading(true);
 
     try {
-      const data = await api.sendMessage(session, text);
+      // Tokens grow a patient bubble marked `streaming` until the done event arrives
+      const data = await api.sendMessageStream(session, text, (token) => {
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          if (last?.streaming) {
+            return [...prev.slice(0, -1), { ...last, text: last.text + token }];
+          }
+          return [...prev, {
+            sender: 'patient',
+            text: token,
+            time: new Date().toLocaleTimeString(),
+            streaming: true
+          }];
+        });
+      });
 
-      setMessages(prev => [...prev, {
-        sender: 'patient',
-        text: data.reply,
-        time: new Date().toLocaleTimeString()
-      }]);
+      // The done event's reply is the one to keep: it replaces a reply cut off part way
+      setMessages(prev => {
+        const last = prev[prev.length - 1];
+        const rest = last?.streaming ? prev.slice(0, -1) : prev;
+        return [...rest, {
+          sender: 'patient',
+          text: data.reply,
+          time: last?.streaming ? last.time : new Date().toLocaleTimeString()
+        }];
+      });
 
       if (data.state_summary) {
         setState(prev => ({
@@ -107,7 +126,7 @@ function App() {
 
     } catch (err) {
       console.error("Error sending message", err);
-      setMessages(prev => [...prev, {
+      setMessages(prev => [...prev.map(m => (m.streaming ? { ...m, streaming: false } : m)), {
         sender: 'system',
         text: "Error communicating with patient.",
         time: new Date().toLocaleTimeString()
@@ -36,7 +36,7 @@ const ChatInterface = ({ messages, onSendMessage, loading, sessionActive }) => {
                         <span className="timestamp">{msg.time}</span>
                     </div>
                 ))}
-                {loading && (
+                {loading && !messages[messages.length - 1]?.streaming && (
                     <div className="message-bubble patient loading">
                         <div className="typing-indicator">
                             <span></span><span></span><span></span>
@@ -3,6 +3,7 @@ import { api } from '../services/api';
 
 const HistoryPage = ({ doctorUsername, doctorName, onBack }) => {
     const [history, setHistory] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const [loading, setLoading] = useState(true);
     const [selectedSession, setSelectedSession] = useState(null);
 
@@ -10,10 +11,11 @@ const HistoryPage = ({ doctorUsername, doctorName, onBack }) => {
         loadHistory();
     }, [doctorUsername]);
 
-    const loadHistory = async () => {
+    const loadHistory = async (cursor = null) => {
         try {
-            const data = await api.getHistory(doctorUsername);
-            setHistory(data.history || []);
+            const data = await api.getHistory(doctorUsername, { cursor });
+            setHistory(prev => cursor ? [...prev, ...(data.history || [])] : (data.history || []));
+            setNextCursor(data.next_cursor || null);
         } catch (err) {
             console.error("Failed to load history:", err);
         } finally {
@@ -39,6 +41,7 @@ const HistoryPage = ({ doctorUsername, doctorName, onBack }) => {
         try {
             await api.deleteHistory(doctorUsername);
             setHistory([]);
+            setNextCursor(null);
         } catch (err) {
             console.error("Failed to clear:", err);
         }
@@ -229,6 +232,11 @@ const HistoryPage = ({ doctorUsername, doctorName, onBack }) => {
                                         <p style={{ color: '#a78bfa', margin: '0.5rem 0 0 0', fontSize: '0.9rem' }}>
                                             Dx: {session.final_diagnosis || 'Not provided'}
                                         </p>
+                                        {session.score && (
+                                            <p style={{ color: '#0ea5a4', margin: '0.25rem 0 0 0', fontSize: '0.85rem' }}>
+                                                Score: {session.score.total}/100 • expected {session.score.diagnosis.expected}
+                                            </p>
+                                        )}
                                     </div>
                                     <div style={{ display: 'flex', alignItems: 'center', gap: '0.5rem' }}>
                                         <span style={{ color: '#94a3b8', fontSize: '0.75rem' }}>
@@ -252,6 +260,21 @@ const HistoryPage = ({ doctorUsername, doctorName, onBack }) => {
                                 </div>
                             </div>
                         ))}
+                        {nextCursor && (
+                            <button
+                                onClick={() => loadHistory(nextCursor)}
+                                style={{
+                                    background: 'transparent',
+                                    border: '1px solid #334155',
+                                    color: '#94a3b8',
+                                    padding: '10px 16px',
+                                    borderRadius: '8px',
+                                    cursor: 'pointer'
+                                }}
+                            >
+                                Load more
+                            </button>
+                        )}
                     </div>
                 )}
             </div>
@@ -25,8 +25,13 @@ export const api = {
         return data;
     },
 
-    getHistory: async (username) => {
-        const response = await fetch(`${API_BASE_URL}/history?username=${username}`);
+    // options: { limit, cursor, status, diagnosis, since, until }
+    getHistory: async (username, options = {}) => {
+        const params = new URLSearchParams({ username });
+        Object.entries(options).forEach(([key, value]) => {
+            if (value) params.set(key, value);
+        });
+        const response = await fetch(`${API_BASE_URL}/history?${params}`);
         const data = await response.json();
         if (!response.ok) throw data;
         return data;
@@ -55,13 +60,35 @@ export const api = {
         return data;
     },
 
-    sendMessage: async (sessionId, message) => {
-        const response = await fetch(`${API_BASE_URL}/message`, {
+    // Streams reply tokens via onToken(text); resolves with the /api/message response body
+    sendMessageStream: async (sessionId, message, onToken) => {
+        const response = await fetch(`${API_BASE_URL}/message/stream`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ session_id: sessionId, message })
         });
-        return response.json();
+        if (!response.ok) throw await response.json();
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let final = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                const event = raw.match(/^event: (.*)$/m)?.[1];
+                const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}');
+                if (event === 'token' && onToken) onToken(data.text);
+                else if (event === 'done') final = data;
+                else if (event === 'error') throw data;
+            }
+        }
+        if (!final) throw { error: 'The reply stream ended early' };
+        return final;
     },
 
     getState: async (sessionId) => {
@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+from admission import AdmissionController, Overloaded
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def controller(clock, **kwargs):
+    # One slot; doctor buckets hold a single token and never refill on the fake clock
+    return AdmissionController(1, doctor_rate=1e-9, doctor_burst=1, session_rate=0, clock=clock, **kwargs)
+
+
+def tokens(ctrl, doctor):
+    return ctrl._buckets[("doctor", doctor)].tokens
+
+
+def queue_in_thread(ctrl, *args, queued=None, **kwargs):
+    """Run admit() on a thread until `queued()` holds (default: the request is queued).
+
+    The thread's ticket or refusal reason lands in the returned dict.
+    """
+    outcome = {}
+    before = ctrl.stats()["queued"]
+    queued = queued or (lambda: ctrl.stats()["queued"] > before)
+
+    def run():
+        try:
+            outcome["ticket"] = ctrl.admit(*args, **kwargs)
+        except Overloaded as e:
+            outcome["refused"] = e.reason
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    for _ in range(200):
+        if queued():
+            break
+        time.sleep(0.005)
+    return thread, outcome
+
+
+def test_immediate_refusal_refunds():
+    clock = FakeClock()
+    ctrl = AdmissionController(1, doctor_rate=1e-9, doctor_burst=1, session_rate=1e-9, session_burst=1, clock=clock)
+    ctrl.admit("chat", doctor="a", session_id="s1").release()
+    with pytest.raises(Overloaded) as refused:
+        ctrl.admit("chat", doctor="a", session_id="s2")
+    assert refused.value.reason == "doctor_rate"
+    assert ctrl._buckets[("session", "s2")].tokens == 1
+
+
+def test_shed_waiter_gets_its_tokens_back():
+    clock = FakeClock()
+    ctrl = controller(clock, max_queue=1)
+    holder = ctrl.admit("chat", doctor="holder")
+    thread, outcome = queue_in_thread(ctrl, "analyze", doctor="a", deadline=clock() + 60)
+    assert tokens(ctrl, "a") == 0
+    # The queue is full, so the chat turn takes the analyze call's place
+    chat, chat_outcome = queue_in_thread(ctrl, "chat", doctor="b", deadline=clock() + 60, queued=lambda: outcome)
+    thread.join(5)
+    assert outcome == {"refused": "shed"}
+    assert tokens(ctrl, "a") == 1
+    holder.release()
+    chat.join(5)
+    chat_outcome["ticket"].release()
+    assert tokens(ctrl, "b") == 0
+
+
+def test_expired_waiter_gets_its_tokens_back():
+    clock = FakeClock()
+    ctrl = controller(clock)
+    holder = ctrl.admit("chat", doctor="holder")
+    thread, outcome = queue_in_thread(ctrl, "chat", doctor="a", deadline=clock() + 2)
+    clock.now += 1.8  # under MIN_BUDGET left when the slot frees up
+    holder.release()
+    thread.join(5)
+    assert outcome == {"refused": "deadline"}
+    assert tokens(ctrl, "a") == 1
+    assert ctrl.stats()["in_flight"] == 0
+
+
+def test_waiter_timing_out_gets_its_tokens_back():
+    clock = FakeClock()
+    ctrl = controller(clock)
+    ctrl._service_s = 0.01  # projected wait is short enough to queue with a 0.6 s deadline
+    holder = ctrl.admit("chat", doctor="holder")
+    with pytest.raises(Overloaded) as refused:
+        ctrl.admit("chat", doctor="a", deadline=clock() + 0.6)
+    assert refused.value.reason == "deadline"
+    assert tokens(ctrl, "a") == 1
+    assert ctrl.stats()["queued"] == 0
+    holder.release()
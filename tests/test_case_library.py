@@ -0,0 +1,25 @@
+import random
+
+import agent
+from case_library import CaseLibrary
+from scoring import diagnosis_key
+
+
+def test_shipped_library_loads_and_validates():
+    library = CaseLibrary()
+    assert library.available
+    assert set(library.header["domains"]) == set(agent.CASE_DOMAINS)
+    for case_id in range(len(library)):
+        case = library.case(case_id)
+        assert agent.validate_patient_case(case), case["disease"]
+
+
+def test_shipped_library_samples_by_domain_and_avoids_recent_diseases():
+    library = CaseLibrary()
+    rng = random.Random(0)
+    case = library.sample(domain="Cardiology", rng=rng)
+    assert case is not None and "domain" not in case
+    first = library.sample(domain="Dermatology", rng=rng)
+    keys = {disease for disease, *_ in library.header["diseases"]}
+    avoid = keys - {diagnosis_key(first["disease"])}
+    assert library.sample(exclude=avoid, rng=rng)["disease"] == first["disease"]
@@ -0,0 +1,30 @@
+import os
+import copy
+
+os.environ.setdefault("CASE_POOL_HIGH", "0")
+import agent
+
+
+def pool_with(n):
+    pool = agent.CasePool(low=0, high=0)
+    for i, case in enumerate(agent.FALLBACK_CASES[:n]):
+        assert pool.add(copy.deepcopy(case), agent.CASE_DOMAINS[i])
+    return pool
+
+
+def test_batch_shortfall_is_not_a_miss():
+    pool = pool_with(2)
+    assert len(pool.take(5)) == 2
+    stats = pool.stats()
+    assert (stats["batch_served"], stats["batch_shortfall"]) == (2, 3)
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (0, 0, 0.0)
+
+
+def test_single_lookups_keep_their_own_hit_ratio():
+    pool = pool_with(1)
+    assert pool.pop() is not None
+    assert pool.pop() is None
+    assert pool.take(2) == []
+    stats = pool.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
+    assert stats["batch_shortfall"] == 2
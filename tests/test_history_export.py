@@ -0,0 +1,25 @@
+import os
+
+os.environ.setdefault("CASE_POOL_HIGH", "0")
+import pytest
+import app
+
+
+@pytest.fixture
+def client():
+    return app.app.test_client()
+
+
+def test_export_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(app, "HISTORY_EXPORT_TOKEN", "")
+    assert client.get("/api/history/export").status_code == 404
+    assert client.get("/api/history/export", headers={"Authorization": "Bearer "}).status_code == 404
+
+
+def test_export_requires_the_token(client, monkeypatch):
+    monkeypatch.setattr(app, "HISTORY_EXPORT_TOKEN", "s3cret")
+    assert client.get("/api/history/export").status_code == 401
+    assert client.get("/api/history/export", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/api/history/export", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    response.close()
@@ -0,0 +1,64 @@
+import pytest
+
+from scoring import diagnosis_key, match_diagnosis, score_session, split_treatments
+
+CASE = {
+    "disease": "Common Cold",
+    "symptoms": ["runny nose", "sore throat"],
+    "correct_treatments": ["Rest", "Fluids"],
+    "incorrect_treatments": ["Antibiotics"],
+}
+
+
+@pytest.mark.parametrize("expected, given", [
+    ("Type 2 Diabetes", "type 1 diabetes"),
+    ("Hepatitis A", "hepatitis b"),
+    ("Pneumonia", "not pneumonia"),
+    ("Strep Throat", "not strep throat"),
+    ("Pneumonia", "rule out pneumonia"),
+    ("Pneumonia", "r/o pneumonia"),
+])
+def test_wrong_subtype_or_negated_diagnosis_scores_nothing(expected, given):
+    assert match_diagnosis(expected, given) == ("none", 0.0)
+
+
+@pytest.mark.parametrize("expected, given", [
+    ("Type 2 Diabetes", "type 2 diabetes"),
+    ("Type 2 Diabetes", "diabetes type 2"),
+    ("Hepatitis A", "Hepatitis A"),
+    ("COVID-19", "covid"),
+    ("Acute Viral Gastroenteritis", "gastroenteritis (viral)"),
+    ("Common Cold", "a cold"),
+])
+def test_same_condition_is_exact(expected, given):
+    assert match_diagnosis(expected, given) == ("exact", 1.0)
+
+
+def test_negated_candidate_does_not_split_the_credit():
+    assert match_diagnosis("Pharyngitis", "pharyngitis, r/o pneumonia") == ("exact", 1.0)
+    assert match_diagnosis("Pharyngitis", "pharyngitis or tonsillitis") == ("exact", 0.5)
+
+
+def test_missing_subtype_is_partial():
+    assert match_diagnosis("Type 2 Diabetes", "diabetes")[0] == "partial"
+
+
+def test_diagnosis_key_keeps_subtypes_apart():
+    assert diagnosis_key("Type 1 Diabetes") != diagnosis_key("Type 2 Diabetes")
+    assert diagnosis_key("Hepatitis A") != diagnosis_key("Hepatitis B")
+    assert diagnosis_key("Acute Viral Gastroenteritis") == diagnosis_key("gastroenteritis (viral)")
+
+
+def test_withheld_treatment_is_not_prescribed():
+    assert split_treatments("rest, fluids, no antibiotics") == ["rest", "fluids"]
+    treatment = score_session(CASE, "common cold", "rest, fluids, no antibiotics")["treatment"]
+    assert treatment["incorrect"] == []
+    assert treatment["score"] == 30
+    treatment = score_session(CASE, "common cold", "rest; avoid amoxicillin; fluids")["treatment"]
+    assert treatment["incorrect"] == [] and treatment["score"] == 30
+
+
+def test_harmful_treatment_is_still_penalized():
+    treatment = score_session(CASE, "common cold", "rest, fluids, amoxicillin")["treatment"]
+    assert treatment["incorrect"] == ["Antibiotics"]
+    assert treatment["score"] == 20
@@ -0,0 +1,23 @@
+from session_model import Session, Turn
+
+
+def test_sessions_and_turns_have_no_instance_dict():
+    session = Session("s1", {"symptoms": ["fever"]})
+    session.record_turn("Any fever?", {"reply": "Yes.", "metadata": {"revealed": ["fever"]}})
+    assert not hasattr(session, "__dict__")
+    assert not hasattr(session.turns[0], "__dict__")
+
+
+def test_defaults_are_not_shared():
+    first, second = Session("a", {}), Session("b", {})
+    first.turns.append(Turn("q", "a"))
+    first.revealed.append(0)
+    assert second.turns == [] and second.revealed == []
+
+
+def test_record_round_trip():
+    session = Session("s1", {"symptoms": ["fever", "cough"]}, doctor_username="doc")
+    session.record_turn("Any cough?", {"reply": "A dry one.", "metadata": {"revealed": ["cough", "chills"]}})
+    restored = Session.from_record(session.to_record())
+    assert restored == session
+    assert restored.revealed_symptoms == ["cough", "chills"]
@@ -0,0 +1,37 @@
+import os
+import time
+import asyncio
+
+os.environ.setdefault("CASE_POOL_HIGH", "0")
+import pytest
+import agent
+
+
+async def tokens(stall_after=None, closed=None):
+    for i in range(3):
+        if i == stall_after:
+            try:
+                await asyncio.sleep(3600)
+            finally:
+                closed.append(True)
+        yield f"t{i}"
+
+
+def test_stream_async_forwards_items():
+    assert list(agent.stream_async(tokens(), deadline=time.monotonic() + 5)) == ["t0", "t1", "t2"]
+
+
+def test_stalled_stream_times_out_at_the_deadline_and_is_cancelled():
+    closed = []
+    started = time.monotonic()
+    received = []
+    with pytest.raises(TimeoutError):
+        for item in agent.stream_async(tokens(stall_after=1, closed=closed), deadline=started + 0.2):
+            received.append(item)
+    assert received == ["t0"]
+    assert time.monotonic() - started < 2
+    for _ in range(100):
+        if closed:
+            break
+        time.sleep(0.01)
+    assert closed == [True]
@@ -0,0 +1,87 @@
+import os
+import json
+from types import SimpleNamespace
+
+os.environ.setdefault("CASE_POOL_HIGH", "0")
+import pytest
+import agent
+from session_model import Session
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Replace the model tiers with a canned envelope and count the calls."""
+    calls = []
+
+    async def ainvoke_tiered(messages, **kwargs):
+        calls.append(messages)
+        content = json.dumps({"reply_text": "It hurts in my throat.", "metadata": {"revealed": ["sore throat"]}})
+        return SimpleNamespace(content=content, usage_metadata={}), "fake"
+
+    monkeypatch.setattr(agent, "ainvoke_tiered", ainvoke_tiered)
+    monkeypatch.setattr(agent, "LOCAL_FAST_PATH", False)
+    return calls
+
+
+@pytest.fixture
+def checkpointed(monkeypatch):
+    """TURN_CHECKPOINTER=memory; returns a function that compiles the graph from the current nodes."""
+    monkeypatch.setattr(agent, "TURN_CHECKPOINTER", "memory")
+
+    def build():
+        monkeypatch.setattr(agent, "turn_checkpointer", agent.create_turn_checkpointer())
+        monkeypatch.setattr(agent, "turn_graph", agent.build_turn_graph(agent.turn_checkpointer))
+    return build
+
+
+def session(session_id="graph-1"):
+    return Session(session_id, {"name": "Sam", "symptoms": ["sore throat", "fever"]})
+
+
+def test_direct_steps_and_graph_record_the_same_turn(llm, checkpointed):
+    direct = session("direct")
+    direct_result = agent.process_turn(direct, "Where does it hurt?")
+    checkpointed()
+    graphed = session("graphed")
+    graph_result = agent.process_turn(graphed, "Where does it hurt?")
+    assert graph_result["reply"] == direct_result["reply"] == "It hurts in my throat."
+    assert graphed.revealed_symptoms == direct.revealed_symptoms == ["sore throat"]
+    assert len(graphed.turns) == len(direct.turns) == 1
+
+
+def test_retried_turn_resumes_without_calling_the_llm_again(llm, checkpointed, monkeypatch):
+    reveal = agent._reveal_node
+    failures = [RuntimeError("worker died")]
+
+    async def flaky_reveal(turn, state):
+        if failures:
+            raise failures.pop()
+        return await reveal(turn, state)
+
+    monkeypatch.setattr(agent, "_reveal_node", flaky_reveal)
+    checkpointed()
+    live = session()
+    with pytest.raises(RuntimeError):
+        agent.process_turn(live, "Where does it hurt?")
+    assert len(llm) == 1 and live.turns == []
+
+    result = agent.process_turn(live, "Where does it hurt?")
+    assert len(llm) == 1
+    assert result["reply"] == "It hurts in my throat."
+    assert live.revealed_symptoms == ["sore throat"]
+
+
+def test_forget_session_drops_its_checkpoints(llm, checkpointed):
+    checkpointed()
+    live = session()
+    agent.process_turn(live, "Where does it hurt?")
+    config = {"configurable": {"thread_id": live.session_id}}
+    assert agent.turn_checkpointer.get_tuple(config) is not None
+    agent.forget_session(live.session_id)
+    assert agent.turn_checkpointer.get_tuple(config) is None
+
+
+def test_unknown_checkpointer_is_refused(monkeypatch):
+    monkeypatch.setattr(agent, "TURN_CHECKPOINTER", "sqlite")
+    with pytest.raises(ValueError):
+        agent.create_turn_checkpointer()